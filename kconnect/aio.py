@@ -0,0 +1,232 @@
+"""
+asyncio execution of a model, for seeds that spend their time waiting on
+external solvers, subprocesses or job queues.
+"""
+import asyncio
+import copy
+import inspect
+
+from kconnect.model import DataContainer, RunnableModel, germinate_traced
+from kconnect.schedule import sweep_stages
+from kconnect.solvers import FixedPointSolver
+
+
+class AsyncRunnableModel(RunnableModel):
+    """
+    A RunnableModel whose run methods are coroutines.
+
+    Seeds with an `async def run` are awaited on the event loop; plain seeds
+    run on `executor` (the loop's default executor if None) through
+    run_in_executor. At most `concurrency` seeds run at once. Results land in
+    the same DataStore/DataStack structure as the synchronous model; a node's
+    new container is appended once its seed has finished.
+
+    evaluate, get, run_events and run_batch are coroutines too. Newton solves
+    and checkpoints are only supported by the synchronous model.
+    """
+
+    def __init__(self, model, model_config, concurrency=4, executor=None, **kwargs):
+        super(AsyncRunnableModel, self).__init__(model, model_config, **kwargs)
+        self._concurrency = concurrency
+        self._executor = executor
+        self._semaphores = {}
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            self._semaphores = {loop: asyncio.Semaphore(self._concurrency)}
+            semaphore = self._semaphores[loop]
+        return semaphore
+
+    async def _germinate(self, node, seed):
+        data_container = DataContainer()
+        if self._cache is not None:
+            key = self._cache.key(node.name, self.get_seed_selection(node), seed)
+            if self._cache.load(key, data_container):
+                return data_container
+
+        raw = seed.seed
+        async with self._semaphore():
+            if inspect.iscoroutinefunction(raw.run):
+                await raw.run(data_container)
+            elif self._hooks:
+                loop = asyncio.get_running_loop()
+                data_container = await loop.run_in_executor(self._executor, germinate_traced, raw, self._hooks,
+                                                            node.name)
+            else:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self._executor, raw.run, data_container)
+
+        if self._cache is not None:
+            self._cache.store(key, data_container)
+        return data_container
+
+    async def _stand_in_or_germinate(self, node, seed):
+        surrogate = node.subsys.surrogate
+        if surrogate is not None:
+            data_container = DataContainer()
+            if self._stand_in(node, seed, data_container):
+                return data_container
+        data_container = await self._germinate(node, seed)
+        if surrogate is not None:
+            surrogate.learn(seed.applied, node.subsys, data_container)
+        return data_container
+
+    async def run(self, name, datastore):
+        node = self._plan[name]
+        inputs = self._inputs(node, datastore) if self._lazy else None
+        fingerprint = None
+        if self._incremental:
+            fingerprint = self._reuse(node, datastore)
+            if fingerprint is None:
+                if self._lazy:
+                    self._record(node, datastore, inputs)
+                return
+        seed = self.prepare(node, datastore)
+        data_container = await self._stand_in_or_germinate(node, seed)
+        seed.release()
+        datastore[node.name].append(data_container)
+        if self._lazy:
+            self._record(node, datastore, inputs)
+        self.stats['executed'] += 1
+        if self._incremental:
+            self._fingerprints[node.index] = (fingerprint, data_container)
+        if self._push:
+            self.publish(node.index, datastore)
+
+    async def run_many(self, names, datastore):
+        """
+        Run independent nodes concurrently. Inputs are all taken from the
+        datastore as it is now, and results are appended in the order of
+        `names`.
+        """
+        nodes = [self._plan[nm] for nm in names]
+        inputs = [self._inputs(node, datastore) if self._lazy else None for node in nodes]
+        fingerprints = [None] * len(nodes)
+        if self._incremental:
+            fingerprints = [self._reuse(node, datastore) for node in nodes]
+            for node, node_inputs, fp in zip(nodes, inputs, fingerprints):
+                if fp is None and self._lazy:
+                    self._record(node, datastore, node_inputs)
+            kept = [n for n, fp in enumerate(fingerprints) if fp is not None]
+            nodes = [nodes[n] for n in kept]
+            inputs = [inputs[n] for n in kept]
+            fingerprints = [fingerprints[n] for n in kept]
+        seeds = [self.prepare(node, datastore) for node in nodes]
+        results = await asyncio.gather(*[self._stand_in_or_germinate(node, seed) for node, seed in zip(nodes, seeds)])
+        for seed in seeds:
+            seed.release()
+        for node, node_inputs, fingerprint, data_container in zip(nodes, inputs, fingerprints, results):
+            datastore[node.name].append(data_container)
+            if self._lazy:
+                self._record(node, datastore, node_inputs)
+            if self._incremental:
+                self._fingerprints[node.index] = (fingerprint, data_container)
+            if self._push:
+                self.publish(node.index, datastore)
+        self.stats['executed'] += len(nodes)
+
+    async def run_batch(self, name, datastores):
+        """
+        Run one node for many design points, one DataStore per point, side by
+        side. Seeds' own run_batch is not used.
+        """
+        await asyncio.gather(*[self.run(name, datastore) for datastore in datastores])
+
+    async def run_events(self, names, datastore, max_runs=None):
+        """
+        As RunnableModel.run_events, one node at a time
+        """
+        ran = []
+        for node in self._events(names, datastore, max_runs):
+            await self.run(node.index, datastore)
+            ran.append(node.name)
+        return ran
+
+    async def evaluate(self, names, datastore, tol=1e-6, max_iter=100, relaxation=None):
+        """
+        As RunnableModel.evaluate, with cyclic blocks converged as by converge
+        """
+        ran = []
+        for block in self._stale_blocks(names, datastore):
+            if block.cyclic:
+                await self.converge(block.names, datastore, tol=tol, max_iter=max_iter, relaxation=relaxation)
+            else:
+                await self.run(block.indices[0], datastore)
+            ran.extend(block.names)
+        return ran
+
+    async def get(self, datastore, subsys_name, getter_name, **kwargs):
+        await self.evaluate([subsys_name], datastore, **kwargs)
+        return self._model.get(datastore, subsys_name, getter_name)
+
+    def newton(self, *args, **kwargs):
+        raise TypeError('Newton solves need a RunnableModel, an AsyncRunnableModel can only converge')
+
+    def resume(self, *args, **kwargs):
+        raise TypeError('Checkpoints need a RunnableModel, an AsyncRunnableModel can\'t resume them')
+
+    async def converge(self, order, datastore, monitors=None, tol=1e-6, max_iter=100, relaxation=None):
+        """
+        As RunnableModel.converge, with the independent stages of each sweep
+        run concurrently
+        """
+        if monitors is None:
+            monitors = self.cycle_ports(order)
+        solver = FixedPointSolver(self, order, monitors, tol=tol, max_iter=max_iter, relaxation=relaxation)
+        stages = sweep_stages(self._plan, order)
+        solver.begin(datastore)
+        try:
+            for _ in range(solver.max_iter):
+                for stage in stages:
+                    await self.run_many(stage, datastore)
+                if solver.update(datastore):
+                    break
+        finally:
+            solver.end()
+        return solver.report
+
+    async def run_schedule(self, datastore, tol=1e-6, max_iter=100, relaxation=None):
+        """
+        Run the whole model, starting each schedule block as soon as the
+        blocks it pulls from are done rather than level by level. Cyclic
+        blocks are converged; returns their ConvergenceReports keyed by the
+        tuple of node names.
+        """
+        schedule = self._plan.schedule
+        block_of = {}
+        for b, block in enumerate(schedule):
+            for i in block.indices:
+                block_of[i] = b
+        upstream = [set() for _ in schedule]
+        for b, block in enumerate(schedule):
+            for i in block.indices:
+                for flow in self._plan[i].dataflows:
+                    if block_of[flow.src_index] != b:
+                        upstream[b].add(block_of[flow.src_index])
+
+        reports = {}
+        tasks = []
+
+        async def run_block(b):
+            if upstream[b]:
+                await asyncio.gather(*[tasks[u] for u in upstream[b]])
+            block = schedule[b]
+            if block.cyclic:
+                # relaxations keep state, and cyclic blocks may be converging side by side
+                reports[block.names] = await self.converge(block.names, datastore, tol=tol, max_iter=max_iter,
+                                                           relaxation=copy.deepcopy(relaxation))
+            else:
+                await self.run(block.indices[0], datastore)
+
+        # the schedule is topologically sorted, so upstream tasks always exist already
+        for b in range(len(schedule)):
+            tasks.append(asyncio.ensure_future(run_block(b)))
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return reports
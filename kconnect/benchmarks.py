@@ -0,0 +1,255 @@
+"""
+Benchmarks of the model execution hot paths on synthetic models.
+
+    python -m kconnect.benchmarks --output results.json
+    python -m kconnect.benchmarks --baseline results.json --threshold 0.2
+
+Results are JSON: per benchmark the best and median time of a few repeats
+and the parameters it ran with. Given a baseline from an earlier run, any
+benchmark whose best time got more than `threshold` slower is reported and
+the exit status is 1.
+"""
+from collections import defaultdict
+import argparse
+import json
+import platform
+import sys
+import time
+
+from kconnect.model import DataContainer, DataStore, GenericSubsys, InputPort, Model, OutputPort
+import kconnect.examples as ex
+
+
+#### Synthetic subsystems ####
+
+class AffineSeed(object):
+    """
+    value = offset + slope * mean(inputs)
+    """
+
+    def __init__(self, slope, offset):
+        self.slope = slope
+        self.offset = offset
+        self.inputs = []
+
+    def run(self, data_container):
+        mean = sum(self.inputs) / len(self.inputs) if self.inputs else 0.
+        data_container['value'].put_obj(self.offset + self.slope * mean)
+
+
+class AffineDispenser(object):
+
+    def __init__(self, slope, offset):
+        self.slope = slope
+        self.offset = offset
+
+    def get_seed(self, nm):
+        return AffineSeed(self.slope, self.offset)
+
+
+class AffineAccessor(object):
+
+    def __init__(self, data_container):
+        self._data_container = data_container
+
+    @property
+    def value(self):
+        return self._data_container['value'].get_obj()
+
+
+def add_input(seed, value):
+    seed.inputs.append(value)
+
+
+def affine(slope=0.5, offset=1.):
+    return GenericSubsys(
+        seed_dispenser=AffineDispenser(slope, offset),
+        accessor=AffineAccessor,
+        input_ports=[InputPort(name='inp', description='Any number of upstream values', type=float, fn=add_input)],
+        output_ports=[OutputPort(name='out', description='The node value', type=float, fn=lambda d: d.value)]
+    )
+
+
+#### Synthetic topologies ####
+
+def chain_edges(n):
+    return [(i, i + 1) for i in range(n - 1)]
+
+
+def fan_edges(n):
+    """
+    One source fanning out to n - 2 nodes that fan back in to one sink
+    """
+    middle = range(1, n - 1)
+    return [(0, i) for i in middle] + [(i, n - 1) for i in middle]
+
+
+def ring_edges(n):
+    """
+    A single strongly connected component of n nodes
+    """
+    return [(i, (i + 1) % n) for i in range(n)]
+
+
+TOPOLOGIES = {'chain': chain_edges, 'fan': fan_edges, 'ring': ring_edges}
+
+
+def node_name(i):
+    return 'N%d' % i
+
+
+def build_synthetic(topology, n):
+    """
+    A Model of n affine nodes connected as `topology` ('chain', 'fan' or 'ring')
+    """
+    model = Model()
+    for i in range(n):
+        model.add_subsystem(node_name(i), affine())
+    for src, dst in TOPOLOGIES[topology](n):
+        model.connect(src='%s.out' % node_name(src), dst='%s.inp' % node_name(dst))
+    return model
+
+
+#### Timing ####
+
+def timed(fn, repeat=5):
+    """
+    Best and median wall time of `repeat` calls of fn()
+    """
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return {'min': times[0], 'median': times[len(times) // 2], 'repeat': repeat}
+
+
+def bench_connect(topology, n):
+    def fn():
+        build_synthetic(topology, n)
+    return fn
+
+
+def bench_run(topology, n, iterations):
+    model = build_synthetic(topology, n)
+
+    def fn():
+        runnable_model = model.configure(defaultdict(lambda: 'default'))
+        datastore = DataStore()
+        if topology == 'ring':
+            runnable_model.converge([node_name(i) for i in range(n)], datastore, tol=0., max_iter=iterations)
+        else:
+            for _ in range(iterations):
+                runnable_model.run_schedule(datastore)
+    return fn
+
+
+def bench_container(n):
+    def fn():
+        data_container = DataContainer()
+        for i in range(n):
+            data_container['item%d' % (i % 16)].put_obj(i)
+            data_container['item%d' % (i % 16)].get_obj()
+    return fn
+
+
+def bench_json(n):
+    obj = {'FLOW': 1.5, 'IPC_PR': 10., 'HPC_PR': 5., 'stations': list(range(20))}
+
+    def fn():
+        data_container = DataContainer()
+        for _ in range(n):
+            data_container['result'].put_json(obj)
+            data_container['result'].get_obj()
+    return fn
+
+
+def bench_engine(n):
+    def fn():
+        for _ in range(n):
+            runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+            ex.execute(runnable_model, DataStore())
+    return fn
+
+
+def suite(scale=1):
+    """
+    (name, params, fn) for every benchmark, sized by `scale`
+    """
+    n = 100 * scale
+    benchmarks = []
+    for topology in sorted(TOPOLOGIES):
+        benchmarks.append(('connect.%s' % topology, {'nodes': n}, bench_connect(topology, n)))
+        benchmarks.append(('run.%s' % topology, {'nodes': n, 'iterations': 10},
+                           bench_run(topology, n, 10)))
+    benchmarks.append(('container.obj', {'accesses': 100 * n}, bench_container(100 * n)))
+    benchmarks.append(('container.json', {'round_trips': 10 * n}, bench_json(10 * n)))
+    benchmarks.append(('engine', {'runs': n // 10}, bench_engine(n // 10)))
+    return benchmarks
+
+
+def run_suite(scale=1, repeat=5, select=None):
+    results = {}
+    for name, params, fn in suite(scale):
+        if select and select not in name:
+            continue
+        result = timed(fn, repeat)
+        result['params'] = params
+        results[name] = result
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': scale,
+        'results': results
+    }
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    (name, baseline time, time, ratio, regressed) for every benchmark in
+    both, comparing best times. Benchmarks run with other parameters than
+    the baseline are left out.
+    """
+    rows = []
+    for name, result in sorted(results['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None or base['params'] != result['params']:
+            continue
+        ratio = result['min'] / base['min']
+        rows.append((name, base['min'], result['min'], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=int, default=1, help='Multiplies the size of every benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--select', help='Only run benchmarks whose name contains this')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Allowed slowdown, as a fraction')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.scale, args.repeat, args.select)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    for name, result in sorted(results['results'].items()):
+        print('%-16s %10.6f s  (median %.6f s)' % (name, result['min'], result['median']))
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressed = False
+    print('')
+    for name, base, new, ratio, slower in compare(results, baseline, args.threshold):
+        print('%-16s %10.6f s -> %10.6f s  x%.2f%s' % (name, base, new, ratio, '  REGRESSION' if slower else ''))
+        regressed = regressed or slower
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Persistent memoization of seed runs.
+"""
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+
+
+def _encode(obj):
+    if isinstance(obj, (bytes, bytearray)):
+        return {'__bytes__': bytes(obj).hex()}
+    if isinstance(obj, (set, frozenset)):
+        return {'__set__': sorted(json.dumps(v, sort_keys=True, default=_encode) for v in obj)}
+    if hasattr(obj, '__dict__'):
+        return {'__type__': '%s.%s' % (type(obj).__module__, type(obj).__qualname__), '__dict__': vars(obj)}
+    raise TypeError
+
+
+def stable_hash(obj):
+    """
+    A hash of a cargo value that is the same from one session to the next.
+    Plain data and simple objects are hashed through sorted JSON, anything
+    else through its pickle.
+    """
+    try:
+        s = json.dumps(obj, sort_keys=True, default=_encode).encode()
+    except (TypeError, ValueError):
+        s = pickle.dumps(obj, protocol=4)
+    return hashlib.sha256(s).hexdigest()
+
+
+class ResultCache(object):
+    """
+    Content-addressed store of DataContainer contents in a sqlite file.
+
+    Entries are keyed on the subsystem name, the seed selection and the hash of
+    every cargo applied to the seed. The least recently used entries are
+    evicted once there are more than `max_entries` or their pickled contents
+    take more than `max_bytes`.
+    """
+
+    def __init__(self, path, max_entries=None, max_bytes=None):
+        self._path = path
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used INTEGER NOT NULL)')
+        self._conn.commit()
+        self._clock = self._conn.execute('SELECT COALESCE(MAX(last_used), 0) FROM entries').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, subsys_name, seed_selection, seed):
+        h = hashlib.sha256()
+        h.update(json.dumps([subsys_name, stable_hash(seed_selection)]).encode())
+        for port_nm, data in seed.applied:
+            h.update(json.dumps([port_nm, stable_hash(data)]).encode())
+        return h.hexdigest()
+
+    def _tick(self):
+        self._clock += 1
+        return self._clock
+
+    def load(self, key, data_container):
+        """
+        Fill the container from the cache. Returns False on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return False
+            self._conn.execute('UPDATE entries SET last_used = ? WHERE key = ?', (self._tick(), key))
+            self._conn.commit()
+            self.hits += 1
+        data_container.update(pickle.loads(row[0]))
+        return True
+
+    def store(self, key, data_container):
+        value = pickle.dumps(data_container.contents(), protocol=4)
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                               (key, value, len(value), self._tick()))
+            self._evict()
+            self._conn.commit()
+
+    def run(self, subsys_name, seed_selection, seed, data_container):
+        """
+        Memoized SeedGerminator.run
+        """
+        key = self.key(subsys_name, seed_selection, seed)
+        if not self.load(key, data_container):
+            seed.run(data_container)
+            self.store(key, data_container)
+
+    def _evict(self):
+        if self._max_entries is not None:
+            self._conn.execute(
+                'DELETE FROM entries WHERE key NOT IN '
+                '(SELECT key FROM entries ORDER BY last_used DESC LIMIT ?)', (self._max_entries,))
+        if self._max_bytes is not None:
+            total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            rows = self._conn.execute('SELECT key, size FROM entries ORDER BY last_used').fetchall()
+            for key, size in rows:
+                if total <= self._max_bytes:
+                    break
+                self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                total -= size
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM entries')
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
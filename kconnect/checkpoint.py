@@ -0,0 +1,152 @@
+"""
+Checkpoint and restart of long model runs. See RunnableModel.resume.
+"""
+import os
+import pickle
+import struct
+import time
+import zlib
+
+from kconnect.storage import EvictedEntry
+
+_HEADER = struct.Struct('<cI')
+_CONTAINER = b'C'
+_POSITION = b'P'
+
+
+class Checkpoint(object):
+    """
+    An append-only file holding a run's DataStore, saved incrementally, and
+    how far the run had got.
+
+    A save appends the containers added to the DataStore since the previous
+    save and then a position record, each a zlib-compressed pickle. A save
+    only counts once its position record is complete, so a run killed while
+    saving resumes from the save before. Opening an existing file reads it
+    back and carries on appending to it; use a new path for a new run.
+
+    Drivers call step() after each solver sweep or schedule block; it saves
+    every `every` steps, or once `interval` seconds have passed if given.
+    """
+
+    def __init__(self, path, every=1, interval=None, level=1):
+        self._every = every
+        self._interval = interval
+        self._level = level
+        self._steps = 0
+        self._last_save = time.monotonic()
+        self._file = open(path, 'a+b')
+        self._index = []
+        self._written = {}
+        self.position = None
+        self._load()
+
+    def _read_frames(self):
+        f = self._file
+        f.seek(0)
+        while True:
+            offset = f.tell()
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            kind, size = _HEADER.unpack(header)
+            blob = f.read(size)
+            if len(blob) < size or kind not in (_CONTAINER, _POSITION):
+                return
+            yield kind, offset + _HEADER.size, blob
+
+    def _load(self):
+        uncommitted = []
+        end = 0
+        for kind, offset, blob in self._read_frames():
+            if kind == _CONTAINER:
+                uncommitted.append((offset, len(blob)))
+                continue
+            try:
+                written, names, self.position = pickle.loads(zlib.decompress(blob))
+            except (zlib.error, pickle.UnpicklingError, EOFError):
+                break
+            # the position record names the containers of its save
+            self._index.extend((name, offset, size) for name, (offset, size) in zip(names, uncommitted))
+            self._written.update(written)
+            uncommitted = []
+            end = offset + len(blob)
+        # drop a torn or unfinished save
+        self._file.truncate(end)
+
+    def _append(self, kind, obj):
+        return self._append_pickled(kind, pickle.dumps(obj, protocol=4))
+
+    def _append_pickled(self, kind, data):
+        blob = zlib.compress(data, self._level)
+        f = self._file
+        f.seek(0, 2)
+        f.write(_HEADER.pack(kind, len(blob)))
+        offset = f.tell()
+        f.write(blob)
+        return offset, len(blob)
+
+    def save(self, datastore, position):
+        """
+        Append what is new in the datastore and the position
+        """
+        new = []
+        written = {}
+        for name in list(datastore.keys()):
+            stack = datastore[name]
+            for idx in range(self._written.get(name, 0), len(stack)):
+                try:
+                    data_container = stack[idx]
+                except EvictedEntry:
+                    # gone before it could be saved
+                    continue
+                offset, size = self._append(_CONTAINER, (name, data_container))
+                new.append((name, offset, size))
+            written[name] = len(stack)
+        record = pickle.dumps((written, [name for name, _, _ in new], position), protocol=4)
+        self._append_pickled(_POSITION, record)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        self._index.extend(new)
+        self._written.update(written)
+        # a copy: the run goes on changing the objects in the position
+        self.position = pickle.loads(record)[2]
+        self._steps = 0
+        self._last_save = time.monotonic()
+
+    def step(self, datastore, position_fn):
+        """
+        Count a step of the run and save if one is due. `position_fn` is
+        only called to build the position when saving.
+        """
+        self._steps += 1
+        if self._steps >= self._every or \
+                (self._interval is not None and time.monotonic() - self._last_save >= self._interval):
+            self.save(datastore, position_fn())
+
+    def restore(self, datastore):
+        """
+        Append the saved containers to the (empty) datastore's stacks, in
+        the order they were saved. Returns the last saved position.
+        """
+        f = self._file
+        for name, offset, size in self._index:
+            f.seek(offset)
+            name, data_container = pickle.loads(zlib.decompress(f.read(size)))
+            datastore[name].append(data_container)
+        # entries evicted before they were saved leave the restored stacks shorter
+        self._written = {name: len(datastore[name]) for name in self._written}
+        return self.position
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
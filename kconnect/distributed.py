@@ -0,0 +1,432 @@
+"""
+Running seeds in worker processes, on this machine or across a cluster.
+
+A worker holds its own copy of the model, built by the same code as the
+coordinator's, and runs seeds by name: it is sent the subsystem name, the
+seed selection and the applied cargo (SeedGerminator.applied), rebuilds and
+runs the seed, and streams the items of the new container back.
+
+Messages are pickles over multiprocessing.connection Connections, so only
+connect workers and coordinators that trust each other. TCP connections are
+authenticated with `authkey`, which workers insist on for any TCP address.
+To start a worker:
+
+    KCONNECT_AUTHKEY=... python -m kconnect.distributed 0.0.0.0:6000 kconnect.examples:build_model
+"""
+from concurrent.futures import Future
+from multiprocessing.connection import AuthenticationError, Client, Listener, answer_challenge, deliver_challenge
+import argparse
+import importlib
+import itertools
+import multiprocessing
+import os
+import pickle
+import socket
+import threading
+import traceback
+
+from kconnect.model import DataContainer, RunnableModel
+
+
+class RemoteError(RuntimeError):
+    """
+    A seed failed on a worker; the message is the worker's traceback
+    """
+
+
+def run_task(model, subsys_name, selection, applied):
+    seed = model.get_subsystem(subsys_name).get_seed(selection)
+    for port_nm, cargo in applied:
+        seed.apply(port_nm, cargo)
+    data_container = DataContainer()
+    seed.run(data_container)
+    return data_container
+
+
+def worker_loop(conn, model):
+    """
+    Serve one coordinator connection until it says stop or goes away
+    """
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            return
+        if msg[0] == 'stop':
+            return
+        _, task_id, subsys_name, selection, applied = msg
+        try:
+            data_container = run_task(model, subsys_name, selection, applied)
+        except Exception:
+            conn.send(('error', task_id, traceback.format_exc()))
+            continue
+        for key, value in data_container.contents().items():
+            conn.send(('item', task_id, key, value))
+        conn.send(('done', task_id))
+
+
+def _local_worker(conn, model_factory):
+    with conn:
+        worker_loop(conn, model_factory())
+
+
+def _hang_up(conn):
+    """
+    Shut the socket under `conn` down, waking a thread blocked reading it
+    """
+    try:
+        sock = socket.socket(fileno=os.dup(conn.fileno()))
+    except OSError:
+        return
+    with sock:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class WorkerServer(object):
+    """
+    A worker listening for coordinators on `address`, (host, port) with port
+    0 for any free one. Each connection is authenticated and served on its
+    own thread; a client that hasn't got through the handshake within
+    `handshake_timeout` seconds is hung up on.
+
+    Anyone who can connect can make the worker unpickle what they send, so
+    TCP addresses need an `authkey`. Only Unix socket and pipe addresses,
+    guarded by file permissions, can do without.
+    """
+
+    def __init__(self, model, address=('localhost', 0), authkey=None, handshake_timeout=10.):
+        if authkey is None and isinstance(address, tuple):
+            raise ValueError('Refusing to listen on %s without an authkey' % (address,))
+        self._model = model
+        self._authkey = authkey
+        self._handshake_timeout = handshake_timeout
+        # the handshake is done on the connection's thread, not in accept()
+        self._listener = Listener(address)
+        self._closed = False
+
+    @property
+    def address(self):
+        return self._listener.address
+
+    def serve_forever(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                return
+            if self._closed:
+                conn.close()
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _handshake(self, conn):
+        timer = threading.Timer(self._handshake_timeout, _hang_up, (conn,))
+        timer.start()
+        try:
+            deliver_challenge(conn, self._authkey)
+            answer_challenge(conn, self._authkey)
+        finally:
+            timer.cancel()
+
+    def _serve(self, conn):
+        with conn:
+            if self._authkey is not None:
+                try:
+                    self._handshake(conn)
+                except (AuthenticationError, EOFError, OSError):
+                    return
+            worker_loop(conn, self._model)
+
+    def close(self):
+        self._closed = True
+        # wake up accept()
+        try:
+            Client(self.address).close()
+        except OSError:
+            pass
+        self._listener.close()
+
+
+class Transport(object):
+    """
+    Opens a coordinator's connections to its workers
+    """
+
+    def connect(self):
+        """
+        One Connection per worker
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LocalTransport(Transport):
+    """
+    Worker processes on this machine connected by pipes, each building its
+    model with `model_factory`. For testing, or for the cores of one box.
+    """
+
+    def __init__(self, model_factory, workers=2):
+        self._model_factory = model_factory
+        self._workers = workers
+        self.processes = []
+
+    def connect(self):
+        conns = []
+        for _ in range(self._workers):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_local_worker, args=(child, self._model_factory), daemon=True)
+            process.start()
+            child.close()
+            self.processes.append(process)
+            conns.append(parent)
+        return conns
+
+    def close(self):
+        for process in self.processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+
+class TcpTransport(Transport):
+    """
+    Workers started with WorkerServer (or `python -m kconnect.distributed`)
+    at a list of (host, port) addresses
+    """
+
+    def __init__(self, addresses, authkey=None):
+        self._addresses = [tuple(a) for a in addresses]
+        self._authkey = authkey
+
+    def connect(self):
+        return [Client(address, authkey=self._authkey) for address in self._addresses]
+
+
+class _Worker(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.tasks = set()
+        self.alive = True
+
+
+class _Task(object):
+
+    def __init__(self, task_id, request):
+        self.id = task_id
+        self.request = request
+        self.future = Future()
+        self.attempts = 0
+        self.tried = set()
+        self.worker = None
+        self.items = {}
+
+
+class Coordinator(object):
+    """
+    Hands seed runs out to workers and collects their results.
+
+    A run goes to the live worker with the fewest runs outstanding,
+    preferring workers it hasn't failed on. A run whose seed raises, or
+    whose worker goes away, is tried again up to `max_attempts` times in all
+    before its future gets the RemoteError (or ConnectionError).
+    """
+
+    def __init__(self, transport, max_attempts=3):
+        self._transport = transport
+        self._max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._tasks = {}
+        self._closed = False
+        self._workers = [_Worker(conn) for conn in transport.connect()]
+        self._threads = [threading.Thread(target=self._listen, args=(worker,), daemon=True)
+                         for worker in self._workers]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, subsys_name, selection, applied):
+        """
+        Run a seed remotely. Returns a Future of the new container's contents.
+        """
+        task = _Task(next(self._ids), (subsys_name, selection, list(applied)))
+        with self._lock:
+            self._tasks[task.id] = task
+        self._dispatch(task)
+        return task.future
+
+    def load(self):
+        """
+        The number of runs outstanding per worker, None for lost workers
+        """
+        with self._lock:
+            return [len(w.tasks) if w.alive else None for w in self._workers]
+
+    def _dispatch(self, task):
+        with self._lock:
+            alive = [w for w in self._workers if w.alive]
+            worker = None
+            if alive and not self._closed:
+                untried = [w for w in alive if w not in task.tried] or alive
+                worker = min(untried, key=lambda w: len(w.tasks))
+                task.attempts += 1
+                task.tried.add(worker)
+                task.worker = worker
+                task.items = {}
+                worker.tasks.add(task.id)
+        if worker is None:
+            self._finish(task, error=ConnectionError('No workers left'))
+            return
+        try:
+            with worker.send_lock:
+                worker.conn.send(('run', task.id) + task.request)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            with self._lock:
+                worker.tasks.discard(task.id)
+            self._finish(task, error=e)
+        except (OSError, EOFError):
+            self._lost(worker)
+
+    def _listen(self, worker):
+        while True:
+            try:
+                msg = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            kind, task_id = msg[0], msg[1]
+            with self._lock:
+                task = self._tasks.get(task_id)
+                if task is None or task.worker is not worker:
+                    continue
+                if kind != 'item':
+                    worker.tasks.discard(task_id)
+            if kind == 'item':
+                task.items[msg[2]] = msg[3]
+            elif kind == 'done':
+                self._finish(task, result=task.items)
+            else:
+                self._retry(task, RemoteError(msg[2]))
+        self._lost(worker)
+
+    def _lost(self, worker):
+        with self._lock:
+            if not worker.alive:
+                return
+            worker.alive = False
+            orphans = [self._tasks[task_id] for task_id in worker.tasks if task_id in self._tasks]
+            worker.tasks.clear()
+        for task in orphans:
+            self._retry(task, ConnectionError('Lost the worker running %s' % task.request[0]))
+
+    def _retry(self, task, error):
+        if task.attempts < self._max_attempts and not self._closed:
+            self._dispatch(task)
+        else:
+            self._finish(task, error=error)
+
+    def _finish(self, task, result=None, error=None):
+        with self._lock:
+            if self._tasks.pop(task.id, None) is None:
+                return
+        if error is not None:
+            task.future.set_exception(error)
+        else:
+            task.future.set_result(result)
+
+    def close(self):
+        self._closed = True
+        for worker in self._workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(('stop',))
+            except (OSError, EOFError):
+                pass
+        # the workers hang up once they have stopped
+        for thread in self._threads:
+            thread.join(5)
+        for worker in self._workers:
+            worker.conn.close()
+        for task in list(self._tasks.values()):
+            self._finish(task, error=ConnectionError('Coordinator closed'))
+        self._transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DistributedRunnableModel(RunnableModel):
+    """
+    A RunnableModel that runs the seeds of the `remote` subsystems (all of
+    them if None) on a Coordinator's workers. run_many sends all its remote
+    seeds out at once and runs the others on its executor meanwhile.
+    """
+
+    def __init__(self, model, model_config, coordinator, remote=None, **kwargs):
+        super(DistributedRunnableModel, self).__init__(model, model_config, **kwargs)
+        self._coordinator = coordinator
+        self._remote = set(remote) if remote is not None else None
+
+    def is_remote(self, node):
+        return self._remote is None or node.name in self._remote
+
+    def _submit(self, node, seed):
+        return self._coordinator.submit(node.name, self.get_seed_selection(node), seed.applied)
+
+    def _germinate_into(self, node, seed, data_container):
+        if not self.is_remote(node):
+            return super(DistributedRunnableModel, self)._germinate_into(node, seed, data_container)
+        key = None
+        if self._cache is not None:
+            key = self._cache.key(node.name, self.get_seed_selection(node), seed)
+            if self._cache.load(key, data_container):
+                return
+        data_container.update(self._submit(node, seed).result())
+        if key is not None:
+            self._cache.store(key, data_container)
+
+    def germinate_many(self, nodes, seeds, pool):
+        futures = {n: self._submit(node, seed) for n, (node, seed) in enumerate(zip(nodes, seeds))
+                   if self.is_remote(node)}
+        local = [n for n in range(len(nodes)) if n not in futures]
+        results = [None] * len(nodes)
+        germinated = super(DistributedRunnableModel, self).germinate_many(
+            [nodes[n] for n in local], [seeds[n] for n in local], pool)
+        for n, data_container in zip(local, germinated):
+            results[n] = data_container
+        for n, future in futures.items():
+            results[n] = DataContainer()
+            results[n].update(future.result())
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a kconnect worker')
+    parser.add_argument('address', help='host:port to listen on')
+    parser.add_argument('factory', help='module:function that builds the Model')
+    parser.add_argument('--authkey', default=os.environ.get('KCONNECT_AUTHKEY'),
+                        help='Shared secret, KCONNECT_AUTHKEY by default')
+    args = parser.parse_args(argv)
+    if not args.authkey:
+        parser.error('a worker needs an authkey: pass --authkey or set KCONNECT_AUTHKEY')
+
+    host, port = args.address.rsplit(':', 1)
+    module_nm, factory_nm = args.factory.split(':')
+    model = getattr(importlib.import_module(module_nm), factory_nm)()
+    server = WorkerServer(model, (host, int(port)), args.authkey.encode())
+    print('Serving %s on %s:%d' % ((args.factory,) + server.address))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,11 @@
 from kconnect.model import Model, InputPort, OutputPort, GenericSubsys
 import math
 
+try:
+    import numpy as np
+except ImportError:  # only needed for the batched compressor seed
+    np = None
+
 
 #### Data models #####
 
@@ -19,6 +24,11 @@ def set_cmp_perf(obj, data):
     obj._inputs = data
 
 
+def set_cmp_perf_batch(obj, data):
+    assert all(isinstance(d, CompressorPerfInputs) for d in data)
+    obj._inputs = data
+
+
 def set_perf_ipc_bid(obj, data):
     obj.data['IPC_ETA'] = data
 
@@ -41,7 +51,7 @@ class CmpAccessor(object):
 
     @property
     def eta(self):
-        return self._datastore['result'].get_json()['eta']
+        return self._datastore['result'].get_obj()['eta']
 
 
 def CompIPC():
@@ -53,13 +63,15 @@ def CompIPC():
                 name='set_perf_data',
                 description='Set the performance requirements for the compressor',
                 type=CompressorPerfInputs,
-                fn=set_cmp_perf
+                fn=set_cmp_perf,
+                batch_fn=set_cmp_perf_batch if np is not None else None
             ),
             InputPort(
                 name='set_duct_rads',
                 description='Duct radius that this compressor needs to mate on to',
                 type=DuctInputs,
-                fn=lambda obj, data: None
+                fn=lambda obj, data: None,
+                batch_fn=lambda obj, data: None
             )
         ],
         output_ports=[
@@ -80,16 +92,36 @@ class CompressorSeed(object):
     def __init__(self):
         self._inputs = None
 
-    def run(self, datastore):
-        flow = self._inputs.flow
+    @staticmethod
+    def eta(flow, exp=math.exp):
         eta_min = 0.9
         eta_max = 0.95
         tau = 2.
-        eta = eta_min + (eta_max - eta_min)*(1 - math.exp(-tau * flow))
-        datastore['result'].put_json({'eta': eta, 'flow': flow})
+        return eta_min + (eta_max - eta_min)*(1 - exp(-tau * flow))
+
+    def run(self, datastore):
+        flow = self._inputs.flow
+        eta = self.eta(flow)
+        datastore['result'].put_obj({'eta': eta, 'flow': flow})
+
+    def run_batch(self, datastores):
+        flow = np.array([inputs.flow for inputs in self._inputs])
+        eta = self.eta(flow, exp=np.exp)
+        for datastore, e, f in zip(datastores, eta.tolist(), flow.tolist()):
+            datastore['result'].put_obj({'eta': e, 'flow': f})
 
 
-class Corrections(object): ...
+class Corrections(object):
+    """
+    Corrections applied to cargo on its way from one subsystem to another,
+    e.g. to calibrate a component bid against test data
+    """
+
+    def __init__(self, hpc_eta_factor=1.0):
+        self.hpc_eta_factor = hpc_eta_factor
+
+    def hpc_corrections(self, eta):
+        return eta * self.hpc_eta_factor
 
 
 class PerfSeedDispenser(object):
@@ -100,7 +132,7 @@ class PerfSeedDispenser(object):
 class PerfAccessor(object):
     def __init__(self, datastore=None):
         self._datastore = datastore
-        self.data = datastore['result'].get_json()
+        self.data = datastore['result'].get_obj()
 
     @property
     def hpc_data(self):
@@ -155,7 +187,7 @@ class PerfSeed(object):
     def run(self, datastore):
         # zero physics here - just a calculation
         flow = 5. * (1 - self.data['HPC_ETA'] * self.data['IPC_ETA'])
-        datastore['result'].put_json({
+        datastore['result'].put_obj({
             'HPC_PR': 5.0,
             'IPC_PR': 10.0,
             'FLOW': flow
@@ -169,7 +201,7 @@ def build_model():
     model.add_subsystem('EngineCycle', PerfModel())
     model.add_subsystem('IPC', CompIPC())
     model.add_subsystem('HPC', CompHPC())
-    #model.add_subsystem('Corrections', Corrections())
+    model.add_transform('Corrections', Corrections())
 
     # Node connectivity (data flows)
     model.connect(src='EngineCycle.get_ipc_data', dst='IPC.set_perf_data')
@@ -183,9 +215,9 @@ def build_model():
 def execute(model, datastore):
     #model.run('Corrections', datastore)
 
-    converged = False
-    while not converged:
-        model.run('EngineCycle', datastore)
-        model.run('IPC', datastore)
-        model.run('HPC', datastore)
-        converged = model.check_convergence('EngineCycle')
+    return model.converge(
+        order=['EngineCycle', 'IPC', 'HPC'],
+        datastore=datastore,
+        monitors=['IPC.get_perf_bid', 'HPC.get_perf_bid'],
+        tol=1e-10
+    )
@@ -0,0 +1,297 @@
+"""
+Streaming DataStore histories out to files: one flat row per DataStack
+entry, written as NDJSON or CSV a chunk at a time, or as columns through
+kconnect.storage.ColumnarWriter.
+
+Rows are dicts with the entry's 'iteration' and one 'item:path' key per
+field, paths into the item's object joined with dots as in the columnar
+format: {'iteration': 3, 'result:FLOW': 0.62, 'result:eta.0': 0.9}.
+Items that aren't JSON (buffers, text that doesn't parse) are left out.
+
+Export a finished or running store with write_ndjson/write_csv, or give
+a DataStore an NdjsonWriter/CsvWriter backend to have each entry written
+as soon as it is complete.
+"""
+from urllib.parse import quote
+import csv
+import itertools
+import json
+import numbers
+import os
+import threading
+
+from kconnect.model import DataContainer
+from kconnect.storage import Backend, ColumnarWriter, EvictedEntry
+
+ITERATION = 'iteration'
+
+
+def _leaves(value, prefix):
+    if value is None or isinstance(value, (bool, numbers.Number, str)):
+        yield prefix, value
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            for leaf in _leaves(v, '%s.%s' % (prefix, k) if prefix else str(k)):
+                yield leaf
+    elif isinstance(value, (list, tuple)):
+        for k, v in enumerate(value):
+            for leaf in _leaves(v, '%s.%d' % (prefix, k) if prefix else str(k)):
+                yield leaf
+    elif hasattr(value, 'tolist') and not isinstance(value, (bytes, bytearray, memoryview)):
+        # numpy arrays and scalars
+        for leaf in _leaves(value.tolist(), prefix):
+            yield leaf
+
+
+def _descend(obj, path):
+    for part in path.split('.'):
+        if isinstance(obj, dict):
+            obj = obj[part]
+        elif isinstance(obj, (list, tuple)):
+            obj = obj[int(part)]
+        else:
+            raise KeyError(path)
+    return obj
+
+
+def parse_fields(fields):
+    """
+    ['result', 'perf:eta'] -> {'result': [''], 'perf': ['eta']}: whole items
+    or the fields under a path into an item
+    """
+    if fields is None:
+        return None
+    selection = {}
+    for field in fields:
+        item, _, path = field.partition(':')
+        selection.setdefault(item, []).append(path)
+    return selection
+
+
+def flatten_entry(data_container, selection=None):
+    """
+    The fields of one container as a flat dict, all of them or those in a
+    parse_fields selection. Selected fields the container lacks are left out.
+    """
+    row = {}
+    items = data_container.keys() if selection is None else [i for i in selection if i in data_container.keys()]
+    for item in items:
+        try:
+            obj = data_container[item].get_obj()
+        except (ValueError, TypeError):
+            continue
+        for path in selection[item] if selection is not None else ['']:
+            try:
+                value = _descend(obj, path) if path else obj
+            except (KeyError, IndexError, ValueError):
+                continue
+            for leaf, v in _leaves(value, path):
+                row['%s:%s' % (item, leaf)] = v
+    return row
+
+
+def entries(stack, start=0, stop=None):
+    """
+    (index, container) for the stack's entries from `start`, skipping any
+    the retention policy has discarded. Entries are read one at a time, so
+    spilled history is never all loaded at once.
+    """
+    stop = len(stack) if stop is None else min(stop, len(stack))
+    for idx in range(start, stop):
+        try:
+            yield idx, stack[idx]
+        except EvictedEntry:
+            continue
+
+
+def rows(stack, fields=None, start=0, stop=None):
+    """
+    Flat rows for the entries of a DataStack (see the module docstring)
+    """
+    selection = parse_fields(fields)
+    for idx, data_container in entries(stack, start, stop):
+        row = {ITERATION: idx}
+        row.update(flatten_entry(data_container, selection))
+        yield row
+
+
+def chunked(iterable, size):
+    """
+    Lists of up to `size` items at a time
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _path(directory, name, ext):
+    return os.path.join(directory, '%s.%s' % (quote(name, safe=''), ext))
+
+
+def _names(datastore, names):
+    return list(datastore.keys()) if names is None else list(names)
+
+
+def write_ndjson(datastore, directory, names=None, fields=None, chunk_size=1000, start=None, complete_only=False):
+    """
+    Append each subsystem's history to `directory/<name>.ndjson`, one JSON
+    object per line, from entry `start[name]` on (0 by default). With
+    complete_only the latest entries, which a running model may still be
+    writing, are held back.
+
+    Returns where each subsystem got to: pass it back as `start` to carry
+    on from there later, e.g. periodically while the model runs.
+    """
+    os.makedirs(directory, exist_ok=True)
+    start = start or {}
+    written = dict(start)
+    for name in _names(datastore, names):
+        stack = datastore[name]
+        begin = start.get(name, 0)
+        stop = max(begin, len(stack) - 1 if complete_only else len(stack))
+        with open(_path(directory, name, 'ndjson'), 'a') as f:
+            for chunk in chunked(rows(stack, fields, begin, stop), chunk_size):
+                f.writelines(json.dumps(row) + '\n' for row in chunk)
+        written[name] = stop
+    return written
+
+
+def write_csv(datastore, directory, names=None, fields=None, chunk_size=1000):
+    """
+    Write each subsystem's history to `directory/<name>.csv`. The columns
+    are those of the first chunk of rows; fields that first turn up later
+    are dropped, so name them in `fields` if entries differ. Missing fields
+    are empty cells.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name in _names(datastore, names):
+        with open(_path(directory, name, 'csv'), 'w', newline='') as f:
+            writer = None
+            for chunk in chunked(rows(datastore[name], fields), chunk_size):
+                if writer is None:
+                    writer = csv.DictWriter(f, _columns(chunk), extrasaction='ignore')
+                    writer.writeheader()
+                writer.writerows(chunk)
+
+
+def write_columnar(datastore, directory, names=None):
+    """
+    Write each subsystem's history as ColumnarWriter columns, numeric fields
+    only, for reading back with kconnect.storage.ColumnarDataStore.
+    Discarded entries become rows of NaN so the row numbers still match.
+    """
+    writer = ColumnarWriter(directory)
+    try:
+        for name in _names(datastore, names):
+            stack = datastore[name]
+            for idx in range(len(stack)):
+                try:
+                    data_container = stack[idx]
+                except EvictedEntry:
+                    data_container = DataContainer()
+                writer.record(name, idx, data_container)
+    finally:
+        writer.close()
+
+
+def _columns(chunk):
+    columns = [ITERATION]
+    seen = set(columns)
+    for row in chunk:
+        for key in row:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return columns
+
+
+class _StreamingWriter(Backend):
+    """
+    A DataStore backend that writes one file per subsystem under
+    `directory` as entries are completed, buffering `chunk_size` rows
+    """
+
+    ext = None
+
+    def __init__(self, directory, fields=None, chunk_size=100):
+        self._directory = directory
+        self._selection = parse_fields(fields)
+        self._chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._files = {}
+        self._buffers = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, name, idx, data_container):
+        row = {ITERATION: idx}
+        row.update(flatten_entry(data_container, self._selection))
+        with self._lock:
+            buffer = self._buffers.setdefault(name, [])
+            buffer.append(row)
+            if len(buffer) >= self._chunk_size:
+                self._write(name, buffer)
+                # so readers can follow the file
+                self._files[name].flush()
+                self._buffers[name] = []
+
+    def _file(self, name):
+        f = self._files.get(name)
+        if f is None:
+            f = self._files[name] = open(_path(self._directory, name, self.ext), 'w', newline='')
+        return f
+
+    def _write(self, name, chunk):
+        raise NotImplementedError
+
+    def flush(self):
+        with self._lock:
+            for name, buffer in self._buffers.items():
+                if buffer:
+                    self._write(name, buffer)
+            self._buffers = {}
+            for f in self._files.values():
+                f.flush()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files = {}
+
+
+class NdjsonWriter(_StreamingWriter):
+    """
+    Streams each subsystem's history to `directory/<name>.ndjson` while the
+    model runs:
+
+        datastore = DataStore(backend=NdjsonWriter('out'))
+    """
+
+    ext = 'ndjson'
+
+    def _write(self, name, chunk):
+        self._file(name).writelines(json.dumps(row) + '\n' for row in chunk)
+
+
+class CsvWriter(_StreamingWriter):
+    """
+    Streams each subsystem's history to `directory/<name>.csv` while the
+    model runs. The columns are fixed by the first chunk, as for write_csv.
+    """
+
+    ext = 'csv'
+
+    def __init__(self, directory, fields=None, chunk_size=100):
+        super(CsvWriter, self).__init__(directory, fields, chunk_size)
+        self._writers = {}
+
+    def _write(self, name, chunk):
+        writer = self._writers.get(name)
+        if writer is None:
+            writer = self._writers[name] = csv.DictWriter(self._file(name), _columns(chunk), extrasaction='ignore')
+            writer.writeheader()
+        writer.writerows(chunk)
@@ -1,23 +1,118 @@
 """
 Example of building an executable design/analysis model.
 """
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+import bisect
+import copy
+import hashlib
 import io
 import json
+import weakref
+
+from kconnect.profiling import Span, payload_size
+from kconnect.schedule import build_schedule, sweep_stages
+from kconnect.solvers import FixedPointSolver, NewtonSolver
+from kconnect.storage import EvictedEntry
+
+_UNRESOLVED = object()
+
+
+def make_executor(kind, max_workers=None):
+    """
+    'thread' suits seeds that release the GIL or shell out to external solvers,
+    'process' suits pure-Python seeds. Process workers need picklable seeds.
+    """
+    if kind == 'thread':
+        return ThreadPoolExecutor(max_workers)
+    if kind == 'process':
+        return ProcessPoolExecutor(max_workers)
+    raise ValueError('Unknown executor kind: %s' % kind)
+
+
+@contextmanager
+def executor_scope(executor):
+    """
+    Use an Executor as given, or make (and clean up) one from its kind
+    """
+    if executor is None or isinstance(executor, Executor):
+        yield executor
+    else:
+        with make_executor(executor) as pool:
+            yield pool
+
+
+def germinate(seed):
+    """
+    Run a bare seed into a new DataContainer. Module-level so process pools can pickle it.
+    """
+    data_container = DataContainer()
+    seed.run(data_container)
+    return data_container
+
+
+def germinate_traced(seed, hooks, name):
+    """
+    germinate, reported to the hooks as a 'seed' span of node `name`
+    """
+    data_container = DataContainer()
+    with Span(hooks, 'seed', name) as span:
+        seed.run(data_container)
+        span.nbytes = data_container.nbytes()
+    return data_container
 
 
 class SeedGerminator(object):
-    def __init__(self, seed, api):
+    def __init__(self, seed, api, pool=None, pool_key=None):
         self._seed = seed
         self._api = api
+        self._applied = []
+        self._pool = pool
+        self._pool_key = pool_key
 
     def apply(self, nm, data):
         input_port = self._api[nm]
+        self.apply_port(input_port, data)
+
+    def apply_port(self, input_port, data):
         input_port.fn(self._seed, data)
+        self._applied.append((input_port.name, data))
+
+    def apply_batch(self, input_port, cargos):
+        input_port.batch_fn(self._seed, cargos)
+
+    def supports_batch(self, input_ports):
+        if not hasattr(self._seed, 'run_batch'):
+            return False
+        return all(ip.batch_fn is not None for ip in input_ports)
+
+    def run_batch(self, data_containers):
+        self._seed.run_batch(data_containers)
+
+    @property
+    def applied(self):
+        """
+        (port name, cargo) pairs in the order they were applied
+        """
+        return self._applied
+
+    @property
+    def seed(self):
+        return self._seed
 
     def run(self, datastore):
         self._seed.run(datastore)
 
+    def release(self):
+        """
+        Done with the seed: hand it back to the pool it came from, if any
+        """
+        if self._pool is not None:
+            self._pool.release(self._pool_key, self._seed)
+            self._pool = None
+        self._applied = []
+
 
 class GenericSubsys(object):
 
@@ -31,6 +126,7 @@ class GenericSubsys(object):
         self._input_ports = {}
         self._output_ports = {}
         self._accessor = accessor
+        self._surrogate = None
 
         for ip in input_ports:
             assert ip.name not in self._input_ports
@@ -40,9 +136,17 @@ class GenericSubsys(object):
             assert op.name not in self._output_ports
             self._output_ports[op.name] = op
 
-    def get_seed(self, nm: str) -> SeedGerminator:
-        seed = self._seed_dispenser.get_seed(nm)
-        return SeedGerminator(seed, self._input_ports)
+    def get_seed(self, nm: str, pool=None, name=None) -> SeedGerminator:
+        """
+        A seed for selection `nm`. With a kconnect.pool.SeedPool the seed is
+        reused from earlier runs when there is one, keyed on (name, nm).
+        """
+        if pool is None:
+            seed = self._seed_dispenser.get_seed(nm)
+            return SeedGerminator(seed, self._input_ports)
+        key = (name, nm)
+        seed = pool.acquire(key, lambda: self._seed_dispenser.get_seed(nm))
+        return SeedGerminator(seed, self._input_ports, pool, key)
 
     def add_input_port(self, in_port):
         assert in_port not in self._input_ports
@@ -56,8 +160,66 @@ class GenericSubsys(object):
             raise AttributeError(msg)
 
     def get(self, nm, datastore):
-        data = self._accessor(datastore)
-        return self._output_ports[nm](data)
+        return self.read_port(self._output_ports[nm], datastore)
+
+    def read_port(self, output_port, datastore, hooks=None, name=None):
+        """
+        The value of `output_port` off a container. Given `hooks` (see
+        kconnect.profiling) the accessor and port calls are reported to them,
+        under the subsystem name `name`.
+        """
+        if self._surrogate is not None:
+            predicted = self._surrogate.answer(datastore)
+            if predicted is not None:
+                return predicted[output_port.name]
+        if hooks:
+            return self._read_port_traced(output_port, datastore, hooks, name)
+        data = self.access(datastore)
+        return output_port(data)
+
+    def _read_port_traced(self, output_port, datastore, hooks, name):
+        with Span(hooks, 'accessor', name) as span:
+            data = self.access(datastore)
+            span.nbytes = payload_size(data)
+        with Span(hooks, 'output_port', '%s.%s' % (name, output_port.name)) as span:
+            cargo = output_port(data)
+            span.nbytes = payload_size(cargo)
+        return cargo
+
+    def access(self, data_container):
+        """
+        The accessor over a container. It is kept on the container, per
+        subsystem, for as long as the container hasn't been written to, so
+        several ports read off the same result cost a single accessor
+        construction whatever else is read in between. Threads reading the
+        same container at once may each build one; either is kept.
+        """
+        try:
+            accessed = data_container._accessed
+        except AttributeError:
+            return self._accessor(data_container)
+        version = data_container._version
+        if accessed is None:
+            accessed = data_container._accessed = {}
+        else:
+            kept = accessed.get(self)
+            if kept is not None and kept[0] == version:
+                return kept[1]
+        data = self._accessor(data_container)
+        accessed[self] = (version, data)
+        return data
+
+    @property
+    def surrogate(self):
+        return self._surrogate
+
+    def set_surrogate(self, surrogate):
+        """
+        Let a kconnect.surrogate.Surrogate stand in for the seed when it can
+        (None to stop). Containers it fills are read through it, not the
+        accessor.
+        """
+        self._surrogate = surrogate
 
     def list_output_ports(self):
         return self._output_ports.keys()
@@ -74,6 +236,7 @@ class GenericSubsys(object):
 
 
 class OutputPort(object):
+    __slots__ = ('_name', '_description', '_type', '_fn')
 
     def __init__(self, name, description, type, fn):
         self._name = name
@@ -98,12 +261,19 @@ class OutputPort(object):
 
 
 class InputPort(object):
+    """
+    `fn(seed, cargo)` applies one cargo value to a seed. A port can also take
+    `batch_fn(seed, cargos)`, which applies a list of cargo values, one per
+    design point, to a seed that implements `run_batch`.
+    """
+    __slots__ = ('_name', '_description', '_type', '_fn', '_batch_fn')
 
-    def __init__(self, name, description, type, fn):
+    def __init__(self, name, description, type, fn, batch_fn=None):
         self._name = name
         self._description = description
         self._type = type
         self._fn = fn
+        self._batch_fn = batch_fn
 
     @property
     def name(self):
@@ -121,6 +291,10 @@ class InputPort(object):
     def fn(self):
         return self._fn
 
+    @property
+    def batch_fn(self):
+        return self._batch_fn
+
 
 class Model(object):
     """
@@ -130,18 +304,51 @@ class Model(object):
     def __init__(self):
         self._subsystems = {}
         self._pull_dataflows = defaultdict(list)
+        self._vias = defaultdict(list)
+        self._transforms = {}
+        self._plan = None
 
     def add_subsystem(self, name, subsys):
         assert name not in self._subsystems
         self._subsystems[name] = subsys
+        self._plan = None
 
     def get_subsystem(self, name):
         return self._subsystems[name]
 
+    def add_transform(self, name, transform):
+        """
+        Register an object whose methods can be named in connect(via=...),
+        as 'name.method'
+        """
+        assert name not in self._transforms
+        self._transforms[name] = transform
+
     def get_pull_dataflows(self, nm):
         return self._pull_dataflows[nm]
 
+    def _resolve_via(self, via):
+        if via is None:
+            return ()
+        if callable(via) or isinstance(via, str):
+            via = [via]
+        transforms = []
+        for t in via:
+            if not callable(t):
+                transform_nm, method_nm = t.split('.')
+                if transform_nm not in self._transforms:
+                    raise AttributeError("Model doesn't contain transform: %s" % transform_nm)
+                t = getattr(self._transforms[transform_nm], method_nm)
+            transforms.append(t)
+        return tuple(transforms)
+
     def connect(self, src, dst, via=None):
+        """
+        Connect output port `src` to input port `dst` ('Subsys.port'). The
+        cargo goes through the transforms in `via` on its way, in order: each
+        a callable taking and returning the cargo, or the 'name.method' of a
+        transform registered with add_transform.
+        """
         src_subsys, src_port_nm = src.split('.')
         dst_subsys, dst_port_nm = dst.split('.')
         if src_subsys not in self._subsystems:
@@ -151,49 +358,888 @@ class Model(object):
 
         _src_port = self._subsystems[src_subsys].get_output_port(src_port_nm)
         _dst_port = self._subsystems[dst_subsys].get_input_port(dst_port_nm)
+        transforms = self._resolve_via(via)
 
         # TODO: a 4-tuple for this is just plain dumb. work something out as
         # soon as you get the tests to pass!
         self._pull_dataflows[dst_subsys].append((src_subsys, src_port_nm, dst_subsys, dst_port_nm))
-
-    def configure(self, model_config):
-        return RunnableModel(self, model_config)
-
-    def get(self, datastore, subsys_name, getter_name):
+        self._vias[dst_subsys].append(transforms)
+        self._plan = None
+
+    def compile(self):
+        """
+        Freeze the current graph into an ExecutionPlan. The plan is cached
+        until the next add_subsystem/connect call.
+        """
+        if self._plan is not None:
+            return self._plan
+
+        names = list(self._subsystems)
+        index = {nm: i for i, nm in enumerate(names)}
+        nodes = []
+        for i, nm in enumerate(names):
+            subsys = self._subsystems[nm]
+            dataflows = []
+            for (src_subsys_nm, src_port_nm, dst_subsys_nm, dst_port_nm), transforms in \
+                    zip(self._pull_dataflows[nm], self._vias[nm]):
+                assert dst_subsys_nm == nm
+                src_subsys = self._subsystems[src_subsys_nm]
+                dataflows.append(Dataflow(
+                    src_index=index[src_subsys_nm],
+                    src_name=src_subsys_nm,
+                    src_subsys=src_subsys,
+                    src_port=src_subsys.get_output_port(src_port_nm),
+                    dst_port=subsys.get_input_port(dst_port_nm),
+                    dst_index=i,
+                    transforms=transforms
+                ))
+            nodes.append(PlanNode(i, nm, subsys, dataflows))
+
+        # the push side of the same dataflows, grouped by output port
+        subscribers = [{} for _ in nodes]
+        for node in nodes:
+            for flow in node.dataflows:
+                subscribers[flow.src_index].setdefault(flow.src_port, []).append(flow)
+        for node, by_port in zip(nodes, subscribers):
+            node.subscribers = tuple((port, tuple(flows)) for port, flows in by_port.items())
+
+        self._plan = ExecutionPlan(nodes)
+        return self._plan
+
+    def schedule(self):
+        """
+        The order in which to run the model, derived from the dataflows
+        """
+        return self.compile().schedule
+
+    def configure(self, model_config, incremental=False, fingerprint='identity', cache=None, push=False,
+                  seed_pool=None, lazy=False):
+        return RunnableModel(self, model_config, incremental=incremental, fingerprint=fingerprint, cache=cache,
+                             push=push, seed_pool=seed_pool, lazy=lazy)
+
+    def get(self, datastore, subsys_name, getter_name, runnable=None):
+        """
+        Read an output port off the subsystem's latest container. Given the
+        RunnableModel `runnable`, the port is evaluated lazily: only what it
+        depends on is run, and only if stale (see RunnableModel.evaluate).
+        An AsyncRunnableModel has to be awaited: use its own get instead.
+        """
+        if runnable is not None:
+            runnable.evaluate([subsys_name], datastore)
         subsys = self.get_subsystem(subsys_name)
         data_container = datastore[subsys_name][-1]
         return subsys.get(getter_name, data_container)
 
+class Dataflow(object):
+    """
+    A resolved connection from an upstream output port to a downstream input
+    port, through any transforms
+    """
+
+    def __init__(self, src_index, src_name, src_subsys, src_port, dst_port, dst_index=None, transforms=()):
+        self.src_index = src_index
+        self.src_name = src_name
+        self.src_subsys = src_subsys
+        self.src_port = src_port
+        self.dst_port = dst_port
+        self.dst_index = dst_index
+        self.transforms = tuple(transforms)
+        self.key = '%s.%s' % (src_name, src_port.name)
+
+    def convey(self, cargo):
+        for transform in self.transforms:
+            cargo = transform(cargo)
+        return cargo
+
+    def pull(self, data_container, hooks=None):
+        cargo = self.src_subsys.read_port(self.src_port, data_container, hooks, self.src_name)
+        if self.transforms:
+            return self.convey(cargo)
+        return cargo
+
+
+class PlanNode(object):
+    """
+    A subsystem with its incoming dataflows resolved to port objects.
+    `subscribers` pairs each connected output port with the dataflows it feeds.
+    """
+
+    def __init__(self, index, name, subsys, dataflows):
+        self.index = index
+        self.name = name
+        self.subsys = subsys
+        self.dataflows = tuple(dataflows)
+        self.subscribers = ()
+
+
+class ExecutionPlan(object):
+    """
+    A frozen view of a Model. Nodes can be looked up by name or integer index.
+    """
+
+    def __init__(self, nodes):
+        self._nodes = tuple(nodes)
+        self._index = {node.name: node.index for node in self._nodes}
+        self._schedule = None
+
+    @property
+    def schedule(self):
+        if self._schedule is None:
+            self._schedule = build_schedule(self)
+        return self._schedule
+
+    def index(self, name):
+        try:
+            return self._index[name]
+        except KeyError:
+            raise AttributeError("Model doesn't contain subsystem: %s" % name)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self._nodes[key]
+        return self._nodes[self.index(key)]
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+
 class RunnableModel(object):
     """
-    Once a Model has been configured with baseline selections it becomes 'runnable'
+    Once a Model has been configured with baseline selections it becomes 'runnable'.
+    The model graph is compiled once here; connect more dataflows and you need
+    to configure again.
+
+    An incremental model skips the seed run of any node whose inputs are the
+    same as last time and re-appends its previous container instead. Inputs
+    are compared by the identity of the upstream containers, or by their
+    contents with fingerprint='content'.
+
+    Seed runs go through `cache` (a kconnect.cache.ResultCache) if one is
+    given, so a node that has seen the same inputs before, in this session
+    or an earlier one, gets its container filled without running the seed.
+
+    Hooks added with add_hook (e.g. a kconnect.profiling.Profiler) see every
+    node run, input port application, seed run and output port read.
+
+    A push model publishes each node's result as soon as it has run: every
+    connected output port is read once and the cargo is left pending on the
+    dataflows it feeds, per DataStore. Fan-out then costs one port read, and
+    run_events can schedule nodes as their inputs arrive. Cargo pending from
+    anything but the latest upstream container is ignored and pulled afresh.
+
+    With a `seed_pool` (a kconnect.pool.SeedPool) seeds that support reset()
+    are handed back after each run and reused by the next run of the node.
+
+    Nodes with a surrogate (see GenericSubsys.set_surrogate) may be answered
+    by it instead of their seed. Set `surrogates` to False to run the real
+    seeds regardless.
+
+    A `lazy` model notes what every run read, so that evaluate can tell
+    whether results of runs made by other means are still up to date. Others
+    don't pay for that, and evaluate re-runs whatever it didn't run itself.
     """
-    def __init__(self, model, model_config):
+    def __init__(self, model, model_config, incremental=False, fingerprint='identity', cache=None, push=False,
+                 seed_pool=None, lazy=False):
+        if fingerprint not in ('identity', 'content'):
+            raise ValueError('Unknown fingerprint mode: %s' % fingerprint)
         self._model = model
         self._model_config = model_config
+        self._plan = model.compile()
+        self._selections = [_UNRESOLVED] * len(self._plan)
+        self._overrides = {}
+        self._incremental = incremental
+        self._by_content = fingerprint == 'content'
+        self._fingerprints = [None] * len(self._plan)
+        self._cache = cache
+        self._seed_pool = seed_pool
+        self._hooks = []
+        self._push = push
+        self._pending = weakref.WeakKeyDictionary()
+        self._evaluated = weakref.WeakKeyDictionary()
+        self._lazy = lazy
+        self._runs = weakref.WeakKeyDictionary()
+        self.surrogates = True
+        self.stats = {'executed': 0, 'skipped': 0}
 
-    def run(self, name, datastore):
-        subsys = self._model.get_subsystem(name)
-        seed_selection = self._model_config[name]
-
-        seed = subsys.get_seed(seed_selection)
+    @property
+    def plan(self):
+        return self._plan
 
-        pull_dataflows = self._model.get_pull_dataflows(name)
-        for src_subsys_nm, src_port_nm, dst_subsys_nm, dst_port_nm in pull_dataflows:
-            assert dst_subsys_nm == name
+    @property
+    def hooks(self):
+        """
+        The hooks added with add_hook, to pass on to GenericSubsys.read_port
+        """
+        return self._hooks
+
+    def add_hook(self, hook):
+        """
+        Instrument this model's runs, including the port reads they make,
+        with `hook`. Other RunnableModels of the same Model aren't affected.
+        """
+        if hook not in self._hooks:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        if hook in self._hooks:
+            self._hooks.remove(hook)
+
+    def get_seed_selection(self, node):
+        selection = self._selections[node.index]
+        if selection is _UNRESOLVED:
+            selection = self._selections[node.index] = self._model_config[node.name]
+        return selection
+
+    def get_seed(self, node):
+        return node.subsys.get_seed(self.get_seed_selection(node), self._seed_pool, node.name)
+
+    def prepare(self, node, datastore):
+        """
+        Get a fresh seed for the node with all the upstream cargo applied
+        """
+        seed = self.get_seed(node)
+        overrides = self._overrides
+        apply_port = seed.apply_port if not self._hooks else self._tracer(node, seed)
+        pending = self._pending.get(datastore) if self._push else None
+
+        for flow in node.dataflows:
+            if overrides and flow.key in overrides:
+                apply_port(flow.dst_port, flow.convey(overrides[flow.key]))
+                continue
 
             # UBC default policy: ignore and move on
-            if src_subsys_nm not in datastore or not datastore[src_subsys_nm]:
+            if flow.src_name not in datastore:
+                continue
+            src_stack = datastore[flow.src_name]
+            if not src_stack:
                 continue
 
-            src_subsys = self._model.get_subsystem(src_subsys_nm)
+            latest = src_stack[-1]  # pick the latest
+            if pending:
+                delivery = pending.get(flow)
+                if delivery is not None and delivery[0] is latest:
+                    delivery[2] = False
+                    apply_port(flow.dst_port, delivery[1])
+                    continue
+
+            cargo = flow.pull(latest, self._hooks)
+            apply_port(flow.dst_port, cargo)
+
+        return seed
+
+    def publish(self, name, datastore):
+        """
+        Push the node's latest result downstream: read each connected output
+        port once and leave the cargo pending on every dataflow it feeds
+        """
+        node = self._plan[name]
+        data_container = datastore[node.name][-1]
+        pending = self._pending.get(datastore)
+        if pending is None:
+            pending = self._pending[datastore] = {}
+        for output_port, flows in node.subscribers:
+            cargo = node.subsys.read_port(output_port, data_container, self._hooks, node.name)
+            for flow in flows:
+                pending[flow] = [data_container, flow.convey(cargo), True]
+
+    def ready(self, name, datastore):
+        """
+        Whether every dataflow into the node is overridden or has had cargo
+        pushed to it since the node last ran
+        """
+        pending = self._pending.get(datastore) or {}
+        for flow in self._plan[name].dataflows:
+            if self._overrides and flow.key in self._overrides:
+                continue
+            delivery = pending.get(flow)
+            if delivery is None or not delivery[2]:
+                return False
+        return True
+
+    def run_events(self, names, datastore, max_runs=None):
+        """
+        Event-driven run of a push model: run `names`, then every node that
+        becomes ready as results are pushed, in the order they become ready,
+        until nothing is ready or `max_runs` runs have been made. A cycle
+        keeps going until max_runs. Returns the names of the nodes run.
+        """
+        ran = []
+        for node in self._events(names, datastore, max_runs):
+            self.run(node.index, datastore)
+            ran.append(node.name)
+        return ran
+
+    def _events(self, names, datastore, max_runs):
+        """
+        The nodes run_events runs, in order: the caller runs each node before
+        asking for the next
+        """
+        if not self._push:
+            raise ValueError('Event-driven runs need a push model, see Model.configure(push=True)')
+        queue = deque(self._plan[nm].index for nm in names)
+        queued = set(queue)
+        runs = 0
+        while queue and (max_runs is None or runs < max_runs):
+            node = self._plan[queue.popleft()]
+            queued.discard(node.index)
+            yield node
+            runs += 1
+            for _, flows in node.subscribers:
+                for flow in flows:
+                    if flow.dst_index not in queued and self.ready(flow.dst_index, datastore):
+                        queue.append(flow.dst_index)
+                        queued.add(flow.dst_index)
+
+    def _tracer(self, node, seed):
+        hooks = self._hooks
+
+        def apply_port(input_port, cargo):
+            with Span(hooks, 'input_port', '%s.%s' % (node.name, input_port.name)) as span:
+                span.nbytes = payload_size(cargo)
+                seed.apply_port(input_port, cargo)
+        return apply_port
+
+    def fingerprint(self, node, datastore):
+        """
+        Everything that goes into a run of the node: the seed selection and,
+        per dataflow, the override value or the upstream container it reads.
+        """
+        sources = tuple(self._source(flow, datastore) for flow in node.dataflows)
+        return self.get_seed_selection(node), sources
+
+    def _source(self, flow, datastore):
+        if self._overrides and flow.key in self._overrides:
+            return 'override', self._overrides[flow.key]
+        if flow.src_name not in datastore or not datastore[flow.src_name]:
+            return None
+        if self._by_content:
+            return datastore[flow.src_name][-1].digest()
+        return datastore[flow.src_name][-1]
+
+    def _inputs(self, node, datastore):
+        """
+        What a run of the node reads, by identity: the seed selection and,
+        per dataflow, the override value or the upstream container
+        """
+        overrides = self._overrides
+        sources = [self.get_seed_selection(node)]
+        for flow in node.dataflows:
+            if overrides and flow.key in overrides:
+                sources.append(('override', overrides[flow.key]))
+            elif flow.src_name in datastore and datastore[flow.src_name]:
+                sources.append(datastore[flow.src_name][-1])
+            else:
+                sources.append(None)
+        return tuple(sources)
+
+    def _record(self, node, datastore, inputs):
+        """
+        Note that the node's latest container in the datastore was made from
+        `inputs`, for evaluate
+        """
+        runs = self._runs.get(datastore)
+        if runs is None:
+            runs = self._runs[datastore] = {}
+        runs[node.index] = (inputs, datastore[node.name][-1])
+
+    def _reuse(self, node, datastore):
+        """
+        For an incremental model, check the node's inputs. Returns the
+        fingerprint to record after running it, or None if the last container
+        was re-appended instead.
+        """
+        fingerprint = self.fingerprint(node, datastore)
+        last = self._fingerprints[node.index]
+        if last is not None and last[0] == fingerprint and node.name in datastore:
+            stack = datastore[node.name]
+            if stack and stack[-1] is last[1] and not self._standing_in(node, last[1]):
+                stack.append(last[1])
+                self.stats['skipped'] += 1
+                return None
+        return fingerprint
+
+    def _stand_in(self, node, seed, data_container):
+        """
+        Let the node's surrogate answer the run, if it has one that can and
+        surrogates are on. Returns whether it did.
+        """
+        surrogate = node.subsys.surrogate
+        return self.surrogates and surrogate is not None and surrogate.predict(seed.applied, data_container)
+
+    def _standing_in(self, node, data_container):
+        """
+        Whether the container holds predicted values that mustn't be reused
+        now that surrogates are off
+        """
+        surrogate = node.subsys.surrogate
+        return not self.surrogates and surrogate is not None and surrogate.answer(data_container) is not None
 
-            src_data_container = datastore[src_subsys_nm][-1]  # pick the latest
-            cargo = src_subsys.get(src_port_nm, src_data_container)
-            seed.apply(dst_port_nm, cargo)
+    def run(self, name, datastore):
+        if self._hooks:
+            node = self._plan[name]
+            with Span(self._hooks, 'node', node.name) as span:
+                self._run(name, datastore)
+                span.nbytes = datastore[node.name][-1].nbytes()
+        else:
+            self._run(name, datastore)
+
+    def _run(self, name, datastore):
+        node = self._plan[name]
+        if self._lazy:
+            inputs = self._inputs(node, datastore)
+        if self._incremental:
+            fingerprint = self._reuse(node, datastore)
+            if fingerprint is None:
+                if self._lazy:
+                    self._record(node, datastore, inputs)
+                return
+        seed = self.prepare(node, datastore)
+        data_container = datastore[node.name].add_new()
+        surrogate = node.subsys.surrogate
+        if not self._stand_in(node, seed, data_container):
+            if self._hooks:
+                with Span(self._hooks, 'seed', node.name) as span:
+                    self._germinate_into(node, seed, data_container)
+                    span.nbytes = data_container.nbytes()
+            else:
+                self._germinate_into(node, seed, data_container)
+            if surrogate is not None:
+                surrogate.learn(seed.applied, node.subsys, data_container)
+        seed.release()
+        if self._lazy:
+            self._record(node, datastore, inputs)
+        self.stats['executed'] += 1
+        if self._incremental:
+            self._fingerprints[node.index] = (fingerprint, data_container)
+        if self._push:
+            self.publish(node.index, datastore)
+
+    def _germinate_into(self, node, seed, data_container):
+        if self._cache is None:
+            seed.run(data_container)
+        else:
+            self._cache.run(node.name, self.get_seed_selection(node), seed, data_container)
+
+    def run_many(self, names, datastore, executor=None):
+        """
+        Run independent nodes together. All the seeds are prepared from the
+        current datastore first, run on the executor, and the new containers
+        are appended in the order of `names` whatever order they finish in.
+        Nothing is written if any of the runs fails.
+        """
+        nodes = [self._plan[nm] for nm in names]
+        inputs = [self._inputs(node, datastore) if self._lazy else None for node in nodes]
+        if self._incremental:
+            fingerprints = [self._reuse(node, datastore) for node in nodes]
+            for node, node_inputs, fp in zip(nodes, inputs, fingerprints):
+                if fp is None and self._lazy:
+                    self._record(node, datastore, node_inputs)
+            kept = [n for n, fp in enumerate(fingerprints) if fp is not None]
+            nodes = [nodes[n] for n in kept]
+            inputs = [inputs[n] for n in kept]
+            fingerprints = [fingerprints[n] for n in kept]
+        seeds = [self.prepare(node, datastore) for node in nodes]
+        results = [None] * len(nodes)
+        for n, (node, seed) in enumerate(zip(nodes, seeds)):
+            if node.subsys.surrogate is not None:
+                data_container = DataContainer()
+                if self._stand_in(node, seed, data_container):
+                    results[n] = data_container
+        real = [n for n in range(len(nodes)) if results[n] is None]
+        keys = [None] * len(nodes)
+        if self._cache is not None:
+            for n in real:
+                keys[n] = self._cache.key(nodes[n].name, self.get_seed_selection(nodes[n]), seeds[n])
+                data_container = DataContainer()
+                if self._cache.load(keys[n], data_container):
+                    results[n] = data_container
+        todo = [n for n in range(len(nodes)) if results[n] is None]
+
+        with executor_scope(executor) as pool:
+            germinated = self.germinate_many([nodes[n] for n in todo], [seeds[n] for n in todo], pool)
+            for n, data_container in zip(todo, germinated):
+                results[n] = data_container
+        for n in real:
+            if nodes[n].subsys.surrogate is not None:
+                nodes[n].subsys.surrogate.learn(seeds[n].applied, nodes[n].subsys, results[n])
+        for seed in seeds:
+            seed.release()
+
+        if self._cache is not None:
+            for n in todo:
+                self._cache.store(keys[n], results[n])
+        for node, node_inputs, data_container in zip(nodes, inputs, results):
+            datastore[node.name].append(data_container)
+            if self._lazy:
+                self._record(node, datastore, node_inputs)
+        self.stats['executed'] += len(nodes)
+        if self._incremental:
+            for node, fingerprint, data_container in zip(nodes, fingerprints, results):
+                self._fingerprints[node.index] = (fingerprint, data_container)
+        if self._push:
+            for node in nodes:
+                self.publish(node.index, datastore)
+
+    def germinate_many(self, nodes, seeds, pool=None):
+        """
+        New containers from the nodes' prepared seeds, run together on the
+        pool (an Executor, or None to run them here). Nothing is appended to
+        a datastore; run_many and the Newton solver build on this.
+        """
+        # seed spans are reported from the thread that runs the seed; hooks
+        # can't follow seeds into other processes
+        if self._hooks and not isinstance(pool, ProcessPoolExecutor):
+            calls = [(germinate_traced, seed.seed, self._hooks, node.name) for node, seed in zip(nodes, seeds)]
+        else:
+            calls = [(germinate, seed.seed) for seed in seeds]
+        if pool is None:
+            return [fn(*args) for fn, *args in calls]
+        futures = [pool.submit(*call) for call in calls]
+        return [f.result() for f in futures]
+
+    def run_batch(self, name, datastores):
+        """
+        Run one node for many design points, one DataStore per point.
+
+        If the seed has `run_batch(data_containers)` and every connected input
+        port has a `batch_fn`, one seed is given the cargo of all the points as
+        lists and run once. Otherwise this falls back to calling `run` per
+        point. The batched path doesn't go through the result cache or the
+        incremental fingerprints.
+        """
+        node = self._plan[name]
+        datastores = list(datastores)
+        seed = self.get_seed(node)
+        if not seed.supports_batch([flow.dst_port for flow in node.dataflows]):
+            seed.release()
+            for datastore in datastores:
+                self.run(name, datastore)
+            return
+
+        batches = []
+        for flow in node.dataflows:
+            if self._overrides and flow.key in self._overrides:
+                batches.append((flow, [flow.convey(self._overrides[flow.key])] * len(datastores)))
+                continue
+            latest = [datastore[flow.src_name][-1] if flow.src_name in datastore and datastore[flow.src_name]
+                      else None for datastore in datastores]
+            # UBC default policy: ignore and move on, as long as the points agree
+            if all(dc is None for dc in latest):
+                continue
+            if any(dc is None for dc in latest):
+                seed.release()
+                for datastore in datastores:
+                    self.run(name, datastore)
+                return
+            batches.append((flow, [flow.pull(dc, self._hooks) for dc in latest]))
+
+        for flow, cargos in batches:
+            seed.apply_batch(flow.dst_port, cargos)
+        inputs = [self._inputs(node, datastore) if self._lazy else None for datastore in datastores]
+        data_containers = [datastore[node.name].add_new() for datastore in datastores]
+        seed.run_batch(data_containers)
+        seed.release()
+        if self._lazy:
+            for datastore, point_inputs in zip(datastores, inputs):
+                self._record(node, datastore, point_inputs)
+        self.stats['executed'] += len(datastores)
+        if self._push:
+            for datastore in datastores:
+                self.publish(node.index, datastore)
+
+    def override(self, src, value):
+        """
+        Feed a fixed value to every input port connected to output port `src`
+        ('Subsys.port') instead of reading it from the datastore
+        """
+        subsys_nm, port_nm = src.split('.')
+        self._plan[subsys_nm].subsys.get_output_port(port_nm)
+        self._overrides[src] = value
+
+    def clear_override(self, src=None):
+        if src is None:
+            self._overrides.clear()
+        else:
+            self._overrides.pop(src, None)
+
+    def get_overrides(self):
+        return dict(self._overrides)
+
+    def cycle_ports(self, names):
+        """
+        Output ports of `names` that feed back into the same group of nodes.
+        These are the natural quantities to monitor when iterating the group.
+        """
+        indices = set(self._plan[nm].index for nm in names)
+        ports = []
+        for nm in names:
+            for flow in self._plan[nm].dataflows:
+                if flow.src_index in indices and flow.key not in ports:
+                    ports.append(flow.key)
+        return ports
+
+    def tear_ports(self, order):
+        """
+        The cycle ports of `order` that are read before they are written in
+        a sweep: those fed back to a node at or before their source. Fixing
+        them breaks every cycle in the group.
+        """
+        position = {self._plan[nm].index: n for n, nm in enumerate(order)}
+        ports = []
+        for n, nm in enumerate(order):
+            for flow in self._plan[nm].dataflows:
+                if position.get(flow.src_index, -1) >= n and flow.key not in ports:
+                    ports.append(flow.key)
+        return ports
+
+    def newton(self, order, datastore, unknowns=None, tol=1e-6, max_iter=20, broyden=True, fd_step=1e-7,
+               executor=None):
+        """
+        Solve the nodes in `order` for the `unknowns` (tear_ports by default)
+        with a kconnect.solvers.NewtonSolver. The finite-difference sweeps
+        for the Jacobian run side by side on the executor. Returns a
+        ConvergenceReport.
+        """
+        if unknowns is None:
+            unknowns = self.tear_ports(order)
+        with executor_scope(executor) as pool:
+            solver = NewtonSolver(self, order, unknowns, tol=tol, max_iter=max_iter, broyden=broyden,
+                                  fd_step=fd_step, executor=pool)
+            return solver.solve(datastore)
+
+    def converge(self, order, datastore, monitors=None, tol=1e-6, max_iter=100, relaxation=None, executor=None,
+                 checkpoint=None):
+        """
+        Run the nodes in `order` repeatedly until the monitored output ports
+        stop changing. Returns a ConvergenceReport.
+
+        With an executor (or 'thread'/'process') each sweep runs the
+        independent stages of `order` through run_many.
+
+        With a kconnect.checkpoint.Checkpoint the run is saved as it goes
+        and can be carried on with resume().
+        """
+        with executor_scope(executor) as pool:
+            if checkpoint is None:
+                return self._converge(order, datastore, monitors, tol, max_iter, relaxation, pool)
+            args = dict(order=list(order), monitors=monitors, tol=tol, max_iter=max_iter, relaxation=relaxation)
+            return self._converge_checkpointed(datastore, args, pool, checkpoint)
+
+    def _converge(self, order, datastore, monitors, tol, max_iter, relaxation, pool, on_sweep=None, state=None):
+        if monitors is None:
+            monitors = self.cycle_ports(order)
+        stages = sweep_stages(self._plan, order) if pool is not None else None
+        solver = FixedPointSolver(self, order, monitors, tol=tol, max_iter=max_iter, relaxation=relaxation,
+                                  stages=stages, executor=pool)
+        return solver.solve(datastore, state=state, on_sweep=on_sweep)
+
+    def _converge_checkpointed(self, datastore, args, pool, checkpoint, state=None):
+        task = ('converge', args)
+
+        def on_sweep(solver):
+            checkpoint.step(datastore, lambda: {'task': task, 'overrides': self.get_overrides(),
+                                                'solver': solver.state()})
+
+        report = self._converge(args['order'], datastore, args['monitors'], args['tol'], args['max_iter'],
+                                args['relaxation'], pool, on_sweep, state)
+        checkpoint.save(datastore, {'task': task, 'overrides': self.get_overrides(), 'report': report})
+        return report
+
+    def run_schedule(self, datastore, tol=1e-6, max_iter=100, relaxation=None, executor=None, checkpoint=None):
+        """
+        Run the whole model in schedule order. Acyclic nodes run once, cyclic
+        blocks are converged in place. Returns the ConvergenceReports of the
+        cyclic blocks keyed by their tuple of node names.
+
+        With an executor, acyclic nodes on the same schedule level run
+        concurrently, as do the independent stages inside cyclic blocks.
+
+        With a kconnect.checkpoint.Checkpoint the run is saved after blocks
+        and solver sweeps and can be carried on with resume().
+        """
+        with executor_scope(executor) as pool:
+            args = dict(tol=tol, max_iter=max_iter, relaxation=relaxation)
+            return self._run_schedule(datastore, args, pool, checkpoint)
+
+    def _run_schedule(self, datastore, args, pool, checkpoint, position=None):
+        task = ('run_schedule', args)
+        schedule = self._plan.schedule
+        reports = dict(position['reports']) if position is not None else {}
+        start = position['block'] if position is not None else 0
+        state = position['solver'] if position is not None else None
+
+        def save_point(b, solver=None):
+            return {'task': task, 'overrides': self.get_overrides(), 'block': b, 'reports': dict(reports),
+                    'solver': solver.state() if solver is not None else None}
+
+        def step(b, solver=None):
+            if checkpoint is not None:
+                checkpoint.step(datastore, lambda: save_point(b, solver))
+
+        pending = []
+        level = None
+        for b in range(start, len(schedule)):
+            block = schedule[b]
+            if pending and (block.cyclic or block.level != level):
+                self.run_many(pending, datastore, pool)
+                pending = []
+                step(b)
+            level = block.level
+            if block.cyclic:
+                on_sweep = (lambda solver: step(b, solver)) if checkpoint is not None else None
+                reports[block.names] = self._converge(block.names, datastore, None, args['tol'], args['max_iter'],
+                                                      args['relaxation'], pool, on_sweep, state)
+                state = None
+                step(b + 1)
+            elif pool is None:
+                self.run(block.indices[0], datastore)
+                step(b + 1)
+            else:
+                pending.append(block.names[0])
+        if pending:
+            self.run_many(pending, datastore, pool)
+        if checkpoint is not None:
+            checkpoint.save(datastore, save_point(len(schedule)))
+        return reports
+
+    def resume(self, checkpoint, datastore=None, executor=None):
+        """
+        Carry on a converge or run_schedule call from the last save in
+        `checkpoint`: the saved containers are restored into `datastore` (a
+        new DataStore if None), then the run continues from where it was,
+        without rerunning the blocks or sweeps that were done. Returns the
+        datastore and what the original call returns.
+        """
+        position = checkpoint.position
+        if position is None:
+            raise ValueError('Nothing to resume: the checkpoint has no complete save')
+        if datastore is None:
+            datastore = DataStore()
+        checkpoint.restore(datastore)
+        self._overrides = dict(position['overrides'])
+        kind, args = position['task']
+        with executor_scope(executor) as pool:
+            if kind == 'converge':
+                if 'report' in position:
+                    return datastore, position['report']
+                return datastore, self._converge_checkpointed(datastore, args, pool, checkpoint, position['solver'])
+            return datastore, self._run_schedule(datastore, args, pool, checkpoint, position)
+
+    def upstream(self, names):
+        """
+        The nodes that `names` depend on, themselves included, found by
+        walking the dataflows backwards. Overridden dataflows are not followed.
+        """
+        overrides = self._overrides
+        todo = [self._plan[nm].index for nm in names]
+        needed = set(todo)
+        while todo:
+            for flow in self._plan[todo.pop()].dataflows:
+                if overrides and flow.key in overrides:
+                    continue
+                if flow.src_index not in needed:
+                    needed.add(flow.src_index)
+                    todo.append(flow.src_index)
+        return needed
+
+    def _block_inputs(self, block, datastore):
+        """
+        What goes into a schedule block from outside it, as fingerprint()
+        has it for a single node
+        """
+        inside = set(block.indices)
+        sources = []
+        for idx in block.indices:
+            node = self._plan[idx]
+            sources.append(self.get_seed_selection(node))
+            for flow in node.dataflows:
+                if flow.src_index in inside and not (self._overrides and flow.key in self._overrides):
+                    continue
+                sources.append(self._source(flow, datastore))
+        return tuple(sources)
+
+    def evaluate(self, names, datastore, tol=1e-6, max_iter=100, relaxation=None):
+        """
+        Bring the latest results of `names` up to date, running only the
+        nodes they depend on and only those whose results are stale. Cyclic
+        blocks on the way are converged. Returns the names of the nodes run.
+
+        A block's results are stale if it has none yet, or if its inputs from
+        outside the block (upstream containers, overrides, seed selections)
+        differ from those of its last evaluation. Results of runs by other
+        means are checked against what those runs read if the model is lazy,
+        and are stale otherwise.
+        """
+        ran = []
+        for block in self._stale_blocks(names, datastore):
+            if block.cyclic:
+                self._converge(block.names, datastore, None, tol, max_iter, relaxation, None)
+            else:
+                self.run(block.indices[0], datastore)
+            ran.extend(block.names)
+        return ran
+
+    def _stale_blocks(self, names, datastore):
+        """
+        The schedule blocks evaluate has to run, in order: the caller runs
+        each block before asking for the next, which records it as evaluated
+        """
+        needed = self.upstream(names)
+        records = self._evaluated.get(datastore)
+        if records is None:
+            records = self._evaluated[datastore] = {}
+        for b, block in enumerate(self._plan.schedule):
+            if not needed.intersection(block.indices):
+                continue
+            inputs = self._block_inputs(block, datastore)
+            latest = tuple(datastore[nm][-1] if nm in datastore and datastore[nm] else None for nm in block.names)
+            record = records.get(b)
+            if record is not None and record[1] == latest:
+                fresh = record[0] == inputs
+            else:
+                fresh = None not in latest and self._still_current(block, datastore, latest)
+            if fresh:
+                continue
+            yield block
+            records[b] = (inputs, tuple(datastore[nm][-1] for nm in block.names))
+
+    def _still_current(self, block, datastore, latest):
+        """
+        Whether the latest results of a block, not made by evaluate, are up
+        to date. If this model ran them, each node's run must have read what
+        is latest now; a cycle converged by other means seldom passes and is
+        converged again from where it is. Results from elsewhere are taken as
+        they are unless this model has run something they read since.
+        Without the records of a lazy model none of that can be told.
+        """
+        if not self._lazy:
+            return False
+        runs = self._runs.get(datastore, {})
+        made_here = [idx in runs and runs[idx][1] is data_container
+                     for idx, data_container in zip(block.indices, latest)]
+        if all(made_here):
+            return all(runs[idx][0] == self._inputs(self._plan[idx], datastore) for idx in block.indices)
+        if any(made_here):
+            return False
+        for idx in block.indices:
+            for flow in self._plan[idx].dataflows:
+                run = runs.get(flow.src_index)
+                if run is not None and datastore[flow.src_name][-1] is run[1] and not (
+                        self._overrides and flow.key in self._overrides):
+                    return False
+        return True
+
+    def get(self, datastore, subsys_name, getter_name, **kwargs):
+        """
+        Read output port `getter_name` of `subsys_name`, evaluating whatever
+        it needs first (see evaluate, which takes the keyword arguments)
+        """
+        self.evaluate([subsys_name], datastore, **kwargs)
+        return self._model.get(datastore, subsys_name, getter_name)
 
-        data_container = datastore[name].add_new()
-        seed.run(data_container)
 
 class BadPortSpec(AttributeError):
     pass
@@ -209,32 +1255,145 @@ def verify_port_compatibility(src, dst):
 
 
 class DataStore(object):
-    def __init__(self):
-        self._datastacks = defaultdict(DataStack)
+    """
+    One DataStack per subsystem, created on first use.
+
+    `retention` bounds the history each stack keeps in memory: a
+    kconnect.storage.Retention for every stack, or a dict of them by
+    subsystem name. Evicted containers go to `spill`, a SpillStore, if given
+    and are dropped otherwise.
+
+    A `backend` (see kconnect.storage.Backend) is handed every container as
+    it is completed, e.g. to write the whole history to disk. Call flush() or
+    close() at the end of a run to hand over the latest ones too.
+    """
+
+    def __init__(self, retention=None, spill=None, backend=None):
+        self._datastacks = {}
+        self._retention = retention
+        self._spill = spill
+        self._backend = backend
 
     def __getitem__(self, nm):
-        # print('***', nm)
-        # print(self._datastacks[nm])
-        return self._datastacks[nm]
+        try:
+            return self._datastacks[nm]
+        except KeyError:
+            retention = self._retention
+            if isinstance(retention, dict):
+                retention = retention.get(nm)
+            stack = self._datastacks[nm] = DataStack(retention, self._spill, self._backend, nm)
+            return stack
 
     def __contains__(self, nm):
         return nm in self._datastacks
 
+    def keys(self):
+        return self._datastacks.keys()
+
+    def flush(self):
+        if self._backend is not None:
+            for stack in self._datastacks.values():
+                stack.flush()
+            self._backend.flush()
+
+    def close(self):
+        if self._backend is not None:
+            self.flush()
+            self._backend.close()
+
     def __repr__(self):
-        return repr(dict(self._datastacks))
+        return repr(self._datastacks)
 
 
 class DataStack(object):
-    def __init__(self):
+    """
+    The history of a subsystem's results, oldest first. Indices are logical:
+    with a retention policy, entries it evicts keep their index and are read
+    back from the spill store, or raise EvictedEntry if there isn't one.
+    """
+    __slots__ = ('_stack', '_retention', '_indices', '_count', '_spill', '_spill_key',
+                 '_backend', '_name', '_recorded')
+
+    def __init__(self, retention=None, spill=None, backend=None, name=None):
         self._stack = []
+        self._retention = retention
+        self._indices = [] if retention is not None else None
+        self._count = 0
+        self._spill = spill
+        self._spill_key = spill.new_key() if spill is not None and retention is not None else None
+        self._backend = backend
+        self._name = name
+        self._recorded = 0
 
     def add_new(self):
         dc = DataContainer()
-        self._stack.append(dc)
+        self.append(dc)
         return dc
 
+    def flush(self):
+        """
+        Hand every entry not yet recorded to the backend
+        """
+        while self._recorded < len(self):
+            self._backend.record(self._name, self._recorded, self[self._recorded])
+            self._recorded += 1
+
+    def append(self, dc):
+        if self._backend is not None and self:
+            # the previous entry is complete now
+            self.flush()
+        self._stack.append(dc)
+        retention = self._retention
+        if retention is None:
+            return
+
+        idx = self._count
+        self._indices.append(idx)
+        self._count = idx + 1
+
+        # the entry that has just dropped out of the most recent ones
+        retired = idx - retention.last
+        if retired >= 0 and not retention.keep(retired):
+            pos = len(self._stack) - 1 - retention.last
+            if self._spill is not None:
+                self._spill.put(self._spill_key, retired, self._stack[pos])
+            del self._stack[pos]
+            del self._indices[pos]
+
+    def _get(self, idx):
+        count = self._count
+        if idx < 0:
+            idx += count
+        if not 0 <= idx < count:
+            raise IndexError('DataStack index out of range')
+        pos = bisect.bisect_left(self._indices, idx)
+        if pos < len(self._indices) and self._indices[pos] == idx:
+            return self._stack[pos]
+        if self._spill is not None:
+            return self._spill.get(self._spill_key, idx)
+        raise EvictedEntry('Entry %d was discarded by the retention policy' % idx)
+
     def __getitem__(self, idx):
-        return self._stack[idx]
+        if self._retention is None:
+            return self._stack[idx]
+        if isinstance(idx, slice):
+            return [self._get(i) for i in range(*idx.indices(self._count))]
+        return self._get(idx)
+
+    def __iter__(self):
+        """
+        Everything still readable, oldest first
+        """
+        if self._retention is None:
+            return iter(self._stack)
+        if self._spill is not None:
+            return (self._get(i) for i in range(self._count))
+        return iter(list(self._stack))
+
+    def __len__(self):
+        if self._retention is None:
+            return len(self._stack)
+        return self._count
 
     def __repr__(self):
         return repr(self._stack)
@@ -247,23 +1406,181 @@ class DataStack(object):
 
 
 class DataContainer(object):
+    """
+    Folder-like collection of named items. `_version` counts the writes,
+    so readers can tell whether what they derived from it is still current.
+    `_accessed` holds the accessors built over it (see GenericSubsys.access)
+    and isn't pickled.
+    """
+    __slots__ = ('_data', '_version', '_accessed')
+
     def __init__(self):
         self._data = {}
+        self._version = 0
+        self._accessed = None
 
-    def __getitem__(self, item):
-        def write_fn(d):
-            self._data[item] = d
+    def __getstate__(self):
+        return self._data, self._version
 
-        def read_fn():
-            return self._data[item]
+    def __setstate__(self, state):
+        self._data, self._version = state
+        self._accessed = None
 
-        return DataItem(read_fn, write_fn)
+    def __getitem__(self, item):
+        return ContainerItem(self, item)
+
+    def keys(self):
+        return self._data.keys()
+
+    def contents(self):
+        return dict(self._data)
+
+    def update(self, contents):
+        self._data.update(contents)
+        self._version += 1
+
+    def digest(self):
+        """
+        A hash of the container's contents, as they would be serialized
+        """
+        return hashlib.sha1(repr(sorted(self._data.items())).encode()).hexdigest()
+
+    def nbytes(self):
+        """
+        The size of the text and binary payloads held. Objects stored with
+        put_obj count the length of their JSON text once something has
+        serialized them, and an estimate (profiling.payload_size) until then.
+        """
+        total = 0
+        for value in self._data.values():
+            if type(value) is StoredObject:
+                total += len(value._text) if value._text is not None else payload_size(value.obj)
+            elif type(value) is StoredBuffer:
+                total += value.view.nbytes
+            elif isinstance(value, (str, bytes, bytearray)):
+                total += len(value)
+        return total
 
     def __repr__(self):
         return repr(self._data)
 
 
+class StoredObject(object):
+    """
+    An item value held as a Python object. The JSON text is only produced
+    when something asks for it (read, export, persisting) and is then kept.
+    """
+    __slots__ = ('obj', '_text')
+
+    def __init__(self, obj, text=None):
+        self.obj = obj
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = json.dumps(self.obj)
+        return self._text
+
+    def __getstate__(self):
+        return self.obj, self._text
+
+    def __setstate__(self, state):
+        self.obj, self._text = state
+
+    def __repr__(self):
+        return repr(self.text)
+
+
+class StoredBuffer(object):
+    """
+    A binary item value: bytes, bytearray, memoryview or anything else with
+    the buffer protocol (e.g. a numpy array), held without copying.
+    """
+    __slots__ = ('buf', 'view')
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.view = memoryview(buf)
+
+    def __reduce__(self):
+        # memoryviews can't be pickled, so they have to be copied out
+        if isinstance(self.buf, memoryview):
+            return StoredBuffer, (self.buf.tobytes(),)
+        return StoredBuffer, (self.buf,)
+
+    def __repr__(self):
+        return '<%d bytes sha1=%s>' % (self.view.nbytes, hashlib.sha1(self.view.cast('B')).hexdigest())
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Read-only binary file over a memoryview. Nothing is copied until read.
+    """
+
+    def __init__(self, view):
+        self._view = view.cast('B') if view.format != 'B' or view.ndim != 1 else view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self._view) - self._pos)
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def getbuffer(self):
+        return self._view
+
+
+class _WriteContext(object):
+    __slots__ = ('_item', '_sio')
+
+    def __init__(self, item):
+        self._item = item
+        self._sio = io.StringIO()
+
+    def __enter__(self):
+        return self._sio
+
+    def __exit__(self, *exc):
+        self._item.write(self._sio.getvalue())
+
+
+class _BinaryWriteContext(object):
+    __slots__ = ('_item', '_bio')
+
+    def __init__(self, item):
+        self._item = item
+        self._bio = io.BytesIO()
+
+    def __enter__(self):
+        return self._bio
+
+    def __exit__(self, *exc):
+        # adopt the BytesIO's own buffer rather than copying it out with getvalue()
+        self._item.put_buffer(self._bio.getbuffer())
+
+
 class DataItem(object):
+    __slots__ = ('_read_fn', '_write_fn')
+
     def __init__(self, read_fn, write_fn):
         self._read_fn = read_fn
         self._write_fn = write_fn
@@ -275,23 +1592,113 @@ class DataItem(object):
         return self._read_fn()
 
     def open_to_read(self):
-        s = self._read_fn()
-        return io.StringIO(s)
+        return io.StringIO(self.read())
 
     def open_to_write(self):
-        sio = io.StringIO()
+        return _WriteContext(self)
 
-        class mycontext(object):
-            def __enter__(_):
-                return sio
+    def put_json(self, d):
+        self.write(json.dumps(d))
 
-            def __exit__(_, *exc):
-                self._write_fn(sio.getvalue())
+    def get_json(self):
+        return json.loads(self.read())
 
-        return mycontext()
+    def put_obj(self, obj):
+        self.put_json(obj)
 
-    def put_json(self, d):
-        self._write_fn(json.dumps(d))
+    def get_obj(self):
+        return self.get_json()
+
+    def put_buffer(self, buf):
+        self.write(buf)
+
+    def get_buffer(self):
+        return memoryview(self.read())
+
+    def open_to_read_binary(self):
+        """
+        A file over the binary payload: a BytesIO sharing the data of a bytes
+        payload, a BufferReader over any other buffer
+        """
+        buf = self.read()
+        if type(buf) is bytes:
+            return io.BytesIO(buf)
+        return BufferReader(memoryview(buf))
+
+    def open_to_write_binary(self):
+        return _BinaryWriteContext(self)
+
+
+class ContainerItem(DataItem):
+    """
+    A DataItem that reads and writes one key of a DataContainer directly.
+
+    put_obj stores the object itself and get_obj hands it straight back,
+    so treat what you get as read-only and put_obj again to change it.
+    Text written with write/put_json is decoded once by get_obj and the
+    decoded value is kept until the item is written again. get_json always
+    gives an independent value the caller is free to change.
+
+    put_buffer adopts a binary buffer as it is; get_buffer and
+    open_to_read_binary give zero-copy views of it and get_obj gives back
+    the original object, e.g. a numpy array.
+    """
+    __slots__ = ('_container', '_key')
+
+    def __init__(self, container, key):
+        self._container = container
+        self._key = key
+
+    def write(self, d):
+        container = self._container
+        container._data[self._key] = d
+        container._version += 1
+
+    def read(self):
+        value = self._container._data[self._key]
+        if type(value) is StoredObject:
+            return value.text
+        if type(value) is StoredBuffer:
+            return value.buf
+        return value
+
+    def put_obj(self, obj):
+        container = self._container
+        container._data[self._key] = StoredObject(obj)
+        container._version += 1
+
+    def put_buffer(self, buf):
+        container = self._container
+        container._data[self._key] = StoredBuffer(buf)
+        container._version += 1
+
+    def get_buffer(self):
+        value = self._container._data[self._key]
+        if type(value) is StoredBuffer:
+            return value.view
+        return memoryview(self.read())
 
     def get_json(self):
-        return json.loads(self._read_fn())
+        """
+        The item decoded as JSON, the caller's own copy: nothing is cached,
+        every call decodes (or copies a stored object) afresh. Use get_obj
+        for the shared, cached value.
+        """
+        value = self._container._data[self._key]
+        if type(value) is StoredObject:
+            return copy.deepcopy(value.obj)
+        if type(value) is StoredBuffer:
+            return json.loads(value.view.tobytes())
+        return json.loads(value)
+
+    def get_obj(self):
+        data = self._container._data
+        value = data[self._key]
+        if type(value) is StoredObject:
+            return value.obj
+        if type(value) is StoredBuffer:
+            return value.buf
+        obj = json.loads(value)
+        # the same value, decoded: not a write as far as _version goes
+        data[self._key] = StoredObject(obj, value)
+        return obj
@@ -0,0 +1,82 @@
+"""
+Reuse of seeds from one run to the next.
+"""
+from collections import defaultdict
+import threading
+
+
+class SeedPool(object):
+    """
+    Idle seeds kept for reuse, per (subsystem name, seed selection).
+
+    Seeds that are expensive to construct (meshes, property tables) can
+    implement `reset()`: clear whatever inputs were applied and the results
+    of the last run, keep the warm state. After a run the seed is reset and
+    put back, and the next run of the same node with the same selection
+    takes it instead of asking the dispenser for a new one. Seeds without
+    reset() are never pooled.
+
+    Up to `max_size` idle seeds are kept per key, enough for that many
+    concurrent runs of the node; seeds released beyond that are dropped.
+    Seeds sent to process workers are run on a copy, so the pooled seed
+    keeps its warm state but not what the run did to it.
+
+        runnable_model = model.configure(config, seed_pool=SeedPool(max_size=4))
+    """
+
+    def __init__(self, max_size=4):
+        if max_size < 1:
+            raise ValueError('A seed pool needs room for at least one seed per key')
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._idle = defaultdict(list)
+        self.hits = 0
+        self.misses = 0
+        self.dropped = 0
+
+    def acquire(self, key, factory):
+        """
+        An idle seed for `key`, or a new one from `factory()`
+        """
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.hits += 1
+                return idle.pop()
+            self.misses += 1
+        return factory()
+
+    def release(self, key, seed):
+        """
+        Reset a seed that has finished its run and keep it if there is room
+        """
+        reset = getattr(seed, 'reset', None)
+        if reset is None:
+            self.dropped += 1
+            return
+        reset()
+        with self._lock:
+            idle = self._idle[key]
+            if len(idle) < self._max_size and all(s is not seed for s in idle):
+                idle.append(seed)
+                return
+            self.dropped += 1
+
+    @property
+    def hit_rate(self):
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.
+
+    def stats(self):
+        with self._lock:
+            idle = {key: len(seeds) for key, seeds in self._idle.items() if seeds}
+        return {'hits': self.hits, 'misses': self.misses, 'dropped': self.dropped, 'hit_rate': self.hit_rate,
+                'idle': idle}
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(seeds) for seeds in self._idle.values())
@@ -0,0 +1,172 @@
+"""
+Instrumentation of model runs: pluggable start/end hooks and a collector
+that turns them into a timing report or a Chrome trace.
+
+Spans are reported with one of these kinds:
+
+    node         RunnableModel.run of one node, end to end
+    input_port   applying one cargo to a seed (named after the input port)
+    seed         the seed's run
+    accessor     building the accessor in GenericSubsys.read_port
+    output_port  calling the output port on the accessor
+
+Node and seed spans carry the size of the container written
+(DataContainer.nbytes), accessor and port spans that of what they return
+or apply (payload_size).
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+
+def payload_size(obj, _depth=0):
+    """
+    A rough size in bytes of the data a value holds, without serializing
+    it: strings and buffers by length, numbers as 8 bytes, arrays by their
+    nbytes, containers and plain objects as the sum of their contents.
+    Anything else, or anything nested too deep, is sys.getsizeof.
+    """
+    if obj is None or isinstance(obj, bool):
+        return 1
+    if isinstance(obj, (int, float)):
+        return 8
+    if isinstance(obj, (str, bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, memoryview):
+        return obj.nbytes
+    nbytes = getattr(obj, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    if _depth < 8:
+        if isinstance(obj, dict):
+            return sum(payload_size(k, _depth + 1) + payload_size(v, _depth + 1) for k, v in obj.items())
+        if isinstance(obj, (list, tuple, set, frozenset)):
+            return sum(payload_size(v, _depth + 1) for v in obj)
+        if hasattr(obj, '__dict__'):
+            return payload_size(vars(obj), _depth + 1)
+    return sys.getsizeof(obj)
+
+
+class Hook(object):
+    """
+    Base class for instrumentation hooks. start() returns a token that is
+    passed back to end() for the same span; `nbytes` is the size of what the
+    span wrote, where that is known.
+    """
+
+    def start(self, kind, name):
+        return None
+
+    def end(self, token, nbytes=0):
+        pass
+
+
+class Span(object):
+    """
+    Context manager firing every hook's start and end around a block
+    """
+    __slots__ = ('_hooks', '_kind', '_name', '_tokens', 'nbytes')
+
+    def __init__(self, hooks, kind, name):
+        self._hooks = hooks
+        self._kind = kind
+        self._name = name
+        self.nbytes = 0
+
+    def __enter__(self):
+        self._tokens = [h.start(self._kind, self._name) for h in self._hooks]
+        return self
+
+    def __exit__(self, *exc):
+        for h, token in zip(self._hooks, self._tokens):
+            h.end(token, self.nbytes)
+
+
+class Stat(object):
+    __slots__ = ('kind', 'name', 'calls', 'wall', 'cpu', 'nbytes')
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.calls = 0
+        self.wall = 0.
+        self.cpu = 0.
+        self.nbytes = 0
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class Profiler(Hook):
+    """
+    Collects call counts, wall and CPU time and bytes written per (kind, name)
+    and, optionally, every span for a Chrome trace. Thread-safe.
+    """
+
+    def __init__(self, trace=True):
+        self._trace = trace
+        self._stats = {}
+        self._events = []
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+
+    def start(self, kind, name):
+        return kind, name, threading.get_ident(), time.perf_counter(), time.thread_time()
+
+    def end(self, token, nbytes=0):
+        wall1 = time.perf_counter()
+        cpu1 = time.thread_time()
+        kind, name, tid, wall0, cpu0 = token
+        with self._lock:
+            stat = self._stats.get((kind, name))
+            if stat is None:
+                stat = self._stats[kind, name] = Stat(kind, name)
+            stat.calls += 1
+            stat.wall += wall1 - wall0
+            stat.cpu += cpu1 - cpu0
+            stat.nbytes += nbytes
+            if self._trace:
+                self._events.append((kind, name, tid, wall0, wall1, nbytes))
+
+    def stats(self, kind=None, sort='wall'):
+        """
+        Stat rows, biggest first by `sort` ('wall', 'cpu', 'calls' or 'nbytes')
+        """
+        with self._lock:
+            rows = [s for s in self._stats.values() if kind is None or s.kind == kind]
+        return sorted(rows, key=lambda s: (-getattr(s, sort), s.kind, s.name))
+
+    def report(self, kind=None, sort='wall'):
+        lines = ['%-12s %-32s %8s %10s %10s %12s' % ('kind', 'name', 'calls', 'wall [s]', 'cpu [s]', 'bytes')]
+        for s in self.stats(kind, sort):
+            lines.append('%-12s %-32s %8d %10.6f %10.6f %12d' % (s.kind, s.name, s.calls, s.wall, s.cpu, s.nbytes))
+        return '\n'.join(lines)
+
+    def chrome_trace(self):
+        """
+        The spans as Chrome trace events (chrome://tracing, Perfetto)
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+        return {'traceEvents': [{
+            'name': name,
+            'cat': kind,
+            'ph': 'X',
+            'ts': (wall0 - self._t0) * 1e6,
+            'dur': (wall1 - wall0) * 1e6,
+            'pid': pid,
+            'tid': tid,
+            'args': {'bytes': nbytes}
+        } for kind, name, tid, wall0, wall1, nbytes in events]}
+
+    def write_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+    def clear(self):
+        with self._lock:
+            self._stats = {}
+            self._events = []
@@ -0,0 +1,141 @@
+"""
+Derive an execution schedule from a model's dataflows.
+"""
+
+
+def strongly_connected_components(nodes, successors):
+    """
+    Tarjan's algorithm, iterative so that long chains don't hit the recursion
+    limit. Components come out in reverse topological order.
+    """
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+    counter = 0
+
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(successors[root]))]
+
+        while work:
+            v, it = work[-1]
+            for w in it:
+                if w not in index:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(successors[w])))
+                    break
+                elif w in on_stack:
+                    low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[v])
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        component.append(w)
+                        if w == v:
+                            break
+                    components.append(component)
+
+    return components
+
+
+def sweep_stages(plan, order):
+    """
+    Split one pass over the nodes in `order` into stages. A node goes in the
+    stage after the latest node earlier in `order` that it pulls from; pulls
+    from later nodes read the previous pass and don't count. Nodes within a
+    stage can therefore run concurrently.
+    """
+    position = {plan[nm].index: n for n, nm in enumerate(order)}
+    stage_of = []
+    for n, nm in enumerate(order):
+        forward = [stage_of[position[flow.src_index]] for flow in plan[nm].dataflows
+                   if flow.src_index in position and position[flow.src_index] < n]
+        stage_of.append(max(forward) + 1 if forward else 0)
+
+    stages = [[] for _ in range(max(stage_of) + 1 if stage_of else 0)]
+    for n, nm in enumerate(order):
+        stages[stage_of[n]].append(nm)
+    return stages
+
+
+class ScheduleBlock(object):
+    """
+    A group of nodes that is executed as one unit. Acyclic blocks hold a single
+    node and run once; cyclic blocks are iterated to convergence.
+
+    `stages` splits one sweep of the block into groups of nodes that don't
+    depend on each other within the sweep. `level` is the depth of the block
+    in the condensed graph, so blocks sharing a level are independent.
+    """
+
+    def __init__(self, names, indices, cyclic, level, stages):
+        self.names = tuple(names)
+        self.indices = tuple(indices)
+        self.cyclic = cyclic
+        self.level = level
+        self.stages = tuple(tuple(s) for s in stages)
+
+    def __repr__(self):
+        return '<ScheduleBlock %s%s level=%d>' % (
+            ', '.join(self.names), ' (cyclic)' if self.cyclic else '', self.level)
+
+
+def build_schedule(plan):
+    """
+    Topologically ordered list of ScheduleBlocks for an ExecutionPlan
+    """
+    successors = {node.index: [] for node in plan}
+    predecessors = {node.index: set() for node in plan}
+    for node in plan:
+        for flow in node.dataflows:
+            successors[flow.src_index].append(node.index)
+            predecessors[node.index].add(flow.src_index)
+
+    components = strongly_connected_components([node.index for node in plan], successors)
+    block_of = {}
+    for b, component in enumerate(components):
+        for i in component:
+            block_of[i] = b
+
+    # reverse topological order means every upstream block has been seen already
+    levels = [0] * len(components)
+    for b in range(len(components) - 1, -1, -1):
+        for i in components[b]:
+            for p in predecessors[i]:
+                pb = block_of[p]
+                if pb != b:
+                    levels[b] = max(levels[b], levels[pb] + 1)
+
+    blocks = []
+    for b, component in enumerate(components):
+        # within a cycle, run in the order the subsystems were added
+        order = sorted(component)
+        cyclic = len(order) > 1 or order[0] in predecessors[order[0]]
+
+        names = [plan[i].name for i in order]
+        blocks.append(ScheduleBlock(
+            names=names,
+            indices=order,
+            cyclic=cyclic,
+            level=levels[b],
+            stages=sweep_stages(plan, names)
+        ))
+
+    blocks.sort(key=lambda block: (block.level, block.indices[0]))
+    return blocks
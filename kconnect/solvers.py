@@ -0,0 +1,548 @@
+"""
+Iterative drivers for models with cyclic data dependencies.
+"""
+import math
+import numbers
+
+
+def flatten(value):
+    """
+    Turn a port value into a flat list of floats so that residuals can be taken
+    """
+    if isinstance(value, numbers.Number):
+        return [float(value)]
+    if isinstance(value, dict):
+        return [x for k in sorted(value) for x in flatten(value[k])]
+    if isinstance(value, (list, tuple)):
+        return [x for v in value for x in flatten(v)]
+    if hasattr(value, '__dict__'):
+        return flatten(vars(value))
+    raise TypeError('Cannot take a residual of %r' % (value,))
+
+
+def is_relaxable(value):
+    """
+    Relaxation writes a new value back into the model, so it only applies to
+    plain numbers and flat sequences of numbers.
+    """
+    if isinstance(value, numbers.Number):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(isinstance(v, numbers.Number) for v in value)
+    return False
+
+
+def rebuild(template, vec):
+    if isinstance(template, numbers.Number):
+        return vec[0]
+    return type(template)(vec)
+
+
+def norm(vec):
+    return max(abs(x) for x in vec) if vec else 0.
+
+
+def dot(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def solve_linear(a, b):
+    """
+    Solve a small dense system a.x = b by Gaussian elimination with partial pivoting
+    """
+    n = len(b)
+    m = [list(row) + [rhs] for row, rhs in zip(a, b)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-300:
+            raise ValueError('Singular matrix')
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(col + 1, n):
+            f = m[r][col] / m[col][col]
+            if f:
+                for c in range(col, n + 1):
+                    m[r][c] -= f * m[col][c]
+    x = [0.] * n
+    for r in range(n - 1, -1, -1):
+        x[r] = (m[r][n] - sum(m[r][c] * x[c] for c in range(r + 1, n))) / m[r][r]
+    return x
+
+
+class Relaxation(object):
+    """
+    Base class for fixed-point acceleration. Takes the current iterate x and the
+    model's response g(x) and returns the next iterate.
+    """
+
+    def reset(self):
+        pass
+
+    def update(self, x, gx):
+        return list(gx)
+
+
+class Aitken(Relaxation):
+    """
+    Dynamic (Irons-Tuck) Aitken relaxation. The factor can optionally be clamped.
+    """
+
+    def __init__(self, omega=1.0, omega_min=None, omega_max=None):
+        self._omega0 = omega
+        self._omega_min = omega_min
+        self._omega_max = omega_max
+        self.reset()
+
+    def reset(self):
+        self.omega = self._omega0
+        self._prev_r = None
+
+    def update(self, x, gx):
+        r = [g - xi for g, xi in zip(gx, x)]
+        if self._prev_r is not None:
+            dr = [a - b for a, b in zip(r, self._prev_r)]
+            denom = dot(dr, dr)
+            if denom > 0.:
+                omega = -self.omega * dot(self._prev_r, dr) / denom
+                if self._omega_min is not None:
+                    omega = max(omega, self._omega_min)
+                if self._omega_max is not None:
+                    omega = min(omega, self._omega_max)
+                self.omega = omega
+        self._prev_r = r
+        return [xi + self.omega * ri for xi, ri in zip(x, r)]
+
+
+class Anderson(Relaxation):
+    """
+    Anderson mixing over the last `depth` iterates
+    """
+
+    def __init__(self, depth=5, beta=1.0, regularization=1e-12):
+        self._depth = depth
+        self._beta = beta
+        self._regularization = regularization
+        self.reset()
+
+    def reset(self):
+        self._xs = []
+        self._rs = []
+
+    def update(self, x, gx):
+        beta = self._beta
+        r = [g - xi for g, xi in zip(gx, x)]
+        self._xs.append(list(x))
+        self._rs.append(r)
+        if len(self._xs) > self._depth + 1:
+            del self._xs[0]
+            del self._rs[0]
+
+        x_new = [xi + beta * ri for xi, ri in zip(x, r)]
+        m = len(self._xs) - 1
+        if m == 0:
+            return x_new
+
+        dx = [[a - b for a, b in zip(self._xs[i + 1], self._xs[i])] for i in range(m)]
+        dr = [[a - b for a, b in zip(self._rs[i + 1], self._rs[i])] for i in range(m)]
+        a = [[dot(dr[i], dr[j]) for j in range(m)] for i in range(m)]
+        for i in range(m):
+            a[i][i] += self._regularization
+        try:
+            gamma = solve_linear(a, [dot(dr[i], r) for i in range(m)])
+        except ValueError:
+            self.reset()
+            return x_new
+
+        for i in range(m):
+            g = gamma[i]
+            for j in range(len(x_new)):
+                x_new[j] -= g * (dx[i][j] + beta * dr[i][j])
+        return x_new
+
+
+class ConvergenceReport(object):
+
+    def __init__(self, monitors):
+        self.converged = False
+        self.iterations = 0
+        self.runs = 0
+        self.residuals = []
+        self.monitor_residuals = {m: [] for m in monitors}
+
+    @property
+    def residual(self):
+        return self.residuals[-1] if self.residuals else math.inf
+
+    def __repr__(self):
+        return '<ConvergenceReport converged=%s iterations=%d runs=%d residual=%g>' % (
+            self.converged, self.iterations, self.runs, self.residual)
+
+
+class Monitor(object):
+    """
+    An output port ('Subsys.port') that is watched between iterations.
+    Reads are reported to `hooks`, e.g. RunnableModel.hooks.
+    """
+
+    def __init__(self, plan, src, hooks=None):
+        subsys_nm, port_nm = src.split('.')
+        self.key = src
+        self.node = plan[subsys_nm]
+        self.port = self.node.subsys.get_output_port(port_nm)
+        self.hooks = hooks
+
+    def read(self, datastore, idx=-1):
+        return self.node.subsys.read_port(self.port, datastore[self.node.name][idx], self.hooks, self.node.name)
+
+
+class FixedPointSolver(object):
+    """
+    Sweep a group of nodes until the monitored ports settle.
+
+    Each sweep runs every node in `order` once. The residual of a monitored
+    port is the change between its value in the latest DataStack entry and
+    the value that was fed into the sweep. With no relaxation that is just the
+    difference between the last two DataStack entries. With a Relaxation the
+    accelerated values of the numeric monitors are fed to downstream nodes as
+    overrides on the RunnableModel for the next sweep.
+
+    Given `stages` and an executor, a sweep runs each stage with
+    RunnableModel.run_many instead of one node at a time.
+
+    Convergence is only declared on a sweep of real runs. Once a sweep that
+    surrogates answered in part is within tol, surrogates are turned off on
+    the RunnableModel until the end of the solve.
+    """
+
+    def __init__(self, runnable, order, monitors, tol=1e-6, max_iter=100, relaxation=None,
+                 stages=None, executor=None):
+        if not monitors:
+            raise ValueError('Need at least one output port to monitor for convergence')
+        self._runnable = runnable
+        self._order = list(order)
+        self._monitors = [Monitor(runnable.plan, m, runnable.hooks) for m in monitors]
+        self._tol = tol
+        self._max_iter = max_iter
+        self._relaxation = relaxation
+        self._stages = stages
+        self._executor = executor
+
+    @property
+    def max_iter(self):
+        return self._max_iter
+
+    def sweep(self, datastore):
+        if self._stages is not None:
+            for stage in self._stages:
+                self._runnable.run_many(stage, datastore, self._executor)
+        else:
+            for nm in self._order:
+                self._runnable.run(nm, datastore)
+
+    def solve(self, datastore, state=None, on_sweep=None):
+        """
+        Sweep until converged or out of iterations. `state` (see state())
+        carries on an earlier solve; `on_sweep(solver)` is called after each
+        sweep that didn't converge.
+        """
+        if state is None:
+            self.begin(datastore)
+        else:
+            self.restore(state)
+        try:
+            while self.report.iterations < self._max_iter:
+                self.sweep(datastore)
+                if self.update(datastore):
+                    break
+                if on_sweep is not None:
+                    on_sweep(self)
+        finally:
+            self.end()
+        return self.report
+
+    def state(self):
+        """
+        What it takes to carry on between sweeps, as a picklable dict. The
+        relaxation's own state is not included.
+        """
+        return {'report': self.report, 'x': self._x, 'saved_overrides': self._saved_overrides,
+                'relaxed': set(self._relaxed), 'saved_surrogates': self._saved_surrogates,
+                'surrogates': self._runnable.surrogates}
+
+    def restore(self, state):
+        """
+        Carry on from state() in place of begin()
+        """
+        self.report = state['report']
+        self._x = dict(state['x'])
+        self._saved_overrides = dict(state['saved_overrides'])
+        self._relaxed = set(state['relaxed'])
+        self._saved_surrogates = state['saved_surrogates']
+        self._runnable.surrogates = state['surrogates']
+
+    def begin(self, datastore):
+        """
+        Start a solve. begin/update/end let other drivers (e.g. an async one)
+        do the sweeps themselves.
+        """
+        self.report = ConvergenceReport([m.key for m in self._monitors])
+        if self._relaxation is not None:
+            self._relaxation.reset()
+        self._saved_overrides = self._runnable.get_overrides()
+        self._relaxed = set()
+        self._saved_surrogates = self._runnable.surrogates
+
+        # values fed into the current sweep, if we know them
+        self._x = {}
+        for m in self._monitors:
+            stack = datastore[m.node.name] if m.node.name in datastore else None
+            if stack:
+                self._x[m.key] = m.read(datastore)
+
+    def update(self, datastore):
+        """
+        Take the residuals after a sweep and set up the next one. Returns True
+        once converged.
+        """
+        report = self.report
+        report.runs += len(self._order)
+        report.iterations += 1
+
+        x = self._x
+        gx = {m.key: m.read(datastore) for m in self._monitors}
+        if len(x) == len(gx):
+            total = 0.
+            for key, value in gx.items():
+                r = norm([a - b for a, b in zip(flatten(value), flatten(x[key]))])
+                report.monitor_residuals[key].append(r)
+                total = max(total, r)
+            report.residuals.append(total)
+            if total <= self._tol:
+                if not self._predicted(datastore):
+                    report.converged = True
+                    return True
+                # check with the real seeds
+                self._runnable.surrogates = False
+
+        self._x = self._next_iterate(x, gx)
+        return False
+
+    def _predicted(self, datastore):
+        """
+        Whether a surrogate answered any of the runs of the last sweep
+        """
+        plan = self._runnable.plan
+        for nm in self._order:
+            surrogate = plan[nm].subsys.surrogate
+            if surrogate is not None and surrogate.answer(datastore[nm][-1]) is not None:
+                return True
+        return False
+
+    def end(self):
+        """
+        Put back whatever overrides the relaxation replaced, and surrogates
+        if they were turned off
+        """
+        runnable = self._runnable
+        runnable.surrogates = self._saved_surrogates
+        for key in self._relaxed:
+            if key in self._saved_overrides:
+                runnable.override(key, self._saved_overrides[key])
+            else:
+                runnable.clear_override(key)
+
+    def _next_iterate(self, x, gx):
+        relaxation = self._relaxation
+        keys = [key for key, value in gx.items() if is_relaxable(value)]
+        if relaxation is None or len(x) != len(gx) or not keys:
+            return gx
+
+        xv = [v for key in keys for v in flatten(x[key])]
+        gv = [v for key in keys for v in flatten(gx[key])]
+        new = relaxation.update(xv, gv)
+
+        nxt = dict(gx)
+        pos = 0
+        for key in keys:
+            size = len(flatten(gx[key]))
+            nxt[key] = rebuild(gx[key], new[pos:pos + size])
+            pos += size
+            self._runnable.override(key, nxt[key])
+            self._relaxed.add(key)
+        return nxt
+
+
+class NewtonSolver(object):
+    """
+    Solve a group of nodes for its tear ports with Newton's method.
+
+    The unknowns x are the values of the tear ports, fixed with overrides on
+    the RunnableModel; one sweep of `order` with them fixed gives g(x) and
+    the solver drives F(x) = g(x) - x to zero. The Jacobian of F is taken by
+    forward differences, all the perturbed sweeps side by side on scratch
+    copies of the datastore, each node's perturbed seeds run together on
+    `executor`. With broyden=True the Jacobian is then kept up to date with
+    rank-one updates and only rebuilt when a step fails to reduce the
+    residual.
+
+    A step that doesn't reduce the residual is rejected: it is tried again
+    from the same iterate with a rebuilt Jacobian or, if the Jacobian was
+    fresh already, with half the step. The sweeps at the iterates tried are
+    added to the datastore, the finite-difference ones are not; a solve
+    that stops on a rejected step sweeps the last accepted iterate again,
+    so the latest entries are always at the answer. Unknowns must be
+    numbers or flat lists of numbers.
+    """
+
+    def __init__(self, runnable, order, unknowns, tol=1e-6, max_iter=20, broyden=True, fd_step=1e-7,
+                 executor=None):
+        if not unknowns:
+            raise ValueError('Need at least one output port to solve for')
+        self._runnable = runnable
+        self._nodes = [runnable.plan[nm] for nm in order]
+        self._monitors = [Monitor(runnable.plan, u, runnable.hooks) for u in unknowns]
+        self._tol = tol
+        self._max_iter = max_iter
+        self._broyden = broyden
+        self._fd_step = fd_step
+        self._executor = executor
+        self._templates = None
+
+    def _read(self, datastore):
+        values = [m.read(datastore) for m in self._monitors]
+        if self._templates is None:
+            for m, value in zip(self._monitors, values):
+                if not is_relaxable(value):
+                    raise TypeError('%s is not a number or list of numbers' % m.key)
+            self._templates = values
+        return [v for value in values for v in flatten(value)]
+
+    def _fix(self, x):
+        pos = 0
+        for m, template in zip(self._monitors, self._templates):
+            size = len(flatten(template))
+            self._runnable.override(m.key, rebuild(template, x[pos:pos + size]))
+            pos += size
+
+    def _sweep(self, x, datastore):
+        """
+        g(x), recorded in the datastore
+        """
+        self._fix(x)
+        for node in self._nodes:
+            self._runnable.run(node.index, datastore)
+        self.report.runs += len(self._nodes)
+        return self._read(datastore)
+
+    def _sweeps(self, xs, datastore):
+        """
+        g at each of xs, on scratch copies of the datastore
+        """
+        from kconnect.model import DataStore
+
+        runnable = self._runnable
+        scratch = []
+        for _ in xs:
+            copy = DataStore()
+            for name in list(datastore.keys()):
+                if datastore[name]:
+                    copy[name].append(datastore[name][-1])
+            scratch.append(copy)
+        for node in self._nodes:
+            seeds = []
+            for x, copy in zip(xs, scratch):
+                self._fix(x)
+                seeds.append(runnable.prepare(node, copy))
+            for copy, data_container in zip(scratch, runnable.germinate_many([node] * len(xs), seeds,
+                                                                              self._executor)):
+                copy[node.name].append(data_container)
+            for seed in seeds:
+                seed.release()
+        self.report.runs += len(self._nodes) * len(xs)
+        return [self._read(copy) for copy in scratch]
+
+    def _jacobian(self, x, f, datastore):
+        steps = [self._fd_step * max(abs(v), 1.) for v in x]
+        xs = []
+        for i, h in enumerate(steps):
+            xi = list(x)
+            xi[i] += h
+            xs.append(xi)
+        columns = [[gv - xv - fv for gv, xv, fv in zip(g, xi, f)]
+                   for g, xi in zip(self._sweeps(xs, datastore), xs)]
+        # columns[i] is dF/dx_i * h_i
+        return [[columns[j][i] / steps[j] for j in range(len(x))] for i in range(len(x))]
+
+    def _record(self, x, f):
+        report = self.report
+        pos = 0
+        for m, template in zip(self._monitors, self._templates):
+            size = len(flatten(template))
+            report.monitor_residuals[m.key].append(norm(f[pos:pos + size]))
+            pos += size
+        report.residuals.append(norm(f))
+        return report.residuals[-1]
+
+    def solve(self, datastore):
+        runnable = self._runnable
+        self.report = ConvergenceReport([m.key for m in self._monitors])
+        saved = runnable.get_overrides()
+        try:
+            if not all(m.node.name in datastore and datastore[m.node.name] for m in self._monitors):
+                # nothing to start from: one plain sweep
+                for node in self._nodes:
+                    runnable.run(node.index, datastore)
+                self.report.runs += len(self._nodes)
+            x = self._read(datastore)
+            f = [g - v for g, v in zip(self._sweep(x, datastore), x)]
+            residual = self._record(x, f)
+            jacobian = None
+            damping = 1.
+            swept_at_x = True
+            while residual > self._tol and self.report.iterations < self._max_iter:
+                fresh = jacobian is None
+                if fresh:
+                    jacobian = self._jacobian(x, f, datastore)
+                try:
+                    dx = solve_linear(jacobian, [-v for v in f])
+                except ValueError:
+                    if fresh:
+                        break
+                    jacobian = None
+                    continue
+                dx = [damping * v for v in dx]
+                x_new = [a + b for a, b in zip(x, dx)]
+                f_new = [g - v for g, v in zip(self._sweep(x_new, datastore), x_new)]
+                self.report.iterations += 1
+                new_residual = self._record(x_new, f_new)
+                swept_at_x = False
+                if new_residual >= residual:
+                    # reject the step: stay at x
+                    if fresh:
+                        damping /= 2.
+                    else:
+                        jacobian = None
+                    continue
+                if not self._broyden:
+                    jacobian = None
+                else:
+                    # good Broyden: J += (df - J.dx) dx^T / dx.dx
+                    df = [a - b for a, b in zip(f_new, f)]
+                    jdx = [dot(row, dx) for row in jacobian]
+                    scale = dot(dx, dx)
+                    for i, row in enumerate(jacobian):
+                        u = (df[i] - jdx[i]) / scale
+                        for j in range(len(row)):
+                            row[j] += u * dx[j]
+                x, f, residual = x_new, f_new, new_residual
+                damping = 1.
+                swept_at_x = True
+            if not swept_at_x:
+                self._sweep(x, datastore)
+            self.report.converged = residual <= self._tol
+        finally:
+            for m in self._monitors:
+                if m.key in saved:
+                    runnable.override(m.key, saved[m.key])
+                else:
+                    runnable.clear_override(m.key)
+        return self.report
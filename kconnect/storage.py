@@ -0,0 +1,424 @@
+"""
+Keeping DataStack histories out of memory: retention policies, a spill store
+for the containers they evict and a columnar on-disk backend.
+"""
+from urllib.parse import quote
+import array
+import json
+import math
+import mmap
+import numbers
+import os
+import pickle
+import threading
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class EvictedEntry(IndexError):
+    pass
+
+
+class Retention(object):
+    """
+    Decides which DataStack entries stay in memory. The `last` most recent
+    entries always do; an older entry is kept only if keep(idx) says so.
+    """
+
+    def __init__(self, last=1):
+        if last < 1:
+            raise ValueError('The latest entry has to be kept')
+        self.last = last
+
+    def keep(self, idx):
+        return False
+
+
+class KeepLast(Retention):
+    """
+    Only the last n entries
+    """
+
+    def __init__(self, n):
+        super(KeepLast, self).__init__(last=n)
+
+
+class KeepEvery(Retention):
+    """
+    Every k-th entry, counting from the first, plus the last few
+    """
+
+    def __init__(self, k, last=1):
+        super(KeepEvery, self).__init__(last=last)
+        self.k = k
+
+    def keep(self, idx):
+        return idx % self.k == 0
+
+
+class KeepFirstLast(Retention):
+    """
+    The first few entries plus the last few
+    """
+
+    def __init__(self, first=1, last=1):
+        super(KeepFirstLast, self).__init__(last=last)
+        self.first = first
+
+    def keep(self, idx):
+        return idx < self.first
+
+
+class SpillStore(object):
+    """
+    Append-only file of zlib-compressed, pickled containers evicted from
+    DataStacks. Each stack gets its own key; the offsets are indexed in memory.
+    """
+
+    def __init__(self, path, level=6):
+        self._file = open(path, 'w+b')
+        self._level = level
+        self._index = {}
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def new_key(self):
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            return key
+
+    def put(self, key, idx, data_container):
+        blob = zlib.compress(pickle.dumps(data_container, protocol=4), self._level)
+        with self._lock:
+            self._file.seek(0, 2)
+            offset = self._file.tell()
+            self._file.write(blob)
+            self._index[key, idx] = (offset, len(blob))
+
+    def get(self, key, idx):
+        with self._lock:
+            offset, size = self._index[key, idx]
+            self._file.flush()
+            self._file.seek(offset)
+            blob = self._file.read(size)
+        return pickle.loads(zlib.decompress(blob))
+
+    def __contains__(self, key_idx):
+        return key_idx in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Backend(object):
+    """
+    Somewhere to persist DataStack entries as they are completed. A stack
+    hands an entry over once the next one is appended (the seed has finished
+    writing it by then); DataStore.flush() hands over the latest ones.
+    """
+
+    def record(self, name, idx, data_container):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+def _numeric_leaves(value, parts=()):
+    """
+    (parts, number) for each number in the value, `parts` the dict keys
+    (str) and list indices (int) leading to it
+    """
+    if isinstance(value, numbers.Real):
+        yield parts, float(value)
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            for leaf in _numeric_leaves(v, parts + (str(k),)):
+                yield leaf
+    elif isinstance(value, (list, tuple)):
+        for k, v in enumerate(value):
+            for leaf in _numeric_leaves(v, parts + (k,)):
+                yield leaf
+
+
+def _path_name(parts):
+    """
+    The dotted name of a field: list indices as they are, dict keys with
+    '%' and '.' escaped as %25 and %2E, and with the first digit escaped if
+    they would read as an index (the empty key is '%'). '' is the item.
+    """
+    names = []
+    for part in parts:
+        if isinstance(part, int):
+            names.append(str(part))
+            continue
+        name = part.replace('%', '%25').replace('.', '%2E')
+        if not name:
+            name = '%'
+        elif name.isdigit():
+            name = '%%%02X%s' % (ord(name[0]), name[1:])
+        names.append(name)
+    return '.'.join(names)
+
+
+def _column_file(directory, item, path):
+    return os.path.join(directory, '%s:%s.f8' % (quote(item, safe=''), quote(path, safe='')))
+
+
+class ColumnarWriter(Backend):
+    """
+    Writes each subsystem's history as flat float64 column files, one per
+    numeric field of each item, under `directory/<subsystem>/`. Items are
+    read as objects (see DataItem.get_obj), so JSON text works as well.
+    Only numbers are stored, as floats: ints and bools come back as floats
+    and other fields (strings, None) are dropped. Rows missing a field hold
+    NaN. meta.json records the keys and list indices leading to each field,
+    so dicts and lists come back as they were. Fields are named by their
+    dotted path (see ColumnarStack.column). Open the result with
+    ColumnarDataStore.
+
+    Rows are buffered and appended to the column files every `buffer_rows`
+    rows and on flush(), opening one file at a time, so the number of
+    fields isn't limited by how many files the process can hold open.
+    """
+
+    def __init__(self, directory, buffer_rows=1024):
+        self._directory = directory
+        self._buffer_rows = buffer_rows
+        self._subsystems = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _table(self, name):
+        table = self._subsystems.get(name)
+        if table is None:
+            directory = os.path.join(self._directory, quote(name, safe=''))
+            os.makedirs(directory, exist_ok=True)
+            table = self._subsystems[name] = {'dir': directory, 'rows': 0, 'written': 0, 'columns': {}}
+        return table
+
+    def _write(self, table):
+        """
+        Append the buffered rows of every column to its file
+        """
+        for (item, parts), pending in table['columns'].items():
+            with open(_column_file(table['dir'], item, _path_name(parts)), 'ab') as f:
+                pending.tofile(f)
+            del pending[:]
+        table['written'] = table['rows']
+
+    def record(self, name, idx, data_container):
+        with self._lock:
+            table = self._table(name)
+            rows = table['rows']
+            if idx != rows:
+                raise ValueError('%s: expected row %d, got %d' % (name, rows, idx))
+
+            values = {}
+            for item in data_container.keys():
+                try:
+                    obj = data_container[item].get_obj()
+                except (ValueError, TypeError):
+                    continue
+                for parts, v in _numeric_leaves(obj):
+                    values[item, parts] = v
+
+            columns = table['columns']
+            written = table['written']
+            for key in values:
+                if key not in columns:
+                    # a new field: NaN for the rows before it, on file and buffered
+                    with open(_column_file(table['dir'], key[0], _path_name(key[1])), 'wb') as f:
+                        array.array('d', [math.nan] * written).tofile(f)
+                    columns[key] = array.array('d', [math.nan] * (rows - written))
+            for key, pending in columns.items():
+                pending.append(values.get(key, math.nan))
+            table['rows'] = rows + 1
+            if table['rows'] - written >= self._buffer_rows:
+                self._write(table)
+
+    def flush(self):
+        with self._lock:
+            for table in self._subsystems.values():
+                self._write(table)
+                columns = sorted([item, _path_name(parts), list(parts)] for item, parts in table['columns'])
+                meta = {'rows': table['rows'], 'columns': columns}
+                with open(os.path.join(table['dir'], 'meta.json'), 'w') as f:
+                    json.dump(meta, f)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._subsystems = {}
+
+
+class ColumnarDataStore(object):
+    """
+    Read-only view of a ColumnarWriter directory. Columns are memory-mapped
+    on first use, so only what is looked at gets paged in:
+
+        datastore['EngineCycle'][i]['result'].get_obj()
+        datastore['EngineCycle'].column('result', 'FLOW')[1000:2000]
+    """
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._stacks = {}
+
+    def __getitem__(self, nm):
+        stack = self._stacks.get(nm)
+        if stack is None:
+            directory = os.path.join(self._directory, quote(nm, safe=''))
+            if not os.path.isdir(directory):
+                raise KeyError(nm)
+            stack = self._stacks[nm] = ColumnarStack(directory)
+        return stack
+
+    def __contains__(self, nm):
+        return os.path.isdir(os.path.join(self._directory, quote(nm, safe='')))
+
+    def close(self):
+        for stack in self._stacks.values():
+            stack.close()
+        self._stacks = {}
+
+
+class ColumnarStack(object):
+
+    def __init__(self, directory):
+        self._directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        self._rows = meta['rows']
+        self._columns = [(item, path) for item, path, _ in meta['columns']]
+        self._parts = {(item, path): tuple(parts) for item, path, parts in meta['columns']}
+        self._maps = {}
+
+    def __len__(self):
+        return self._rows
+
+    def __bool__(self):
+        return self._rows > 0
+
+    def columns(self, item=None):
+        return [c for c in self._columns if item is None or c[0] == item]
+
+    def parts(self, item, path):
+        """
+        The dict keys (str) and list indices (int) leading to a field
+        """
+        return self._parts[item, path]
+
+    def column(self, item, path):
+        """
+        A zero-copy float64 view of one field over all the rows: a numpy
+        array if numpy is available, a memoryview otherwise. `path` is the
+        field's dotted name, e.g. 'stations.0.pr' ('' for an item that is a
+        number), with '.' in keys escaped as %2E (see columns()).
+        """
+        key = (item, path)
+        view = self._maps.get(key)
+        if view is None:
+            if key not in self._columns:
+                raise KeyError('%s:%s' % key)
+            with open(_column_file(self._directory, item, path), 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._rows else b''
+            view = memoryview(mm).cast('d')[:self._rows]
+            if np is not None:
+                view = np.frombuffer(view, dtype=np.float64)
+            self._maps[key] = view
+        return view
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self._rows
+        if not 0 <= idx < self._rows:
+            raise IndexError('ColumnarStack index out of range')
+        return ColumnarContainer(self, idx)
+
+    def __iter__(self):
+        return (ColumnarContainer(self, i) for i in range(self._rows))
+
+    def close(self):
+        self._maps = {}
+
+
+class ColumnarContainer(object):
+
+    def __init__(self, stack, idx):
+        self._stack = stack
+        self._idx = idx
+
+    def __getitem__(self, item):
+        if not self._stack.columns(item):
+            raise KeyError(item)
+        return ColumnarItem(self._stack, self._idx, item)
+
+
+def _relist(obj):
+    """
+    Turn the dicts keyed by list indices (ints) back into lists
+    """
+    if not isinstance(obj, dict):
+        return obj
+    obj = {k: _relist(v) for k, v in obj.items()}
+    if obj and all(isinstance(k, int) for k in obj):
+        values = [None] * (max(obj) + 1)
+        for k, v in obj.items():
+            values[k] = v
+        return values
+    return obj
+
+
+class ColumnarItem(object):
+    """
+    One row of an item, rebuilt from its numeric columns: numbers come back
+    as floats, dicts as dicts, lists as lists and non-numeric fields are
+    gone. Fields that were NaN (or missing) in that row are left out, or
+    None where they fall inside a list; an item that was a number is that
+    number, or None.
+    """
+
+    def __init__(self, stack, idx, item):
+        self._stack = stack
+        self._idx = idx
+        self._item = item
+
+    def get_obj(self):
+        obj = {}
+        for item, path in self._stack.columns(self._item):
+            v = float(self._stack.column(item, path)[self._idx])
+            if math.isnan(v):
+                continue
+            parts = self._stack.parts(item, path)
+            if not parts:
+                return v
+            d = obj
+            for part in parts[:-1]:
+                d = d.setdefault(part, {})
+            d[parts[-1]] = v
+        if not obj and (self._item, '') in self._stack.columns(self._item):
+            return None
+        return _relist(obj)
+
+    get_json = get_obj
+
+    def read(self):
+        return json.dumps(self.get_obj())
@@ -0,0 +1,249 @@
+"""
+Cheap stand-ins for expensive subsystems, learnt as the model runs.
+"""
+from collections import deque
+from itertools import combinations_with_replacement
+import math
+
+from kconnect.solvers import dot, flatten, is_relaxable, norm, rebuild, solve_linear
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PREDICTED = '__surrogate__'
+
+
+def _lstsq(rows, targets, ridge=1e-10):
+    """
+    Least-squares coefficients, one column per target, for rows . c = targets
+    """
+    if np is not None:
+        return np.linalg.lstsq(np.array(rows), np.array(targets), rcond=None)[0].tolist()
+    n = len(rows[0])
+    normal = [[dot([r[i] for r in rows], [r[j] for r in rows]) for j in range(n)] for i in range(n)]
+    scale = max(normal[i][i] for i in range(n)) or 1.
+    for i in range(n):
+        normal[i][i] += ridge * scale
+    columns = [solve_linear(normal, [dot([r[i] for r in rows], [t[k] for t in targets]) for i in range(n)])
+               for k in range(len(targets[0]))]
+    return [list(row) for row in zip(*columns)]
+
+
+def _apply(coefficients, features):
+    return [dot(features, [c[k] for c in coefficients]) for k in range(len(coefficients[0]))]
+
+
+class Fit(object):
+    """
+    A regression of output vectors on input vectors
+    """
+
+    min_samples = 1
+
+    def fit(self, xs, ys):
+        raise NotImplementedError
+
+    def predict(self, x):
+        raise NotImplementedError
+
+
+class PolynomialFit(Fit):
+    """
+    Least squares on all the monomials of the inputs up to `degree`
+    """
+
+    def __init__(self, degree=2):
+        self._degree = degree
+        self._coefficients = None
+
+    def _features(self, x):
+        features = [1.]
+        for d in range(1, self._degree + 1):
+            for combination in combinations_with_replacement(range(len(x)), d):
+                features.append(math.prod(x[i] for i in combination))
+        return features
+
+    def fit(self, xs, ys):
+        self._coefficients = _lstsq([self._features(x) for x in xs], ys)
+
+    def predict(self, x):
+        return _apply(self._coefficients, self._features(x))
+
+
+class LinearFit(PolynomialFit):
+
+    def __init__(self):
+        super(LinearFit, self).__init__(degree=1)
+
+
+class RbfFit(Fit):
+    """
+    A linear fit with Gaussian radial basis functions through its residuals,
+    so the samples are reproduced and far from them it tends to the linear fit.
+    `epsilon` is the basis width, the mean distance between samples if None.
+    """
+
+    min_samples = 2
+
+    def __init__(self, epsilon=None, smoothing=1e-10):
+        self._epsilon = epsilon
+        self._smoothing = smoothing
+        self._linear = LinearFit()
+
+    def _kernel(self, a, b):
+        return math.exp(-(sum((p - q) ** 2 for p, q in zip(a, b)) / self._width ** 2))
+
+    def fit(self, xs, ys):
+        self._linear.fit(xs, ys)
+        residuals = [[y - p for y, p in zip(ys_, self._linear.predict(x))] for x, ys_ in zip(xs, ys)]
+        width = self._epsilon
+        if width is None:
+            distances = [math.dist(a, b) for i, a in enumerate(xs) for b in xs[i + 1:]]
+            width = sum(distances) / len(distances) if distances else 1.
+        self._width = width or 1.
+        gram = [[self._kernel(a, b) + (self._smoothing if i == j else 0.) for j, b in enumerate(xs)]
+                for i, a in enumerate(xs)]
+        try:
+            columns = [solve_linear(gram, [r[k] for r in residuals]) for k in range(len(ys[0]))]
+        except ValueError:
+            columns = [[0.] * len(xs) for _ in ys[0]]
+        self._centres = [list(x) for x in xs]
+        self._weights = [list(row) for row in zip(*columns)]
+
+    def predict(self, x):
+        phi = [self._kernel(x, c) for c in self._centres]
+        return [p + r for p, r in zip(self._linear.predict(x), _apply(self._weights, phi))]
+
+
+FITS = {'linear': LinearFit, 'polynomial': PolynomialFit, 'rbf': RbfFit}
+
+
+class Surrogate(object):
+    """
+    Stands in for a subsystem once it has learnt it well enough: runs of the
+    node are answered with predicted output port values instead of running
+    the seed. Attach with GenericSubsys.set_surrogate.
+
+    Each real run adds a sample, the flattened cargo applied to the seed
+    against the numeric output port values read from the new DataStack
+    entry, keeping the `max_samples` latest. Once there are `min_samples`
+    the fit is made. A run is predicted only if
+
+    - the error of the fit on the latest real run, relative to its output,
+      is within `tolerance`,
+    - the inputs are within `trust_radius` (relative) of a sample,
+    - fewer than `check_every` runs have been predicted since the last
+      real run, and
+    - the predicted outputs differ from those of the last real run by more
+      than `margin` times that error: close to convergence the changes get
+      smaller than the fit can resolve and the real seed takes over.
+
+    Anything else runs the real seed, which checks and refines the fit.
+    Subsystems with output ports that aren't numbers or lists of numbers
+    can't be stood in for. `fit` is 'linear', 'polynomial', 'rbf' or a Fit.
+    """
+
+    def __init__(self, fit='linear', min_samples=None, max_samples=50, tolerance=1e-3, trust_radius=0.1,
+                 check_every=5, margin=10.):
+        self._fit = FITS[fit]() if isinstance(fit, str) else fit
+        self._min_samples = min_samples
+        self._samples = deque(maxlen=max_samples)
+        self._tolerance = tolerance
+        self._trust_radius = trust_radius
+        self._check_every = check_every
+        self._margin = margin
+        self._templates = None
+        self._fitted = False
+        self._since_check = 0
+        self.usable = True
+        self.error = math.inf
+        self.evaluated = 0
+        self.predicted = 0
+
+    def _inputs(self, applied):
+        try:
+            return [v for _, cargo in sorted(applied, key=lambda a: a[0]) for v in flatten(cargo)]
+        except TypeError:
+            return None
+
+    def _needed(self, x):
+        if self._min_samples is not None:
+            return self._min_samples
+        return max(self._fit.min_samples, len(x) + 2)
+
+    def _trusted(self, x):
+        if self._trust_radius is None:
+            return True
+        return any(norm([a - b for a, b in zip(x, sample)]) <= self._trust_radius * max(norm(sample), 1.)
+                   for sample, _ in self._samples)
+
+    def predict(self, applied, data_container):
+        """
+        Write predicted port values into the container if the surrogate can
+        be trusted with these inputs. Returns whether it did.
+        """
+        if not (self.usable and self._fitted and self.error <= self._tolerance
+                and self._since_check < self._check_every):
+            return False
+        x = self._inputs(applied)
+        if x is None or len(x) != len(self._samples[0][0]) or not self._trusted(x):
+            return False
+        y = self._fit.predict(x)
+        last = self._samples[-1][1]
+        if norm([p - v for p, v in zip(y, last)]) <= self._margin * self.error * max(norm(last), 1.):
+            return False
+        values = {}
+        pos = 0
+        for name, template in self._templates:
+            size = len(flatten(template))
+            values[name] = rebuild(template, y[pos:pos + size])
+            pos += size
+        data_container[PREDICTED].put_obj(values)
+        self._since_check += 1
+        self.predicted += 1
+        return True
+
+    def learn(self, applied, subsys, data_container):
+        """
+        Add the real run that filled the container, checking the fit against it
+        """
+        self.evaluated += 1
+        self._since_check = 0
+        x = self._inputs(applied)
+        if x is None or not self.usable:
+            return
+        outputs = [(nm, subsys.get(nm, data_container)) for nm in sorted(subsys.list_output_ports())]
+        if not all(is_relaxable(value) for _, value in outputs):
+            self.usable = False
+            return
+        y = [v for _, value in outputs for v in flatten(value)]
+        if self._samples and (len(x) != len(self._samples[0][0]) or len(y) != len(self._samples[0][1])):
+            # the inputs or outputs changed shape: start again
+            self._samples.clear()
+            self._fitted = False
+        self._templates = outputs
+        if self._fitted:
+            self.error = norm([p - v for p, v in zip(self._fit.predict(x), y)]) / max(norm(y), 1.)
+        self._samples.append((x, y))
+        if len(self._samples) >= self._needed(x):
+            self._fit.fit([s[0] for s in self._samples], [s[1] for s in self._samples])
+            self._fitted = True
+
+    @staticmethod
+    def answer(data_container):
+        """
+        The port values predicted into a container, None for a real result
+        """
+        try:
+            return data_container[PREDICTED].get_obj()
+        except (KeyError, AttributeError):
+            return None
+
+    def reset(self):
+        self._samples.clear()
+        self._fitted = False
+        self._since_check = 0
+        self.error = math.inf
+        self.usable = True
@@ -0,0 +1,210 @@
+"""
+Design-of-experiments sweeps: run one Model for many seed selections and
+input overrides, fanned out over a pool of workers.
+"""
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import itertools
+import multiprocessing
+import os
+import pickle
+import traceback
+
+from kconnect.model import DataStore, Model
+
+_worker_model = None
+
+
+class Case(object):
+    """
+    One design point: seed selections for (some of) the subsystems and
+    values to feed in place of output ports, as in RunnableModel.override.
+    """
+
+    def __init__(self, model_config=None, overrides=None, case_id=None):
+        self.model_config = dict(model_config or {})
+        self.overrides = dict(overrides or {})
+        self.case_id = case_id
+
+
+class CaseResult(object):
+
+    def __init__(self, case_id, value=None, error=None, resumed=False):
+        self.case_id = case_id
+        self.value = value
+        self.error = error
+        self.resumed = resumed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return '<CaseResult %r %s>' % (self.case_id, 'ok' if self.ok else 'failed')
+
+
+class ProgressLog(object):
+    """
+    Append-only file of pickled CaseResults. A sweep that is killed part way
+    through can be started again with the same log and only runs what's left.
+    """
+
+    def __init__(self, path):
+        self._path = path
+
+    def read(self):
+        results = {}
+        if not os.path.exists(self._path):
+            return results
+        with open(self._path, 'rb') as f:
+            good = 0
+            while True:
+                try:
+                    case_id, value, error = pickle.load(f)
+                except EOFError:
+                    break
+                except (pickle.UnpicklingError, ValueError, TypeError):
+                    break
+                good = f.tell()
+                if error is None:
+                    results[case_id] = CaseResult(case_id, value, resumed=True)
+            torn = good < os.fstat(f.fileno()).st_size
+
+        if torn:
+            # drop a record cut short when the sweep was killed, so new ones follow on cleanly
+            with open(self._path, 'r+b') as f:
+                f.truncate(good)
+        return results
+
+    def append(self, result):
+        with open(self._path, 'ab') as f:
+            pickle.dump((result.case_id, result.value, result.error), f, protocol=4)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def run_case(model, case, evaluate=None, default_selection=None, tol=1e-6, max_iter=100):
+    """
+    Run a whole model for one Case in a fresh DataStore. Returns
+    evaluate(runnable_model, datastore, reports), or the DataStore itself.
+    """
+    if default_selection is not None:
+        model_config = defaultdict(lambda: default_selection, case.model_config)
+    else:
+        model_config = case.model_config
+    runnable_model = model.configure(model_config)
+    for src, value in case.overrides.items():
+        runnable_model.override(src, value)
+    datastore = DataStore()
+    reports = runnable_model.run_schedule(datastore, tol=tol, max_iter=max_iter)
+    if evaluate is None:
+        return datastore
+    return evaluate(runnable_model, datastore, reports)
+
+
+def _init_worker(factory):
+    global _worker_model
+    _worker_model = factory()
+
+
+def _run_chunk(model, chunk, kwargs):
+    if model is None:
+        model = _worker_model
+    results = []
+    for case in chunk:
+        try:
+            results.append(CaseResult(case.case_id, run_case(model, case, **kwargs)))
+        except Exception:
+            results.append(CaseResult(case.case_id, error=traceback.format_exc()))
+    return results
+
+
+def _cases(cases, done):
+    for n, case in enumerate(cases):
+        if not isinstance(case, Case):
+            case = Case(model_config=case)
+        if case.case_id is None:
+            case.case_id = n
+        if case.case_id not in done:
+            yield case
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def sweep(model, cases, evaluate=None, default_selection=None, executor='process', max_workers=None,
+          chunksize=1, progress_log=None, tol=1e-6, max_iter=100):
+    """
+    Run every case and yield a CaseResult for each one as it completes.
+
+    `model` is a Model or a zero-argument factory returning one. `cases` is
+    any iterable of Cases or plain model_config dicts and is only consumed as
+    fast as the workers keep up. Cases without a case_id are numbered by
+    position, which is what the progress log uses to skip finished work, so
+    keep the case order stable between restarts.
+
+    Process workers run the cases `chunksize` at a time. They get a factory
+    by pickling it, or a Model by forking, so a Model only works where the
+    'fork' start method is available. `evaluate`, the cases and the results
+    must all be picklable. Failed cases come back with the traceback in
+    CaseResult.error and are not recorded in the log.
+    """
+    log = ProgressLog(progress_log) if progress_log is not None else None
+    done = log.read() if log is not None else {}
+    for result in done.values():
+        yield result
+
+    kwargs = dict(evaluate=evaluate, default_selection=default_selection, tol=tol, max_iter=max_iter)
+    chunks = _chunks(_cases(cases, done), chunksize)
+    is_model = isinstance(model, Model)
+
+    if executor is None:
+        instance = model if is_model else model()
+        for chunk in chunks:
+            for result in _run_chunk(instance, chunk, kwargs):
+                if log is not None and result.ok:
+                    log.append(result)
+                yield result
+        return
+
+    global _worker_model
+    if executor == 'thread':
+        pool = ThreadPoolExecutor(max_workers)
+        worker_model = model if is_model else model()
+    elif executor == 'process':
+        if is_model:
+            if 'fork' not in multiprocessing.get_all_start_methods():
+                raise ValueError('Pass a model factory: a Model can only be handed to workers by forking')
+            _worker_model = model
+            pool = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('fork'))
+        else:
+            pool = ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(model,))
+        worker_model = None
+    else:
+        raise ValueError('Unknown executor kind: %s' % executor)
+
+    max_pending = 2 * (max_workers or os.cpu_count() or 1)
+    try:
+        pending = set()
+        for chunk in itertools.chain(chunks, [None]):
+            if chunk is not None:
+                pending.add(pool.submit(_run_chunk, worker_model, chunk, kwargs))
+                if len(pending) < max_pending:
+                    continue
+            while pending and (chunk is None or len(pending) >= max_pending):
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    for result in future.result():
+                        if log is not None and result.ok:
+                            log.append(result)
+                        yield result
+    finally:
+        pool.shutdown(wait=True)
+        if is_model and executor == 'process':
+            _worker_model = None
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from collections import defaultdict
+
+import kconnect.benchmarks as bm
+import kconnect.checkpoint as ckpt
+import kconnect.model as mdl
+import kconnect.aio as aio
+import kconnect.examples as ex
+
+
+class SlowSeed(object):
+    """
+    Stands in for a seed waiting on an external job
+    """
+    running = 0
+    peak = 0
+
+    def __init__(self):
+        self.x = 1.
+
+    async def run(self, datastore):
+        SlowSeed.running += 1
+        SlowSeed.peak = max(SlowSeed.peak, SlowSeed.running)
+        await asyncio.sleep(0.01)
+        SlowSeed.running -= 1
+        datastore['result'].put_obj({'y': 2. * self.x})
+
+
+class SlowDispenser(object):
+    def get_seed(self, nm):
+        return SlowSeed()
+
+
+def Slow():
+    def set_x(obj, data):
+        obj.x = data
+
+    return mdl.GenericSubsys(
+        seed_dispenser=SlowDispenser(),
+        accessor=lambda dc: dc['result'].get_obj(),
+        input_ports=[mdl.InputPort(name='set_x', description='', type=float, fn=set_x)],
+        output_ports=[mdl.OutputPort(name='get_y', description='', type=float, fn=lambda d: d['y'])]
+    )
+
+
+class TestAsyncRunnableModel(unittest.TestCase):
+
+    def test_concurrency_limit(self):
+        model = mdl.Model()
+        model.add_subsystem('Src', Slow())
+        for i in range(8):
+            model.add_subsystem('Leaf%d' % i, Slow())
+            model.connect(src='Src.get_y', dst='Leaf%d.set_x' % i)
+        runnable_model = aio.AsyncRunnableModel(model, defaultdict(lambda: 'asdf'), concurrency=3)
+        datastore = mdl.DataStore()
+        SlowSeed.peak = 0
+        asyncio.run(runnable_model.run_schedule(datastore))
+        self.assertEqual(3, SlowSeed.peak)
+        self.assertEqual(9, runnable_model.stats['executed'])
+        for i in range(8):
+            self.assertEqual(4., model.get(datastore, 'Leaf%d' % i, 'get_y'))
+
+    def test_engine_model(self):
+        """
+        Sync seeds go through the executor and give the same answers as RunnableModel
+        """
+        model = ex.build_model()
+        serial = mdl.DataStore()
+        expected = model.configure(defaultdict(lambda: 'asdf')).run_schedule(serial, tol=1e-10)
+
+        datastore = mdl.DataStore()
+        runnable_model = aio.AsyncRunnableModel(model, defaultdict(lambda: 'asdf'))
+        reports = asyncio.run(runnable_model.run_schedule(datastore, tol=1e-10))
+        block = ('EngineCycle', 'IPC', 'HPC')
+        self.assertEqual(expected[block].iterations, reports[block].iterations)
+        for nm in block:
+            self.assertEqual([c['result'].read() for c in serial[nm]], [c['result'].read() for c in datastore[nm]])
+
+    def test_single_run(self):
+        model = mdl.Model()
+        model.add_subsystem('A', Slow())
+        runnable_model = aio.AsyncRunnableModel(model, {'A': 'asdf'}, incremental=True)
+        datastore = mdl.DataStore()
+
+        async def go():
+            await runnable_model.run('A', datastore)
+            await runnable_model.run('A', datastore)
+
+        asyncio.run(go())
+        self.assertEqual({'executed': 1, 'skipped': 1}, runnable_model.stats)
+        self.assertEqual(2, len(datastore['A']))
+
+    def test_run_batch(self):
+        runnable_model = aio.AsyncRunnableModel(ex.build_model(), defaultdict(lambda: 'asdf'))
+        datastores = [mdl.DataStore() for _ in range(3)]
+        runnable_model.override('IPC.get_perf_bid', 0.9)
+        asyncio.run(runnable_model.run_batch('EngineCycle', datastores))
+        self.assertEqual(3, runnable_model.stats['executed'])
+        self.assertEqual(1, len(set(ds['EngineCycle'][-1]['result'].read() for ds in datastores)))
+
+    def test_run_events(self):
+        runnable_model = aio.AsyncRunnableModel(bm.build_synthetic('fan', 5), defaultdict(lambda: 'default'),
+                                                push=True)
+        datastore = mdl.DataStore()
+        self.assertEqual(['N0', 'N1', 'N2', 'N3', 'N4'], asyncio.run(runnable_model.run_events(['N0'], datastore)))
+        self.assertEqual(1.75, runnable_model.plan['N4'].subsys.get('out', datastore['N4'][-1]))
+
+    def test_evaluate(self):
+        runnable_model = aio.AsyncRunnableModel(bm.build_synthetic('fan', 5), defaultdict(lambda: 'default'))
+        datastore = mdl.DataStore()
+        self.assertEqual(['N0', 'N2'], asyncio.run(runnable_model.evaluate(['N2'], datastore)))
+        self.assertEqual([], asyncio.run(runnable_model.evaluate(['N2'], datastore)))
+
+        cycle = aio.AsyncRunnableModel(ex.build_model(), defaultdict(lambda: 'asdf'))
+        self.assertEqual(['EngineCycle', 'IPC', 'HPC'], asyncio.run(cycle.evaluate(['IPC'], datastore, tol=1e-10)))
+
+    def test_get(self):
+        model = bm.build_synthetic('fan', 5)
+        runnable_model = aio.AsyncRunnableModel(model, defaultdict(lambda: 'default'))
+        datastore = mdl.DataStore()
+        self.assertEqual(1.5, asyncio.run(runnable_model.get(datastore, 'N1', 'out')))
+        self.assertEqual(['N0', 'N1'], list(datastore.keys()))
+
+    def test_newton(self):
+        runnable_model = aio.AsyncRunnableModel(ex.build_model(), defaultdict(lambda: 'asdf'))
+        self.assertRaises(TypeError, runnable_model.newton, ['EngineCycle', 'IPC', 'HPC'], mdl.DataStore())
+        self.assertEqual(0, runnable_model.stats['executed'])
+
+    def test_resume(self):
+        model = ex.build_model()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with ckpt.Checkpoint(os.path.join(tmpdir, 'run.ckpt')) as checkpoint:
+                model.configure(defaultdict(lambda: 'asdf')).converge(['EngineCycle', 'IPC', 'HPC'], mdl.DataStore(),
+                                                                      max_iter=2, checkpoint=checkpoint)
+                runnable_model = aio.AsyncRunnableModel(model, defaultdict(lambda: 'asdf'))
+                self.assertRaises(TypeError, runnable_model.resume, checkpoint)
+        self.assertEqual(0, runnable_model.stats['executed'])
+
+
+if __name__ == '__main__':
+    unittest.main()
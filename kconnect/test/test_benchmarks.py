@@ -0,0 +1,41 @@
+import copy
+import unittest
+from collections import defaultdict
+
+import kconnect.benchmarks as bm
+import kconnect.model as mdl
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_topologies(self):
+        fan = bm.build_synthetic('fan', 6)
+        self.assertEqual(4, len(fan.compile()['N5'].dataflows))
+        runnable_model = fan.configure(defaultdict(lambda: 'default'))
+        datastore = mdl.DataStore()
+        runnable_model.run_schedule(datastore)
+        # 1, 1.5 for the middle nodes, 1.75 at the sink
+        self.assertEqual(1.75, fan.get(datastore, 'N5', 'out'))
+
+        ring = bm.build_synthetic('ring', 5)
+        schedule = ring.schedule()
+        self.assertEqual(1, len(schedule))
+        self.assertTrue(schedule[0].cyclic)
+        report, = ring.configure(defaultdict(lambda: 'default')).run_schedule(datastore, tol=1e-10).values()
+        self.assertTrue(report.converged)
+        self.assertAlmostEqual(2., ring.get(datastore, 'N0', 'out'))
+
+    def test_suite(self):
+        results = bm.run_suite(repeat=1, select='connect')
+        self.assertEqual(['connect.chain', 'connect.fan', 'connect.ring'], sorted(results['results']))
+
+        baseline = copy.deepcopy(results)
+        baseline['results']['connect.fan']['min'] /= 2
+        baseline['results']['connect.ring']['params'] = {'nodes': 1}
+        rows = bm.compare(results, baseline, threshold=0.5)
+        self.assertEqual([('connect.chain', False), ('connect.fan', True)], [(r[0], r[4]) for r in rows])
+        self.assertAlmostEqual(2., rows[1][3])
+
+
+if __name__ == '__main__':
+    unittest.main()
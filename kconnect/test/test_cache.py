@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import defaultdict
+
+import kconnect.model as mdl
+import kconnect.cache as cache
+import kconnect.examples as ex
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'cache.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_stable_hash(self):
+        a = ex.CompressorPerfInputs(pr=5.0, flow=0.8)
+        b = ex.CompressorPerfInputs(pr=5.0, flow=0.8)
+        c = ex.CompressorPerfInputs(pr=5.0, flow=0.81)
+        self.assertEqual(cache.stable_hash(a), cache.stable_hash(b))
+        self.assertNotEqual(cache.stable_hash(a), cache.stable_hash(c))
+        self.assertEqual(cache.stable_hash({'x': 1, 'y': 2}), cache.stable_hash({'y': 2, 'x': 1}))
+
+    def test_hit_across_sessions(self):
+        model = ex.build_model()
+        with cache.ResultCache(self.path) as rc:
+            first = mdl.DataStore()
+            model.configure(defaultdict(lambda: 'asdf'), cache=rc).converge(
+                ['EngineCycle', 'IPC', 'HPC'], first, max_iter=3)
+            self.assertEqual(0, rc.hits)
+            self.assertEqual(9, rc.misses)
+
+        with cache.ResultCache(self.path) as rc:
+            second = mdl.DataStore()
+            model.configure(defaultdict(lambda: 'asdf'), cache=rc).converge(
+                ['EngineCycle', 'IPC', 'HPC'], second, max_iter=3)
+            self.assertEqual(9, rc.hits)
+            self.assertEqual(0, rc.misses)
+
+            # a different seed selection is a different entry
+            model.configure(defaultdict(lambda: 'qwerty'), cache=rc).run('EngineCycle', mdl.DataStore())
+            self.assertEqual(1, rc.misses)
+
+        for nm in ['EngineCycle', 'IPC', 'HPC']:
+            self.assertEqual([c['result'].read() for c in first[nm]], [c['result'].read() for c in second[nm]])
+
+    def test_run_many(self):
+        model = ex.build_model()
+        with cache.ResultCache(self.path) as rc:
+            runnable_model = model.configure(defaultdict(lambda: 'asdf'), cache=rc)
+            datastore = mdl.DataStore()
+            runnable_model.run('EngineCycle', datastore)
+            runnable_model.run_many(['IPC', 'HPC'], datastore, 'thread')
+            runnable_model.run_many(['IPC', 'HPC'], datastore, 'thread')
+            self.assertEqual(2, rc.hits)
+            self.assertEqual(datastore['IPC'][-1]['result'].read(), datastore['IPC'][-2]['result'].read())
+
+    def test_eviction(self):
+        with cache.ResultCache(self.path, max_entries=2) as rc:
+            for i in range(3):
+                dc = mdl.DataContainer()
+                dc['result'].write(str(i))
+                rc.store('key%d' % i, dc)
+            self.assertEqual(2, len(rc))
+            self.assertFalse(rc.load('key0', mdl.DataContainer()))
+
+            # using key1 makes key2 the least recently used
+            self.assertTrue(rc.load('key1', mdl.DataContainer()))
+            rc.store('key3', mdl.DataContainer())
+            self.assertTrue(rc.load('key1', mdl.DataContainer()))
+            self.assertFalse(rc.load('key2', mdl.DataContainer()))
+
+        os.remove(self.path)
+        with cache.ResultCache(self.path, max_bytes=1000) as rc:
+            for i in range(20):
+                dc = mdl.DataContainer()
+                dc['result'].write('x' * 100)
+                rc.store('key%d' % i, dc)
+            self.assertLessEqual(rc.size(), 1000)
+            self.assertTrue(rc.load('key19', mdl.DataContainer()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import defaultdict
+
+import kconnect.checkpoint as cp
+import kconnect.model as mdl
+import kconnect.solvers as slv
+import kconnect.examples as ex
+
+
+class Crash(Exception):
+    pass
+
+
+class CrashingDispenser(object):
+    """
+    Hands out seeds that fail after a number of runs, as if the process died
+    """
+
+    def __init__(self, dispenser, runs):
+        self._dispenser = dispenser
+        self.runs = runs
+
+    def get_seed(self, nm):
+        self.runs -= 1
+        if self.runs < 0:
+            raise Crash()
+        return self._dispenser.get_seed(nm)
+
+
+def crashing_model(runs):
+    model = ex.build_model()
+    subsys = model.get_subsystem('IPC')
+    subsys._seed_dispenser = CrashingDispenser(subsys._seed_dispenser, runs)
+    return model
+
+
+def flows(datastore):
+    return [dc['result'].get_obj()['FLOW'] for dc in datastore['EngineCycle']]
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'run.ckpt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def converge(self, model, datastore, checkpoint=None):
+        return model.configure(defaultdict(lambda: 'asdf')).converge(
+            ['EngineCycle', 'IPC', 'HPC'], datastore, tol=1e-12, relaxation=slv.Anderson(depth=2),
+            checkpoint=checkpoint)
+
+    def test_converge(self):
+        expected_ds = mdl.DataStore()
+        expected = self.converge(ex.build_model(), expected_ds)
+
+        with cp.Checkpoint(self.path, every=2) as checkpoint:
+            self.assertRaises(Crash, self.converge, crashing_model(5), mdl.DataStore(), checkpoint)
+            self.assertEqual(4, checkpoint.position['solver']['report'].iterations)
+            self.assertEqual(12, len(checkpoint))
+
+        with cp.Checkpoint(self.path) as checkpoint:
+            runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+            datastore, report = runnable_model.resume(checkpoint)
+            # only the sweeps after the last save are run again
+            self.assertEqual(3 * (expected.iterations - 4), runnable_model.stats['executed'])
+            self.assertTrue(report.converged)
+            self.assertEqual(expected.residuals, report.residuals)
+            self.assertEqual(flows(expected_ds), flows(datastore))
+            self.assertEqual({}, runnable_model.get_overrides())
+
+        # finished runs resume to their result
+        with cp.Checkpoint(self.path) as checkpoint:
+            runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+            datastore, report = runnable_model.resume(checkpoint)
+            self.assertEqual(0, runnable_model.stats['executed'])
+            self.assertEqual(expected.residuals, report.residuals)
+            self.assertEqual(flows(expected_ds), flows(datastore))
+
+    def test_schedule(self):
+        expected_ds = mdl.DataStore()
+        expected = ex.build_model().configure(defaultdict(lambda: 'asdf')).run_schedule(expected_ds, tol=1e-12)
+
+        with cp.Checkpoint(self.path) as checkpoint:
+            runnable_model = crashing_model(6).configure(defaultdict(lambda: 'asdf'))
+            self.assertRaises(Crash, runnable_model.run_schedule, mdl.DataStore(), tol=1e-12, checkpoint=checkpoint)
+
+        # simulate getting killed half way through the next save
+        with open(self.path, 'ab') as f:
+            f.write(b'C\x10\x00\x00\x00\x78\x9c')
+
+        with cp.Checkpoint(self.path) as checkpoint:
+            self.assertEqual(6, checkpoint.position['solver']['report'].iterations)
+            datastore, reports = ex.build_model().configure(defaultdict(lambda: 'asdf')).resume(checkpoint)
+        self.assertEqual(list(expected), list(reports))
+        self.assertEqual([r.residuals for r in expected.values()], [r.residuals for r in reports.values()])
+        self.assertEqual(flows(expected_ds), flows(datastore))
+
+    def test_nothing_saved(self):
+        with cp.Checkpoint(self.path) as checkpoint:
+            self.assertRaises(ValueError, ex.build_model().configure({}).resume, checkpoint)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import contextlib
+import io
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from collections import defaultdict
+from multiprocessing.connection import AuthenticationError, Client
+from unittest import mock
+
+import kconnect.distributed as dist
+import kconnect.model as mdl
+import kconnect.examples as ex
+import kconnect.benchmarks as bm
+
+
+class BrokenDispenser(object):
+
+    def get_seed(self, nm):
+        raise RuntimeError('No licence for %s' % nm)
+
+
+def broken_model():
+    model = bm.build_synthetic('chain', 2)
+    model.get_subsystem('N1')._seed_dispenser = BrokenDispenser()
+    return model
+
+
+def serve(model):
+    server = dist.WorkerServer(model, authkey=b'secret')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TestDistributed(unittest.TestCase):
+
+    def test_local_workers(self):
+        expected_ds = mdl.DataStore()
+        expected = ex.execute(ex.build_model().configure(defaultdict(lambda: 'asdf')), expected_ds)
+
+        with dist.Coordinator(dist.LocalTransport(ex.build_model, workers=2)) as coordinator:
+            runnable_model = dist.DistributedRunnableModel(ex.build_model(), defaultdict(lambda: 'asdf'),
+                                                           coordinator, remote=['IPC', 'HPC'])
+            datastore = mdl.DataStore()
+            self.assertEqual(expected.residuals, ex.execute(runnable_model, datastore).residuals)
+            self.assertEqual(expected_ds['IPC'][-1]['result'].get_obj(), datastore['IPC'][-1]['result'].get_obj())
+
+            # IPC and HPC go out together
+            runnable_model.run_many(['IPC', 'HPC'], datastore, executor='thread')
+            self.assertEqual(datastore['IPC'][-1]['result'].get_obj(), datastore['IPC'][-2]['result'].get_obj())
+            self.assertEqual([0, 0], coordinator.load())
+
+    def test_lost_worker(self):
+        transport = dist.LocalTransport(ex.build_model, workers=2)
+        with dist.Coordinator(transport) as coordinator:
+            transport.processes[0].terminate()
+            transport.processes[0].join()
+            perf = ex.CompressorPerfInputs(pr=5., flow=0.8)
+            futures = [coordinator.submit('IPC', 'asdf', [('set_perf_data', perf)]) for _ in range(4)]
+            for f in futures:
+                self.assertAlmostEqual(0.939905174100267, f.result(10)['result'].obj['eta'])
+            self.assertEqual([None, 0], coordinator.load())
+
+    def test_retries(self):
+        servers = [serve(broken_model()), serve(bm.build_synthetic('chain', 2))]
+        try:
+            addresses = [s.address for s in servers]
+            with dist.Coordinator(dist.TcpTransport(addresses, authkey=b'secret')) as coordinator:
+                futures = [coordinator.submit('N1', 'default', [('inp', 2.)]) for _ in range(4)]
+                self.assertEqual([2.] * 4, [f.result(10)['value'].obj for f in futures])
+
+            with dist.Coordinator(dist.TcpTransport(addresses[:1], authkey=b'secret')) as coordinator:
+                future = coordinator.submit('N1', 'default', [])
+                self.assertRaises(dist.RemoteError, future.result, 10)
+                self.assertIn('No licence', str(future.exception()))
+                # the other subsystems are fine
+                self.assertEqual(1., coordinator.submit('N0', 'default', []).result(10)['value'].obj)
+        finally:
+            for server in servers:
+                server.close()
+
+    def test_authkey_required(self):
+        model = bm.build_synthetic('chain', 2)
+        self.assertRaises(ValueError, dist.WorkerServer, model, ('0.0.0.0', 0))
+        self.assertRaises(ValueError, dist.WorkerServer, model, ('127.0.0.1', 0))
+        self.assertRaises(ValueError, dist.WorkerServer, model)
+        if hasattr(socket, 'AF_UNIX'):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                server = dist.WorkerServer(model, os.path.join(tmpdir, 'worker.sock'))
+                server._listener.close()
+
+        with mock.patch.dict(os.environ):
+            os.environ.pop('KCONNECT_AUTHKEY', None)
+            with contextlib.redirect_stderr(io.StringIO()) as stderr:
+                self.assertRaises(SystemExit, dist.main, ['127.0.0.1:0', 'kconnect.examples:build_model'])
+        self.assertIn('authkey', stderr.getvalue())
+
+    def test_handshake(self):
+        server = dist.WorkerServer(bm.build_synthetic('chain', 2), authkey=b'secret', handshake_timeout=0.2)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            # a client that never answers holds up nobody, and is hung up on
+            with socket.create_connection(server.address) as silent:
+                with dist.Coordinator(dist.TcpTransport([server.address], authkey=b'secret')) as coordinator:
+                    self.assertEqual(1., coordinator.submit('N0', 'default', []).result(10)['value'].obj)
+                silent.settimeout(10)
+                while silent.recv(1024):
+                    pass
+
+            self.assertRaises(AuthenticationError, Client, server.address, authkey=b'wrong')
+        finally:
+            server.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from collections import defaultdict
+
+import kconnect.export as exp
+import kconnect.model as mdl
+import kconnect.storage as stg
+import kconnect.examples as ex
+
+
+def read_ndjson(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_rows(self):
+        datastore = mdl.DataStore()
+        datastore['A'].add_new()['item'].put_obj({'x': 1., 'name': 'asdf'})
+        datastore['A'].add_new()['item'].write('{"x": 2.0, "y": {"z": [3, 4]}}')
+        datastore['A'][-1]['other'].write('not json')
+        self.assertEqual([{'iteration': 0, 'item:x': 1., 'item:name': 'asdf'},
+                          {'iteration': 1, 'item:x': 2., 'item:y.z.0': 3, 'item:y.z.1': 4}],
+                         list(exp.rows(datastore['A'])))
+        self.assertEqual([{'iteration': 0}, {'iteration': 1, 'item:y.z.1': 4}],
+                         list(exp.rows(datastore['A'], fields=['item:y.z.1'])))
+        self.assertEqual([[0, 1], [2]], list(exp.chunked(range(3), 2)))
+
+    def test_files(self):
+        datastore = mdl.DataStore(retention=stg.KeepLast(2))
+        runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+        runnable_model.converge(['EngineCycle', 'IPC', 'HPC'], datastore, tol=0., max_iter=10)
+        flows = [datastore['EngineCycle'][i]['result'].get_obj()['FLOW'] for i in (-2, -1)]
+
+        # only what the retention policy kept
+        exp.write_ndjson(datastore, self.tmpdir, chunk_size=1)
+        rows = read_ndjson(os.path.join(self.tmpdir, 'EngineCycle.ndjson'))
+        self.assertEqual([8, 9], [row['iteration'] for row in rows])
+        self.assertEqual(flows, [row['result:FLOW'] for row in rows])
+
+        exp.write_csv(datastore, self.tmpdir, names=['EngineCycle'], fields=['result:FLOW'])
+        with open(os.path.join(self.tmpdir, 'EngineCycle.csv')) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(['iteration', 'result:FLOW'], list(rows[0]))
+        self.assertEqual(flows, [float(row['result:FLOW']) for row in rows])
+
+        columns = os.path.join(self.tmpdir, 'columns')
+        exp.write_columnar(datastore, columns, names=['EngineCycle'])
+        stack = stg.ColumnarDataStore(columns)['EngineCycle']
+        self.assertEqual(10, len(stack))
+        self.assertEqual(flows, list(stack.column('result', 'FLOW')[-2:]))
+
+    def test_while_running(self):
+        datastore = mdl.DataStore()
+        runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+        position = {}
+        for _ in range(3):
+            runnable_model.run('EngineCycle', datastore)
+            position = exp.write_ndjson(datastore, self.tmpdir, names=['EngineCycle'], start=position,
+                                        complete_only=True)
+        self.assertEqual({'EngineCycle': 2}, position)
+        rows = read_ndjson(os.path.join(self.tmpdir, 'EngineCycle.ndjson'))
+        self.assertEqual([0, 1], [row['iteration'] for row in rows])
+
+    def test_backends(self):
+        for writer_class, ext in [(exp.NdjsonWriter, 'ndjson'), (exp.CsvWriter, 'csv')]:
+            directory = os.path.join(self.tmpdir, ext)
+            datastore = mdl.DataStore(backend=writer_class(directory, chunk_size=4))
+            runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+            runnable_model.converge(['EngineCycle', 'IPC', 'HPC'], datastore, tol=0., max_iter=10)
+            path = os.path.join(directory, 'IPC.%s' % ext)
+            # written in chunks as the run goes
+            self.assertTrue(os.path.getsize(path) > 0)
+            datastore.close()
+            with open(path) as f:
+                rows = list(csv.DictReader(f)) if ext == 'csv' else read_ndjson(path)
+            self.assertEqual(10, len(rows))
+            self.assertEqual(datastore['IPC'][-1]['result'].get_obj()['eta'], float(rows[-1]['result:eta']))
+
+
+if __name__ == '__main__':
+    unittest.main()
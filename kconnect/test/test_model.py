@@ -1,7 +1,11 @@
+import json
+import pickle
 import unittest
 from collections import defaultdict
 
+import kconnect.benchmarks as bm
 import kconnect.model as mdl
+import kconnect.profiling as prof
 import kconnect.examples as ex
 
 class TestExamples(unittest.TestCase):
@@ -174,6 +178,40 @@ class ModelTests(unittest.TestCase):
             history.append(d)
             print(d.flow)
 
+    def test_compile(self):
+        """
+        Compiling resolves subsystems and ports up front and indexes the nodes
+        """
+        model = ex.build_model()
+        plan = model.compile()
+        self.assertEqual(3, len(plan))
+        self.assertTrue(plan['IPC'] is plan[plan.index('IPC')])
+        self.assertTrue(plan['IPC'].subsys is model.get_subsystem('IPC'))
+
+        flow, = plan['IPC'].dataflows
+        self.assertEqual('EngineCycle', flow.src_name)
+        self.assertEqual(plan.index('EngineCycle'), flow.src_index)
+        self.assertTrue(flow.src_port is model.get_subsystem('EngineCycle').get_output_port('get_ipc_data'))
+        self.assertTrue(flow.dst_port is model.get_subsystem('IPC').get_input_port('set_perf_data'))
+
+        # cached until the graph changes
+        self.assertTrue(plan is model.compile())
+        model.add_subsystem('LPC', ex.CompIPC())
+        self.assertFalse(plan is model.compile())
+        self.assertRaises(AttributeError, model.compile().index, 'LPCZ')
+
+    def test_run_by_index(self):
+        model = mdl.Model()
+        model.add_subsystem('EngineCycle', ex.PerfModel())
+        model.add_subsystem('IPC', ex.CompIPC())
+        model.connect(src='EngineCycle.get_ipc_data', dst='IPC.set_perf_data')
+        runnable_model = model.configure(defaultdict(lambda: 'asdf'))
+        datastore = mdl.DataStore()
+        runnable_model.run(0, datastore)
+        runnable_model.run(runnable_model.plan.index('IPC'), datastore)
+        flow = datastore['EngineCycle'][-1]['result'].get_json()['FLOW']
+        self.assertEqual(flow, datastore['IPC'][-1]['result'].get_json()['flow'])
+
     def test_full_model(self):
         model = ex.build_model()
         runnable_model = model.configure(defaultdict(lambda: 'asdf'))
@@ -181,6 +219,310 @@ class ModelTests(unittest.TestCase):
         ex.execute(runnable_model, datastore)
 
 
+class TestIncremental(unittest.TestCase):
+
+    def test_skip_clean_nodes(self):
+        model = ex.build_model()
+        runnable_model = model.configure(defaultdict(lambda: 'asdf'), incremental=True)
+        datastore = mdl.DataStore()
+        for nm in ['EngineCycle', 'IPC', 'HPC']:
+            runnable_model.run(nm, datastore)
+
+        # nothing upstream of IPC has changed
+        runnable_model.run('IPC', datastore)
+        self.assertEqual({'executed': 3, 'skipped': 1}, runnable_model.stats)
+        self.assertTrue(datastore['IPC'][-1] is datastore['IPC'][-2])
+
+        # a new EngineCycle result makes IPC dirty again
+        runnable_model.run('EngineCycle', datastore)
+        runnable_model.run('IPC', datastore)
+        self.assertEqual({'executed': 5, 'skipped': 1}, runnable_model.stats)
+        self.assertFalse(datastore['IPC'][-1] is datastore['IPC'][-2])
+
+    def test_not_incremental(self):
+        runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+        datastore = mdl.DataStore()
+        runnable_model.run('EngineCycle', datastore)
+        runnable_model.run('EngineCycle', datastore)
+        self.assertEqual({'executed': 2, 'skipped': 0}, runnable_model.stats)
+
+    def test_overrides_and_selection(self):
+        model = ex.build_model()
+        config = defaultdict(lambda: 'asdf')
+        runnable_model = model.configure(config, incremental=True)
+        datastore = mdl.DataStore()
+        runnable_model.override('IPC.get_perf_bid', 0.9)
+        runnable_model.run('EngineCycle', datastore)
+        runnable_model.run('EngineCycle', datastore)
+        runnable_model.override('IPC.get_perf_bid', 0.91)
+        runnable_model.run('EngineCycle', datastore)
+        self.assertEqual({'executed': 2, 'skipped': 1}, runnable_model.stats)
+
+        # a model configured with another selection keeps its own fingerprints
+        other = model.configure(defaultdict(lambda: 'qwerty'), incremental=True)
+        other.run('EngineCycle', datastore)
+        self.assertEqual({'executed': 1, 'skipped': 0}, other.stats)
+
+    def test_content_fingerprint(self):
+        """
+        Comparing contents lets a converged loop stop re-running its nodes
+        """
+        model = ex.build_model()
+        runnable_model = model.configure(defaultdict(lambda: 'asdf'), incremental=True, fingerprint='content')
+        report = runnable_model.converge(['EngineCycle', 'IPC', 'HPC'], mdl.DataStore(), tol=0., max_iter=200)
+        self.assertTrue(report.converged)
+        self.assertGreater(runnable_model.stats['skipped'], 0)
+        self.assertEqual(report.runs, runnable_model.stats['executed'] + runnable_model.stats['skipped'])
+        self.assertRaises(ValueError, model.configure, {}, incremental=True, fingerprint='asdf')
+
+
+class TestPush(unittest.TestCase):
+
+    def port_reads(self, runnable_model):
+        reads = []
+
+        class Recorder(prof.Hook):
+            def start(self, kind, name):
+                if kind == 'output_port':
+                    reads.append(name)
+        runnable_model.add_hook(Recorder())
+        return reads
+
+    def test_same_result(self):
+        pull = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+        push = ex.build_model().configure(defaultdict(lambda: 'asdf'), push=True)
+        pull_ds, push_ds = mdl.DataStore(), mdl.DataStore()
+        self.assertEqual(ex.execute(pull, pull_ds).residuals, ex.execute(push, push_ds).residuals)
+        self.assertEqual(pull_ds['EngineCycle'][-1]['result'].get_obj(), push_ds['EngineCycle'][-1]['result'].get_obj())
+
+    def test_fan_out(self):
+        """
+        One read of the source port, whatever the number of consumers
+        """
+        model = bm.build_synthetic('fan', 5)
+        runnable_model = model.configure(defaultdict(lambda: 'default'), push=True)
+        reads = self.port_reads(runnable_model)
+        datastore = mdl.DataStore()
+        for nm in ['N0', 'N1', 'N2', 'N3', 'N4']:
+            runnable_model.run(nm, datastore)
+        self.assertEqual(1, reads.count('N0.out'))
+        self.assertEqual(1.75, model.get(datastore, 'N4', 'out'))
+
+        # pending cargo from an older container isn't used
+        datastore['N0'].add_new()['value'].put_obj(3.)
+        runnable_model.run('N1', datastore)
+        self.assertEqual(2.5, model.get(datastore, 'N1', 'out'))
+
+    def test_events(self):
+        model = bm.build_synthetic('fan', 5)
+        runnable_model = model.configure(defaultdict(lambda: 'default'), push=True)
+        datastore = mdl.DataStore()
+        self.assertEqual(['N0', 'N1', 'N2', 'N3', 'N4'], runnable_model.run_events(['N0'], datastore))
+        self.assertFalse(runnable_model.ready('N4', datastore))
+        self.assertEqual(['N2', 'N1'], runnable_model.run_events(['N2', 'N1'], datastore))
+        self.assertRaises(ValueError, model.configure({}).run_events, ['N0'], datastore)
+
+        ring = bm.build_synthetic('ring', 3).configure(defaultdict(lambda: 'default'), push=True)
+        self.assertEqual(['N0', 'N1', 'N2', 'N0', 'N1'], ring.run_events(['N0'], mdl.DataStore(), max_runs=5))
+
+    def test_via(self):
+        model = bm.build_synthetic('chain', 2)
+        model.add_subsystem('N2', bm.affine())
+        model.add_transform('Double', type('Double', (object,), {'apply': staticmethod(lambda x: 2 * x)})())
+        model.connect(src='N1.out', dst='N2.inp', via=['Double.apply', lambda x: x + 1])
+        self.assertRaises(AttributeError, model.connect, src='N1.out', dst='N2.inp', via='Triple.apply')
+        for push in (False, True):
+            runnable_model = model.configure(defaultdict(lambda: 'default'), push=push)
+            datastore = mdl.DataStore()
+            for nm in ['N0', 'N1', 'N2']:
+                runnable_model.run(nm, datastore)
+            # N1 = 1.5, through the transforms 4., N2 = 1 + 0.5 * 4
+            self.assertEqual(3., model.get(datastore, 'N2', 'out'))
+
+            runnable_model.override('N1.out', 0.)
+            runnable_model.run('N2', datastore)
+            self.assertEqual(1.5, model.get(datastore, 'N2', 'out'))
+
+    def test_corrections(self):
+        model = ex.build_model()
+        flow, = model.compile()['EngineCycle'].dataflows[1:]
+        self.assertEqual('HPC.get_perf_bid', flow.key)
+        self.assertEqual(0.9, flow.convey(0.9))
+
+
+class TestLazy(unittest.TestCase):
+
+    def test_minimal_subgraph(self):
+        model = bm.build_synthetic('fan', 5)
+        runnable_model = model.configure(defaultdict(lambda: 'default'), lazy=True)
+        datastore = mdl.DataStore()
+        self.assertEqual(1.5, model.get(datastore, 'N1', 'out', runnable=runnable_model))
+        self.assertEqual(['N0', 'N1'], list(datastore.keys()))
+
+        # N0 and N1 are still valid
+        self.assertEqual(['N2', 'N3', 'N4'], runnable_model.evaluate(['N4'], datastore))
+        self.assertEqual([], runnable_model.evaluate(['N4'], datastore))
+        self.assertEqual(5, runnable_model.stats['executed'])
+
+        # an override only invalidates what is downstream of it
+        runnable_model.override('N0.out', 3.)
+        self.assertEqual(2.5, runnable_model.get(datastore, 'N2', 'out'))
+        self.assertEqual(['N1', 'N3', 'N4'], runnable_model.evaluate(['N4'], datastore))
+
+        # as does running a node by other means
+        runnable_model.clear_override()
+        runnable_model.run('N0', datastore)
+        self.assertEqual(['N1', 'N2', 'N3', 'N4'], runnable_model.evaluate(['N4'], datastore))
+
+    def test_results_from_elsewhere(self):
+        model = bm.build_synthetic('chain', 3)
+        runnable_model = model.configure(defaultdict(lambda: 'default'), lazy=True)
+        datastore = mdl.DataStore()
+        runnable_model.run('N0', datastore)
+        self.assertEqual(['N1'], runnable_model.evaluate(['N1'], datastore))
+
+    def test_cycle(self):
+        runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+        expected_ds = mdl.DataStore()
+        runnable_model.converge(['EngineCycle', 'IPC', 'HPC'], expected_ds, tol=1e-10)
+
+        datastore = mdl.DataStore()
+        self.assertEqual(['EngineCycle', 'IPC', 'HPC'], runnable_model.evaluate(['IPC'], datastore, tol=1e-10))
+        self.assertEqual(expected_ds['IPC'][-1]['result'].get_obj(), datastore['IPC'][-1]['result'].get_obj())
+        self.assertEqual([], runnable_model.evaluate(['HPC'], datastore, tol=1e-10))
+
+    def test_runs_by_other_means(self):
+        """
+        IPC last read an older EngineCycle container, so the cycle isn't up to date
+        """
+        runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'), lazy=True)
+        expected_ds = mdl.DataStore()
+        runnable_model.converge(['EngineCycle', 'IPC', 'HPC'], expected_ds, tol=1e-10)
+
+        datastore = mdl.DataStore()
+        for nm in ['EngineCycle', 'IPC', 'HPC', 'EngineCycle']:
+            runnable_model.run(nm, datastore)
+        self.assertEqual(['EngineCycle', 'IPC', 'HPC'], runnable_model.evaluate(['IPC'], datastore, tol=1e-10))
+        self.assertEqual(expected_ds['IPC'][-1]['result'].get_obj(), datastore['IPC'][-1]['result'].get_obj())
+
+        # same for a chain, and for results the model didn't make
+        model = bm.build_synthetic('chain', 3)
+        runnable_model = model.configure(defaultdict(lambda: 'default'), lazy=True)
+        datastore = mdl.DataStore()
+        for nm in ['N0', 'N1', 'N2', 'N1']:
+            runnable_model.run(nm, datastore)
+        self.assertEqual(['N2'], runnable_model.evaluate(['N2'], datastore))
+
+        elsewhere = mdl.DataStore()
+        for nm in ['N0', 'N1']:
+            model.configure(defaultdict(lambda: 'default')).run(nm, elsewhere)
+            datastore[nm].append(elsewhere[nm][-1])
+        self.assertEqual([], runnable_model.evaluate(['N1'], datastore))
+        runnable_model.run('N0', datastore)
+        self.assertEqual(['N1'], runnable_model.evaluate(['N1'], datastore))
+
+    def test_not_lazy(self):
+        """
+        Without records of what runs read, only evaluate's own results are trusted
+        """
+        runnable_model = bm.build_synthetic('chain', 3).configure(defaultdict(lambda: 'default'))
+        datastore = mdl.DataStore()
+        for nm in ['N0', 'N1']:
+            runnable_model.run(nm, datastore)
+        self.assertEqual(['N0', 'N1', 'N2'], runnable_model.evaluate(['N2'], datastore))
+        self.assertEqual([], runnable_model.evaluate(['N2'], datastore))
+        runnable_model.run('N1', datastore)
+        self.assertEqual(['N1', 'N2'], runnable_model.evaluate(['N2'], datastore))
+
+
+class ScaleSeed(object):
+    """
+    Pure-Python seed implementing the batched protocol
+    """
+    batches = 0
+
+    def __init__(self):
+        self.x = 0.
+
+    def run(self, datastore):
+        datastore['result'].put_json({'y': 2. * self.x})
+
+    def run_batch(self, datastores):
+        ScaleSeed.batches += 1
+        for datastore, x in zip(datastores, self.x):
+            datastore['result'].put_json({'y': 2. * x})
+
+
+class ScaleDispenser(object):
+    def get_seed(self, nm):
+        return ScaleSeed()
+
+
+def Scale():
+    def set_x(obj, data):
+        obj.x = data.flow
+
+    def set_x_batch(obj, data):
+        obj.x = [d.flow for d in data]
+
+    return mdl.GenericSubsys(
+        seed_dispenser=ScaleDispenser(),
+        accessor=lambda dc: dc['result'].get_json(),
+        input_ports=[mdl.InputPort(name='set_x', description='', type=ex.CompressorPerfInputs, fn=set_x,
+                                   batch_fn=set_x_batch)],
+        output_ports=[mdl.OutputPort(name='get_y', description='', type=float, fn=lambda d: d['y'])]
+    )
+
+
+class TestBatch(unittest.TestCase):
+
+    def make_points(self, runnable_model, n):
+        datastores = []
+        for i in range(n):
+            datastore = mdl.DataStore()
+            runnable_model.override('IPC.get_perf_bid', 0.9 + 0.001 * i)
+            runnable_model.run('EngineCycle', datastore)
+            datastores.append(datastore)
+        runnable_model.clear_override()
+        return datastores
+
+    def test_batched_seed(self):
+        model = ex.build_model()
+        model.add_subsystem('Scale', Scale())
+        model.connect(src='EngineCycle.get_ipc_data', dst='Scale.set_x')
+        runnable_model = model.configure(defaultdict(lambda: 'asdf'))
+        datastores = self.make_points(runnable_model, 5)
+
+        batches = ScaleSeed.batches
+        runnable_model.run_batch('Scale', datastores)
+        self.assertEqual(batches + 1, ScaleSeed.batches)
+        for datastore in datastores:
+            flow = datastore['EngineCycle'][-1]['result'].get_json()['FLOW']
+            self.assertEqual(2. * flow, model.get(datastore, 'Scale', 'get_y'))
+
+    def test_fallback(self):
+        """
+        PerfSeed has no run_batch, so each point is run on its own
+        """
+        runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+        datastores = [mdl.DataStore() for _ in range(3)]
+        runnable_model.override('IPC.get_perf_bid', 0.9)
+        runnable_model.run_batch('EngineCycle', datastores)
+        self.assertEqual(3, runnable_model.stats['executed'])
+        results = set(ds['EngineCycle'][-1]['result'].read() for ds in datastores)
+        self.assertEqual(1, len(results))
+
+    @unittest.skipIf(ex.np is None, 'numpy is not installed')
+    def test_numpy_compressor(self):
+        model = ex.build_model()
+        runnable_model = model.configure(defaultdict(lambda: 'asdf'))
+        datastores = self.make_points(runnable_model, 10)
+        runnable_model.run_batch('IPC', datastores)
+        for datastore in datastores:
+            flow = datastore['EngineCycle'][-1]['result'].get_json()['FLOW']
+            self.assertAlmostEqual(ex.CompressorSeed.eta(flow), model.get(datastore, 'IPC', 'get_perf_bid'))
+
+
 class TestDataStore(unittest.TestCase):
     """
     Tests for the DataStore class, which aggregates the results of the model execution
@@ -237,6 +579,68 @@ class TestDataStore(unittest.TestCase):
         self.assertEquals(dc['item'].read(), 'asdf')
         self.assertEquals(dc['item2'].read(), 'qwerty')
 
+    def test_slots(self):
+        """
+        The classes we make millions of shouldn't carry an instance __dict__
+        """
+        dc = mdl.DataContainer()
+        in_port = ex.CompIPC().get_input_port('set_perf_data')
+        out_port = ex.PerfModel().get_output_port('get_ipc_data')
+        for obj in [dc, dc['item'], mdl.DataStack(), in_port, out_port]:
+            self.assertFalse(hasattr(obj, '__dict__'))
+
+    def test_container_views(self):
+        dc = mdl.DataContainer()
+        item = dc['item']
+        item.write('asdf')
+        self.assertEqual('asdf', dc['item'].read())
+        with dc['item'].open_to_write() as w:
+            w.write('qwerty')
+        self.assertEqual('qwerty', item.read())
+
+        copy = pickle.loads(pickle.dumps(dc))
+        self.assertEqual('qwerty', copy['item'].read())
+
+    def test_accessor_cache(self):
+        built = []
+
+        class CountingAccessor(ex.PerfAccessor):
+            def __init__(self, datastore):
+                built.append(datastore)
+                super(CountingAccessor, self).__init__(datastore)
+
+        perf = ex.PerfModel()
+        perf._accessor = CountingAccessor
+        dc = mdl.DataContainer()
+        perf.get_seed('asdf').run(dc)
+        flow = perf.get('get_ipc_data', dc).flow
+        self.assertEqual(flow, perf.get('get_hpc_data', dc).flow)
+        self.assertEqual(1, len(built))
+
+        # any write invalidates the accessor, decoding json text on read doesn't
+        dc['other'].write('{}')
+        perf.get('get_ipc_data', dc)
+        self.assertEqual(2, len(built))
+        dc['other'].get_obj()
+        perf.get('get_ipc_data', dc)
+        self.assertEqual(2, len(built))
+        dc['result'].put_obj({'HPC_PR': 5., 'IPC_PR': 10., 'FLOW': 2 * flow})
+        self.assertEqual(2 * flow, perf.get('get_hpc_data', dc).flow)
+        self.assertEqual(3, len(built))
+
+        # alternating containers keep their own accessors
+        other = mdl.DataContainer()
+        perf.get_seed('asdf').run(other)
+        for data_container in [other, dc, other, dc]:
+            perf.get('get_ipc_data', data_container)
+        self.assertEqual(4, len(built))
+
+        # which aren't pickled
+        copy = pickle.loads(pickle.dumps(dc))
+        self.assertIsNone(copy._accessed)
+        self.assertEqual(2 * flow, perf.get('get_hpc_data', copy).flow)
+        self.assertEqual(5, len(built))
+
     def test_dataitem_contextmgr(self):
         """
         make sure that the dataitem can be used using with syntax
@@ -270,6 +674,78 @@ class TestDataStore(unittest.TestCase):
         self.assertFalse(exp_data is ret_data)
         self.assertEquals(exp_data, ret_data)
 
+    def test_dataitem_obj(self):
+        """
+        Objects are stored as they are and only serialized when read as text
+        """
+        exp_data = {'foo': [1, 2]}
+        dc = mdl.DataContainer()
+        dc['item'].put_obj(exp_data)
+        self.assertTrue(dc['item'].get_obj() is exp_data)
+        self.assertFalse(dc['item'].get_json() is exp_data)
+        self.assertEqual(exp_data, dc['item'].get_json())
+        self.assertEqual('{"foo": [1, 2]}', dc['item'].read())
+        with dc['item'].open_to_read() as sio:
+            self.assertEqual(exp_data, json.load(sio))
+        self.assertEqual("{'item': '{\"foo\": [1, 2]}'}", repr(dc))
+
+        copy = pickle.loads(pickle.dumps(dc))
+        self.assertEqual(exp_data, copy['item'].get_obj())
+
+    def test_dataitem_obj_cached_json_copied(self):
+        dc = mdl.DataContainer()
+        dc['item'].put_json({'foo': 'bar'})
+        first = dc['item'].get_obj()
+        self.assertTrue(first is dc['item'].get_obj())
+        self.assertEqual('{"foo": "bar"}', dc['item'].read())
+
+        # get_json values are the caller's own
+        dc['item'].get_json()['foo'] = 'qux'
+        self.assertEqual({'foo': 'bar'}, dc['item'].get_json())
+        self.assertEqual('{"foo": "bar"}', dc['item'].read())
+
+        dc['item'].write('{"foo": "baz"}')
+        self.assertEqual({'foo': 'baz'}, dc['item'].get_json())
+        dc['item'].put_obj({'foo': 'qux'})
+        self.assertEqual({'foo': 'qux'}, dc['item'].get_json())
+
+    def test_dataitem_binary(self):
+        payload = bytearray(b'\x00\x01\x02\x03')
+        dc = mdl.DataContainer()
+        dc['mesh'].put_buffer(payload)
+        self.assertTrue(dc['mesh'].get_obj() is payload)
+        view = dc['mesh'].get_buffer()
+        payload[0] = 9
+        self.assertEqual(9, view[0])
+        with dc['mesh'].open_to_read_binary() as f:
+            f.seek(1)
+            self.assertEqual(b'\x01\x02\x03', f.read())
+
+        with dc['blob'].open_to_write_binary() as f:
+            f.write(b'abc')
+            f.write(b'def')
+        self.assertEqual(b'abcdef', dc['blob'].get_buffer().tobytes())
+        with dc['blob'].open_to_read_binary() as f:
+            self.assertEqual(b'abcdef', f.read())
+
+        dc['bytes'].put_buffer(b'{"a": 1}')
+        self.assertEqual({'a': 1}, dc['bytes'].get_json())
+
+        copy = pickle.loads(pickle.dumps(dc))
+        self.assertEqual(b'abcdef', copy['blob'].get_buffer().tobytes())
+        self.assertEqual(copy.digest(), dc.digest())
+
+    @unittest.skipIf(ex.np is None, 'numpy is not installed')
+    def test_dataitem_numpy(self):
+        field = ex.np.arange(12, dtype=ex.np.float64).reshape(3, 4)
+        dc = mdl.DataContainer()
+        dc['field'].put_buffer(field)
+        self.assertTrue(dc['field'].get_obj() is field)
+        self.assertTrue(ex.np.shares_memory(field, ex.np.asarray(dc['field'].get_buffer())))
+        with dc['field'].open_to_read_binary() as f:
+            returned = ex.np.frombuffer(f.read(), dtype=ex.np.float64).reshape(3, 4)
+        self.assertTrue((field == returned).all())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from collections import defaultdict
+
+import kconnect.benchmarks as bm
+import kconnect.model as mdl
+import kconnect.pool as pl
+
+
+class WarmSeed(bm.AffineSeed):
+    """
+    An AffineSeed with expensive set up that survives a reset
+    """
+    built = 0
+
+    def __init__(self, slope, offset):
+        super(WarmSeed, self).__init__(slope, offset)
+        WarmSeed.built += 1
+        self.table = list(range(100))
+
+    def reset(self):
+        self.inputs = []
+
+
+class WarmDispenser(bm.AffineDispenser):
+
+    def get_seed(self, nm):
+        return WarmSeed(self.slope, self.offset)
+
+
+def warm_chain(n):
+    model = bm.build_synthetic('chain', n)
+    for i in range(n):
+        model.get_subsystem(bm.node_name(i))._seed_dispenser = WarmDispenser(0.5, 1.)
+    return model
+
+
+class TestSeedPool(unittest.TestCase):
+
+    def setUp(self):
+        WarmSeed.built = 0
+
+    def test_reuse(self):
+        model = warm_chain(3)
+        seed_pool = pl.SeedPool(max_size=2)
+        runnable_model = model.configure(defaultdict(lambda: 'default'), seed_pool=seed_pool)
+        plain = model.configure(defaultdict(lambda: 'default'))
+        datastore, expected = mdl.DataStore(), mdl.DataStore()
+        for _ in range(4):
+            for nm in ['N0', 'N1', 'N2']:
+                runnable_model.run(nm, datastore)
+                plain.run(nm, expected)
+        self.assertEqual([dc['value'].get_obj() for dc in expected['N2']],
+                         [dc['value'].get_obj() for dc in datastore['N2']])
+        # one seed per node, plus the 12 of the unpooled model
+        self.assertEqual(3 + 12, WarmSeed.built)
+        self.assertEqual(9, seed_pool.hits)
+        self.assertEqual(0.75, seed_pool.hit_rate)
+        self.assertEqual({('N0', 'default'): 1, ('N1', 'default'): 1, ('N2', 'default'): 1},
+                         seed_pool.stats()['idle'])
+
+    def test_concurrent_runs(self):
+        model = warm_chain(1)
+        seed_pool = pl.SeedPool(max_size=2)
+        runnable_model = model.configure(defaultdict(lambda: 'default'), seed_pool=seed_pool)
+        node = runnable_model.plan['N0']
+        seeds = [runnable_model.prepare(node, mdl.DataStore()) for _ in range(3)]
+        runnable_model.germinate_many([node] * 3, seeds, None)
+        for seed in seeds:
+            seed.release()
+        # capped at two idle seeds
+        self.assertEqual(2, len(seed_pool))
+        self.assertEqual(1, seed_pool.dropped)
+        runnable_model.run_many(['N0'], mdl.DataStore(), executor='thread')
+        self.assertEqual(3, WarmSeed.built)
+
+    def test_no_reset(self):
+        seed_pool = pl.SeedPool()
+        runnable_model = bm.build_synthetic('chain', 2).configure(defaultdict(lambda: 'default'), seed_pool=seed_pool)
+        datastore = mdl.DataStore()
+        for _ in range(2):
+            runnable_model.run('N0', datastore)
+        self.assertEqual(0, len(seed_pool))
+        self.assertEqual(0, seed_pool.hits)
+        self.assertEqual(2, seed_pool.dropped)
+        self.assertRaises(ValueError, pl.SeedPool, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from collections import defaultdict
+
+import kconnect.model as mdl
+import kconnect.profiling as prof
+import kconnect.examples as ex
+
+
+class Recorder(prof.Hook):
+
+    def __init__(self):
+        self.spans = []
+
+    def start(self, kind, name):
+        return kind, name
+
+    def end(self, token, nbytes=0):
+        self.spans.append(token)
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+
+    def tearDown(self):
+        self.runnable_model.remove_hook(self.hook)
+        shutil.rmtree(self.tmpdir)
+
+    def test_spans(self):
+        self.hook = Recorder()
+        self.runnable_model.add_hook(self.hook)
+        datastore = mdl.DataStore()
+        self.runnable_model.run('EngineCycle', datastore)
+        self.runnable_model.run('IPC', datastore)
+        self.assertEqual([('seed', 'EngineCycle'), ('node', 'EngineCycle'),
+                          ('accessor', 'EngineCycle'), ('output_port', 'EngineCycle.get_ipc_data'),
+                          ('input_port', 'IPC.set_perf_data'),
+                          ('seed', 'IPC'), ('node', 'IPC')], self.hook.spans)
+
+        self.runnable_model.remove_hook(self.hook)
+        self.runnable_model.run('IPC', datastore)
+        self.assertEqual(7, len(self.hook.spans))
+
+    def test_other_models(self):
+        """
+        Hooks instrument the RunnableModel they were added to, not the Model
+        """
+        self.hook = Recorder()
+        model = ex.build_model()
+        runnable_model = model.configure(defaultdict(lambda: 'asdf'))
+        runnable_model.add_hook(self.hook)
+        other = model.configure(defaultdict(lambda: 'asdf'))
+        datastore = mdl.DataStore()
+        for nm in ['EngineCycle', 'IPC']:
+            other.run(nm, datastore)
+        self.assertEqual([], self.hook.spans)
+
+        runnable_model.run('IPC', datastore)
+        self.assertIn(('output_port', 'EngineCycle.get_ipc_data'), self.hook.spans)
+
+    def test_profiler(self):
+        self.hook = prof.Profiler()
+        self.runnable_model.add_hook(self.hook)
+        datastore = mdl.DataStore()
+        ex.execute(self.runnable_model, datastore)
+        runs = len(datastore['IPC'])
+
+        nodes = self.hook.stats('node', sort='calls')
+        self.assertEqual(['EngineCycle', 'HPC', 'IPC'], sorted(s.name for s in nodes))
+        self.assertTrue(all(s.calls == runs for s in nodes))
+        ports = {s.name: s for s in self.hook.stats('output_port')}
+        self.assertIn('IPC.get_perf_bid', ports)
+        walls = [s.wall for s in self.hook.stats()]
+        self.assertEqual(sorted(walls, reverse=True), walls)
+        self.assertIn('IPC.set_perf_data', self.hook.report())
+        # objects stored with put_obj and port cargo have a size too
+        self.assertTrue(all(s.nbytes > 0 for s in self.hook.stats()))
+
+        path = os.path.join(self.tmpdir, 'trace.json')
+        self.hook.write_chrome_trace(path)
+        with open(path) as f:
+            events = json.load(f)['traceEvents']
+        self.assertEqual(sum(s.calls for s in self.hook.stats()), len(events))
+        self.assertEqual({'X'}, set(e['ph'] for e in events))
+
+    def test_threads(self):
+        self.hook = prof.Profiler()
+        self.runnable_model.add_hook(self.hook)
+        datastore = mdl.DataStore()
+        self.runnable_model.run('EngineCycle', datastore)
+        self.runnable_model.run_many(['IPC', 'HPC'], datastore, executor='thread')
+        self.assertEqual(['HPC', 'IPC'], sorted(s.name for s in self.hook.stats('seed') if s.name != 'EngineCycle'))
+
+    def test_nbytes(self):
+        self.hook = None
+        dc = mdl.DataContainer()
+        dc['text'].write('asdf')
+        dc['bin'].put_buffer(bytearray(16))
+        dc['obj'].put_obj({'a': 1})
+        # estimated until serialized: one character and a number
+        self.assertEqual(29, dc.nbytes())
+        dc['obj'].read()
+        self.assertEqual(28, dc.nbytes())
+
+        self.assertEqual(8 * 3 + 1, prof.payload_size({'x': [1., 2., 3.]}))
+        # attribute names and values
+        self.assertEqual(2 + 8 + 4 + 8, prof.payload_size(ex.CompressorPerfInputs(pr=5., flow=0.8)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import kconnect.model as mdl
+import kconnect.schedule as sch
+import kconnect.examples as ex
+from kconnect.test.test_solvers import Linear
+
+
+class TestTarjan(unittest.TestCase):
+
+    def test_components(self):
+        successors = {0: [1], 1: [2], 2: [1, 3], 3: [], 4: [4]}
+        components = sch.strongly_connected_components([0, 1, 2, 3, 4], successors)
+        self.assertEqual([[3], [1, 2], [0], [4]], [sorted(c) for c in components])
+
+    def test_long_chain(self):
+        """
+        Deep graphs must not hit the recursion limit
+        """
+        n = 5000
+        successors = {i: [i + 1] for i in range(n)}
+        successors[n] = [0]
+        components = sch.strongly_connected_components(range(n + 1), successors)
+        self.assertEqual(1, len(components))
+
+
+class TestSchedule(unittest.TestCase):
+
+    def test_engine_model(self):
+        block, = ex.build_model().schedule()
+        self.assertTrue(block.cyclic)
+        self.assertEqual(('EngineCycle', 'IPC', 'HPC'), block.names)
+        self.assertEqual((('EngineCycle',), ('IPC', 'HPC')), block.stages)
+
+    def test_mixed_model(self):
+        """
+        Src -> (A <-> B) -> Sink, with the subsystems added out of order
+        """
+        model = mdl.Model()
+        model.add_subsystem('Sink', Linear())
+        model.add_subsystem('A', Linear(0.5, 1.))
+        model.add_subsystem('B', Linear())
+        model.add_subsystem('Src', Linear(offset=2.))
+        model.add_subsystem('Loner', Linear(offset=3.))
+        model.connect(src='Src.get_y', dst='A.set_x')
+        model.connect(src='A.get_y', dst='B.set_x')
+        model.connect(src='B.get_y', dst='A.set_x')
+        model.connect(src='B.get_y', dst='Sink.set_x')
+
+        schedule = model.schedule()
+        self.assertEqual([('Src',), ('Loner',), ('A', 'B'), ('Sink',)], [b.names for b in schedule])
+        self.assertEqual([False, False, True, False], [b.cyclic for b in schedule])
+        self.assertEqual([0, 0, 1, 2], [b.level for b in schedule])
+
+        datastore = mdl.DataStore()
+        reports = model.configure(defaultdict(lambda: 'asdf')).run_schedule(datastore, tol=1e-10)
+        self.assertTrue(reports[('A', 'B')].converged)
+        for nm in ['Src', 'Loner', 'Sink']:
+            self.assertEqual(1, len(list(datastore[nm])))
+        # both flows land on A.set_x and the one from B is applied last: y = 0.5 * y + 1
+        self.assertAlmostEqual(2., datastore['Sink'][-1]['result'].get_json()['y'])
+
+    def test_self_loop(self):
+        model = mdl.Model()
+        model.add_subsystem('A', Linear(0.5, 1.))
+        model.connect(src='A.get_y', dst='A.set_x')
+        block, = model.schedule()
+        self.assertTrue(block.cyclic)
+
+
+class TestParallelSchedule(unittest.TestCase):
+
+    def results(self, datastore, nm):
+        return [c['result'].read() for c in datastore[nm]]
+
+    def test_run_many_order(self):
+        """
+        Results land in the order the nodes were asked for, not the order they finish in
+        """
+        model = mdl.Model()
+        for nm in ['A', 'B', 'C']:
+            model.add_subsystem(nm, Linear(offset=float(ord(nm))))
+        runnable_model = model.configure(defaultdict(lambda: 'asdf'))
+        datastore = mdl.DataStore()
+        with ThreadPoolExecutor(3) as pool:
+            runnable_model.run_many(['C', 'A', 'B'], datastore, pool)
+        self.assertEqual(['C', 'A', 'B'], list(datastore._datastacks))
+        self.assertEqual(66., datastore['B'][-1]['result'].get_json()['y'])
+
+    def test_engine_model(self):
+        model = ex.build_model()
+        serial = mdl.DataStore()
+        report = model.configure(defaultdict(lambda: 'asdf')).run_schedule(serial, tol=1e-10)
+
+        for executor in ['thread', 'process']:
+            datastore = mdl.DataStore()
+            reports = model.configure(defaultdict(lambda: 'asdf')).run_schedule(
+                datastore, tol=1e-10, executor=executor)
+            self.assertEqual(report[('EngineCycle', 'IPC', 'HPC')].runs, reports[('EngineCycle', 'IPC', 'HPC')].runs)
+            for nm in ['EngineCycle', 'IPC', 'HPC']:
+                self.assertEqual(self.results(serial, nm), self.results(datastore, nm))
+
+    def test_fan_out(self):
+        model = mdl.Model()
+        model.add_subsystem('Src', Linear(offset=1.))
+        for i in range(4):
+            model.add_subsystem('Leaf%d' % i, Linear(float(i)))
+            model.connect(src='Src.get_y', dst='Leaf%d.set_x' % i)
+        self.assertEqual([0, 1, 1, 1, 1], [b.level for b in model.schedule()])
+
+        datastore = mdl.DataStore()
+        model.configure(defaultdict(lambda: 'asdf')).run_schedule(datastore, executor='thread')
+        self.assertEqual([0., 1., 2., 3.], [datastore['Leaf%d' % i][-1]['result'].get_json()['y'] for i in range(4)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+import math
+import unittest
+from collections import defaultdict
+
+import kconnect.model as mdl
+import kconnect.solvers as slv
+import kconnect.examples as ex
+
+
+class LinearSeed(object):
+    """
+    y = slope * x + offset, a deliberately slow contraction when slope ~ 1
+    """
+    def __init__(self, slope, offset):
+        self.slope = slope
+        self.offset = offset
+        self.x = 0.
+
+    def run(self, datastore):
+        datastore['result'].put_json({'y': self.slope * self.x + self.offset})
+
+
+class LinearDispenser(object):
+    def __init__(self, slope, offset):
+        self._slope = slope
+        self._offset = offset
+
+    def get_seed(self, nm):
+        return LinearSeed(self._slope, self._offset)
+
+
+class LinearAccessor(object):
+    def __init__(self, datastore):
+        self.y = datastore['result'].get_json()['y']
+
+
+def set_x(obj, data):
+    obj.x = data
+
+
+def Linear(slope=1., offset=0.):
+    return mdl.GenericSubsys(
+        seed_dispenser=LinearDispenser(slope, offset),
+        accessor=LinearAccessor,
+        input_ports=[mdl.InputPort(name='set_x', description='', type=float, fn=set_x)],
+        output_ports=[mdl.OutputPort(name='get_y', description='', type=float, fn=lambda d: d.y)]
+    )
+
+
+def build_loop(slope=0.95):
+    """
+    A -> B -> A, converging to A.y = 1 / (1 - slope)
+    """
+    model = mdl.Model()
+    model.add_subsystem('A', Linear(slope, 1.))
+    model.add_subsystem('B', Linear())
+    model.connect(src='A.get_y', dst='B.set_x')
+    model.connect(src='B.get_y', dst='A.set_x')
+    return model
+
+
+class AtanSeed(LinearSeed):
+
+    def run(self, datastore):
+        datastore['result'].put_json({'y': self.x - math.atan(self.x - 3.)})
+
+
+class AtanDispenser(object):
+    def get_seed(self, nm):
+        return AtanSeed(1., 0.)
+
+
+def build_overshoot():
+    """
+    A -> B -> A with B.y = A.y - atan(A.y - 3): from the first sweep a full
+    Newton step lands further from the solution, 3, than it started
+    """
+    model = mdl.Model()
+    model.add_subsystem('A', Linear())
+    model.add_subsystem('B', mdl.GenericSubsys(
+        seed_dispenser=AtanDispenser(),
+        accessor=LinearAccessor,
+        input_ports=[mdl.InputPort(name='set_x', description='', type=float, fn=set_x)],
+        output_ports=[mdl.OutputPort(name='get_y', description='', type=float, fn=lambda d: d.y)]
+    ))
+    model.connect(src='A.get_y', dst='B.set_x')
+    model.connect(src='B.get_y', dst='A.set_x')
+    return model
+
+
+class TestFixedPoint(unittest.TestCase):
+
+    def test_plain_iteration(self):
+        runnable_model = build_loop().configure(defaultdict(lambda: 'asdf'))
+        datastore = mdl.DataStore()
+        report = runnable_model.converge(['A', 'B'], datastore, tol=1e-8, max_iter=1000)
+        self.assertTrue(report.converged)
+        self.assertEqual(2 * report.iterations, report.runs)
+        self.assertEqual(report.iterations - 1, len(report.residuals))
+        self.assertAlmostEqual(20., datastore['A'][-1]['result'].get_json()['y'], places=6)
+
+    def test_residuals_from_datastack(self):
+        runnable_model = build_loop(0.5).configure(defaultdict(lambda: 'asdf'))
+        datastore = mdl.DataStore()
+        report = runnable_model.converge(['A', 'B'], datastore, monitors=['A.get_y'], max_iter=3)
+        self.assertFalse(report.converged)
+        a = [c['result'].get_json()['y'] for c in datastore['A']]
+        self.assertEqual([abs(a[1] - a[0]), abs(a[2] - a[1])], report.monitor_residuals['A.get_y'])
+
+    def test_default_monitors(self):
+        runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+        self.assertEqual(
+            ['IPC.get_perf_bid', 'HPC.get_perf_bid', 'EngineCycle.get_ipc_data', 'EngineCycle.get_hpc_data'],
+            runnable_model.cycle_ports(['EngineCycle', 'IPC', 'HPC']))
+        report = runnable_model.converge(['EngineCycle', 'IPC', 'HPC'], mdl.DataStore(), tol=1e-10)
+        self.assertTrue(report.converged)
+
+    def test_aitken(self):
+        runnable_model = build_loop().configure(defaultdict(lambda: 'asdf'))
+        plain = runnable_model.converge(['A', 'B'], mdl.DataStore(), tol=1e-8, max_iter=1000)
+
+        datastore = mdl.DataStore()
+        report = runnable_model.converge(['A', 'B'], datastore, monitors=['B.get_y'], tol=1e-8,
+                                         relaxation=slv.Aitken())
+        self.assertTrue(report.converged)
+        self.assertLess(report.runs, plain.runs / 10)
+        self.assertAlmostEqual(20., datastore['A'][-1]['result'].get_json()['y'], places=6)
+        self.assertEqual({}, runnable_model.get_overrides())
+
+    def test_anderson(self):
+        runnable_model = build_loop().configure(defaultdict(lambda: 'asdf'))
+        datastore = mdl.DataStore()
+        report = runnable_model.converge(['A', 'B'], datastore, monitors=['B.get_y'], tol=1e-8,
+                                         relaxation=slv.Anderson(depth=3))
+        self.assertTrue(report.converged)
+        self.assertLess(report.iterations, 10)
+        self.assertAlmostEqual(20., datastore['A'][-1]['result'].get_json()['y'], places=6)
+
+    def test_engine_example(self):
+        model = ex.build_model()
+        runnable_model = model.configure(defaultdict(lambda: 'asdf'))
+        report = ex.execute(runnable_model, mdl.DataStore())
+        self.assertTrue(report.converged)
+        self.assertEqual(3 * report.iterations, report.runs)
+
+
+class TestNewton(unittest.TestCase):
+
+    def test_linear_loop(self):
+        runnable_model = build_loop().configure(defaultdict(lambda: 'asdf'))
+        self.assertEqual(['B.get_y'], runnable_model.tear_ports(['A', 'B']))
+        datastore = mdl.DataStore()
+        report = runnable_model.newton(['A', 'B'], datastore, tol=1e-8)
+        # a linear loop is solved by the first step
+        self.assertTrue(report.converged)
+        self.assertEqual(1, report.iterations)
+        self.assertAlmostEqual(20., datastore['A'][-1]['result'].get_json()['y'], places=6)
+        # only the plain sweeps are recorded
+        self.assertEqual(3, len(datastore['A']))
+        self.assertEqual({}, runnable_model.get_overrides())
+
+    def test_overshoot(self):
+        runnable_model = build_overshoot().configure(defaultdict(lambda: 'asdf'))
+        datastore = mdl.DataStore()
+        report = runnable_model.newton(['A', 'B'], datastore, tol=1e-10)
+        self.assertTrue(report.converged)
+        # the full first step overshoots and is rejected
+        self.assertGreater(report.residuals[1], report.residuals[0])
+        self.assertAlmostEqual(3., datastore['B'][-1]['result'].get_json()['y'], places=8)
+
+        # a solve that runs out on a rejected step ends at its best iterate
+        datastore = mdl.DataStore()
+        report = runnable_model.newton(['A', 'B'], datastore, tol=1e-10, max_iter=1)
+        self.assertFalse(report.converged)
+        self.assertEqual(report.residuals[0], abs(datastore['B'][-1]['result'].get_json()['y'] -
+                                                  datastore['A'][-1]['result'].get_json()['y']))
+
+    def test_engine_example(self):
+        order = ['EngineCycle', 'IPC', 'HPC']
+        expected_ds = mdl.DataStore()
+        fixed_point = ex.build_model().configure(defaultdict(lambda: 'asdf')).converge(order, expected_ds, tol=1e-10)
+        expected = expected_ds['EngineCycle'][-1]['result'].get_obj()['FLOW']
+
+        runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+        self.assertEqual(['IPC.get_perf_bid', 'HPC.get_perf_bid'], runnable_model.tear_ports(order))
+        for broyden, executor in [(True, None), (False, 'thread')]:
+            datastore = mdl.DataStore()
+            report = runnable_model.newton(order, datastore, tol=1e-10, broyden=broyden, executor=executor)
+            self.assertTrue(report.converged)
+            self.assertLess(report.runs, fixed_point.runs)
+            self.assertAlmostEqual(expected, datastore['EngineCycle'][-1]['result'].get_obj()['FLOW'], places=8)
+
+    def test_unknowns_must_be_numeric(self):
+        runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+        self.assertRaises(TypeError, runnable_model.newton, ['EngineCycle', 'IPC', 'HPC'], mdl.DataStore(),
+                          unknowns=['EngineCycle.get_ipc_data'])
+
+
+class TestHelpers(unittest.TestCase):
+
+    def test_flatten(self):
+        self.assertEqual([1., 2., 3.], slv.flatten({'b': [2, 3], 'a': 1}))
+        self.assertEqual([0.8, 5.], slv.flatten(ex.CompressorPerfInputs(pr=5., flow=0.8)))
+        self.assertRaises(TypeError, slv.flatten, 'asdf')
+
+    def test_solve_linear(self):
+        x = slv.solve_linear([[0., 2.], [4., 1.]], [2., 9.])
+        self.assertAlmostEqual(2., x[0])
+        self.assertAlmostEqual(1., x[1])
+        self.assertRaises(ValueError, slv.solve_linear, [[1., 2.], [2., 4.]], [1., 1.])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import math
+import os
+import shutil
+import tempfile
+import unittest
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import kconnect.model as mdl
+import kconnect.storage as stg
+import kconnect.examples as ex
+
+
+def fill(stack, n):
+    for i in range(n):
+        stack.add_new()['item'].put_obj(i)
+
+
+def values(stack):
+    return [dc['item'].get_obj() for dc in stack]
+
+
+class TestRetention(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_keep_last(self):
+        stack = mdl.DataStack(stg.KeepLast(3))
+        fill(stack, 10)
+        self.assertEqual(10, len(stack))
+        self.assertEqual(3, len(stack._stack))
+        self.assertEqual([7, 8, 9], values(stack))
+        self.assertEqual(9, stack[-1]['item'].get_obj())
+        self.assertEqual(7, stack[-3]['item'].get_obj())
+        self.assertRaises(stg.EvictedEntry, stack.__getitem__, 2)
+        self.assertRaises(IndexError, stack.__getitem__, 10)
+
+    def test_keep_every(self):
+        stack = mdl.DataStack(stg.KeepEvery(4, last=2))
+        fill(stack, 11)
+        self.assertEqual([0, 4, 8, 9, 10], values(stack))
+        self.assertEqual(4, stack[4]['item'].get_obj())
+
+    def test_keep_first_last(self):
+        stack = mdl.DataStack(stg.KeepFirstLast(first=2))
+        fill(stack, 6)
+        self.assertEqual([0, 1, 5], values(stack))
+        self.assertRaises(ValueError, stg.KeepLast, 0)
+
+    def test_spill(self):
+        with stg.SpillStore(os.path.join(self.tmpdir, 'spill.bin')) as spill:
+            stack = mdl.DataStack(stg.KeepLast(2), spill)
+            other = mdl.DataStack(stg.KeepLast(1), spill)
+            fill(stack, 20)
+            fill(other, 5)
+            self.assertEqual(2, len(stack._stack))
+            self.assertEqual(18 + 4, len(spill))
+            self.assertEqual(list(range(20)), values(stack))
+            self.assertEqual([3, 4], [dc['item'].get_obj() for dc in other[-2:]])
+            self.assertEqual(5, stack[5]['item'].get_obj())
+
+    def test_per_stack_policy(self):
+        """
+        Bounded memory on a long converging loop, full history where we ask for it
+        """
+        datastore = mdl.DataStore(retention={'EngineCycle': stg.KeepLast(2), 'IPC': stg.KeepFirstLast()})
+        runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+        report = runnable_model.converge(['EngineCycle', 'IPC', 'HPC'], datastore, tol=0., max_iter=20)
+        self.assertEqual(20, len(datastore['EngineCycle']))
+        self.assertEqual(2, len(datastore['EngineCycle']._stack))
+        self.assertEqual(2, len(datastore['IPC']._stack))
+        self.assertEqual(20, len(datastore['HPC']._stack))
+        self.assertEqual(19, len(report.residuals))
+
+
+class TestColumnar(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_engine_history(self):
+        """
+        Write the history of a converging run to columns and read it back bit by bit
+        """
+        writer = stg.ColumnarWriter(self.tmpdir)
+        datastore = mdl.DataStore(retention=stg.KeepLast(1), backend=writer)
+        runnable_model = ex.build_model().configure(defaultdict(lambda: 'asdf'))
+        runnable_model.converge(['EngineCycle', 'IPC', 'HPC'], datastore, tol=0., max_iter=20)
+        last = datastore['EngineCycle'][-1]['result'].get_obj()
+        datastore.close()
+
+        columnar = stg.ColumnarDataStore(self.tmpdir)
+        self.assertTrue('IPC' in columnar)
+        self.assertFalse('LPC' in columnar)
+        stack = columnar['EngineCycle']
+        self.assertEqual(20, len(stack))
+        self.assertEqual(last, stack[-1]['result'].get_obj())
+        self.assertEqual([('result', 'FLOW'), ('result', 'HPC_PR'), ('result', 'IPC_PR')], stack.columns())
+
+        flows = stack.column('result', 'FLOW')
+        self.assertEqual(20, len(flows))
+        self.assertEqual(last['FLOW'], flows[-1])
+        self.assertEqual([stack[i]['result'].get_obj()['FLOW'] for i in range(5, 10)], list(flows[5:10]))
+        self.assertRaises(KeyError, stack[0].__getitem__, 'asdf')
+        columnar.close()
+
+    def test_ragged_fields(self):
+        writer = stg.ColumnarWriter(self.tmpdir)
+        datastore = mdl.DataStore(backend=writer)
+        datastore['A'].add_new()['item'].put_obj({'x': 1., 'name': 'asdf'})
+        datastore['A'].add_new()['item'].write('{"x": 2.0, "y": {"z": [3, 4]}}')
+        datastore['A'].add_new()['other'].write('not json')
+        datastore.close()
+
+        stack = stg.ColumnarDataStore(self.tmpdir)['A']
+        self.assertEqual({'x': 1.}, stack[0]['item'].get_obj())
+        self.assertEqual({'x': 2., 'y': {'z': [3., 4.]}}, stack[1]['item'].get_obj())
+        self.assertEqual({}, stack[2]['item'].get_obj())
+        self.assertTrue(math.isnan(stack.column('item', 'y.z.0')[0]))
+
+    def test_round_trip(self):
+        written = [{'n': 3, 'stations': [1, 2], 'name': 'asdf'}, {'n': 4, 'stations': [5]},
+                   {'n': 5, 'stations': ['x', 6]}]
+        datastore = mdl.DataStore(backend=stg.ColumnarWriter(self.tmpdir, buffer_rows=1))
+        for obj in written:
+            datastore['EngineCycle'].add_new()['result'].put_obj(obj)
+        datastore.close()
+
+        stack = stg.ColumnarDataStore(self.tmpdir)['EngineCycle']
+        # ints as floats, strings dropped, gaps in lists as None
+        self.assertEqual({'n': 3., 'stations': [1., 2.]}, stack[0]['result'].get_obj())
+        self.assertEqual({'n': 4., 'stations': [5.]}, stack[1]['result'].get_obj())
+        self.assertEqual({'n': 5., 'stations': [None, 6.]}, stack[2]['result'].get_obj())
+
+    def test_shapes(self):
+        """
+        Scalars, dicts with digit keys and keys with dots come back as they were
+        """
+        written = [3.5, {'stages': {'1': .9, '2': .8}, 'a.b': 1., 'a': {'b': 2.}, '': 3.}, [1., [2.]]]
+        datastore = mdl.DataStore(backend=stg.ColumnarWriter(self.tmpdir))
+        for obj in written + ['no numbers']:
+            datastore['A'].add_new()['item'].put_obj(obj)
+        datastore.close()
+
+        stack = stg.ColumnarDataStore(self.tmpdir)['A']
+        self.assertEqual(written, [stack[i]['item'].get_obj() for i in range(3)])
+        self.assertIsNone(stack[3]['item'].get_obj())
+        self.assertEqual(['', '%', '0', '1.0', 'a%2Eb', 'a.b', 'stages.%31', 'stages.%32'],
+                         [path for _, path in stack.columns()])
+        self.assertEqual(('a.b',), stack.parts('item', 'a%2Eb'))
+        self.assertEqual(('stages', '1'), stack.parts('item', 'stages.%31'))
+        self.assertEqual(2., stack.column('item', 'a.b')[1])
+
+    @unittest.skipIf(resource is None, 'needs resource limits')
+    def test_many_fields(self):
+        """
+        More fields than the process can have files open
+        """
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(128, hard), hard))
+        try:
+            datastore = mdl.DataStore(backend=stg.ColumnarWriter(self.tmpdir, buffer_rows=2))
+            for i in range(5):
+                datastore['A'].add_new()['item'].put_obj({'f%d' % k: float(i + k) for k in range(300)})
+            datastore.close()
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+        stack = stg.ColumnarDataStore(self.tmpdir)['A']
+        self.assertEqual(300, len(stack.columns()))
+        self.assertEqual([4. + k for k in range(300)], [stack[-1]['item'].get_obj()['f%d' % k] for k in range(300)])
+
+
+if __name__ == '__main__':
+    unittest.main()
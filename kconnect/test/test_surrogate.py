@@ -0,0 +1,108 @@
+import unittest
+from collections import defaultdict
+
+import kconnect.benchmarks as bm
+import kconnect.model as mdl
+import kconnect.surrogate as sg
+import kconnect.examples as ex
+
+
+class TestFits(unittest.TestCase):
+
+    def check_fits(self):
+        xs = [[0., 0.], [1., 0.], [0., 1.], [1., 1.], [2., 1.], [1., 2.]]
+        ys = [[1. + 2. * a - b, a * b] for a, b in xs]
+
+        linear = sg.LinearFit()
+        linear.fit(xs, [y[:1] for y in ys])
+        self.assertAlmostEqual(1. + 6. - 2., linear.predict([3., 2.])[0])
+
+        quadratic = sg.PolynomialFit(degree=2)
+        quadratic.fit(xs, ys)
+        for value, expected in zip(quadratic.predict([3., 2.]), [5., 6.]):
+            self.assertAlmostEqual(expected, value, places=6)
+
+        rbf = sg.RbfFit()
+        rbf.fit(xs, ys)
+        for x, y in zip(xs, ys):
+            for value, expected in zip(rbf.predict(x), y):
+                self.assertAlmostEqual(expected, value, places=6)
+
+    def test_fits(self):
+        self.check_fits()
+
+    def test_without_numpy(self):
+        np, sg.np = sg.np, None
+        try:
+            self.check_fits()
+        finally:
+            sg.np = np
+
+
+class TestSurrogate(unittest.TestCase):
+
+    def test_stands_in(self):
+        model = bm.build_synthetic('chain', 2)
+        surrogate = sg.Surrogate()
+        model.get_subsystem('N1').set_surrogate(surrogate)
+        runnable_model = model.configure(defaultdict(lambda: 'default'))
+        datastore = mdl.DataStore()
+        for i in range(10):
+            runnable_model.override('N0.out', 1. + 0.01 * i)
+            if i % 2:
+                runnable_model.run('N1', datastore)
+            else:
+                runnable_model.run_many(['N1'], datastore)
+            self.assertAlmostEqual(1.5 + 0.005 * i, model.get(datastore, 'N1', 'out'))
+        # three runs to fit the line and one to check it, then it is trusted
+        # for check_every runs before being checked again
+        self.assertEqual(5, surrogate.evaluated)
+        self.assertEqual(5, surrogate.predicted)
+        self.assertTrue(sg.Surrogate.answer(datastore['N1'][-2]))
+        self.assertIsNone(sg.Surrogate.answer(datastore['N1'][-1]))
+
+        # far from anything it has seen
+        runnable_model.override('N0.out', 10.)
+        runnable_model.run('N1', datastore)
+        self.assertEqual(6, surrogate.evaluated)
+
+    def test_engine_example(self):
+        order = ['EngineCycle', 'IPC', 'HPC']
+        expected_ds = mdl.DataStore()
+        ex.build_model().configure(defaultdict(lambda: 'asdf')).converge(order, expected_ds, tol=1e-10)
+        expected = expected_ds['EngineCycle'][-1]['result'].get_obj()['FLOW']
+
+        model = ex.build_model()
+        surrogates = {nm: sg.Surrogate(fit='rbf') for nm in order}
+        for nm, surrogate in surrogates.items():
+            model.get_subsystem(nm).set_surrogate(surrogate)
+        datastore = mdl.DataStore()
+        report = model.configure(defaultdict(lambda: 'asdf')).converge(order, datastore, tol=1e-10)
+        self.assertTrue(report.converged)
+        self.assertAlmostEqual(expected, datastore['EngineCycle'][-1]['result'].get_obj()['FLOW'], places=8)
+        self.assertGreater(surrogates['IPC'].predicted, 0)
+        self.assertLess(surrogates['IPC'].evaluated, len(expected_ds['IPC']))
+        # the cycle's outputs are objects: it always runs for real
+        self.assertFalse(surrogates['EngineCycle'].usable)
+        self.assertEqual(0, surrogates['EngineCycle'].predicted)
+
+    def test_converges_on_real_runs(self):
+        model = bm.build_synthetic('ring', 3)
+        order = [bm.node_name(i) for i in range(3)]
+        surrogates = [sg.Surrogate() for _ in order]
+        for nm, surrogate in zip(order, surrogates):
+            model.get_subsystem(nm).set_surrogate(surrogate)
+        runnable_model = model.configure(defaultdict(lambda: 'default'))
+        datastore = mdl.DataStore()
+        report = runnable_model.converge(order, datastore, tol=1e-10)
+        self.assertTrue(report.converged)
+        self.assertTrue(all(surrogate.predicted for surrogate in surrogates))
+        for nm in order:
+            self.assertIsNone(sg.Surrogate.answer(datastore[nm][-1]))
+            self.assertEqual(['value'], list(datastore[nm][-1].keys()))
+        # turned back on for the next solve
+        self.assertTrue(runnable_model.surrogates)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import kconnect.sweep as sw
+import kconnect.examples as ex
+
+
+def ipc_eta(runnable_model, datastore, reports):
+    return runnable_model.plan['IPC'].subsys.get('get_perf_bid', datastore['IPC'][-1])
+
+
+def bid_cases(n):
+    return [sw.Case(overrides={'HPC.get_perf_bid': 0.9 + 0.005 * i}) for i in range(n)]
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_sweep(self, model, executor, **kwargs):
+        results = sw.sweep(model, bid_cases(6), evaluate=ipc_eta, default_selection='asdf',
+                           executor=executor, max_workers=2, tol=1e-10, **kwargs)
+        return {r.case_id: r.value for r in results}
+
+    def test_executors(self):
+        serial = self.run_sweep(ex.build_model(), None)
+        self.assertEqual(list(range(6)), sorted(serial))
+        # a better HPC means less flow and so a lower IPC efficiency
+        self.assertTrue(all(serial[i] > serial[i + 1] for i in range(5)))
+
+        self.assertEqual(serial, self.run_sweep(ex.build_model(), 'thread'))
+        self.assertEqual(serial, self.run_sweep(ex.build_model, 'process', chunksize=4))
+        self.assertEqual(serial, self.run_sweep(ex.build_model(), 'process'))
+
+    def test_failed_case(self):
+        cases = [sw.Case(model_config={'EngineCycle': 'asdf'})]
+        result, = sw.sweep(ex.build_model, cases, executor=None)
+        self.assertFalse(result.ok)
+        self.assertIn('KeyError', result.error)
+
+    def test_resume(self):
+        path = os.path.join(self.tmpdir, 'progress.log')
+        results = sw.sweep(ex.build_model, bid_cases(6), evaluate=ipc_eta, default_selection='asdf',
+                           executor=None, progress_log=path)
+        first = [next(results) for _ in range(4)]
+        results.close()
+
+        # simulate getting killed half way through writing a record
+        with open(path, 'ab') as f:
+            f.write(b'\x80\x04\x95')
+
+        resumed = list(sw.sweep(ex.build_model, bid_cases(6), evaluate=ipc_eta, default_selection='asdf',
+                                executor='process', max_workers=2, progress_log=path))
+        self.assertEqual([True] * 4 + [False] * 2, [r.resumed for r in resumed])
+        self.assertEqual([r.value for r in first], [r.value for r in resumed[:4]])
+        self.assertEqual(list(range(6)), sorted(r.case_id for r in resumed))
+        self.assertEqual(6, len(sw.ProgressLog(path).read()))
+
+
+if __name__ == '__main__':
+    unittest.main()